@@ -0,0 +1,210 @@
+# python benchmark.py [rounds] [--baseline DIR]
+# DIR is another checkout of the serializers package, e.g. the recursive
+# one from before the explicit stacks:
+#     git worktree add /tmp/recursive c419fce~1
+#     python benchmark.py --baseline /tmp/recursive/lab2/serializers
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from serializers.packer import Packer, SerializerPool
+from serializers.JsonSerializer import JsonSerializer
+from serializers.YamlSerializer import YamlSerializer
+
+
+FORMATS = ("json", "toml", "yaml", "pickle")
+DEEP_DEPTHS = (1000, 10000, 100000)
+PARALLEL_KEYS = 100000  # top-level keys of the parallel loads document
+BASELINE_TIMEOUT = 120  # seconds for one round trip of the baseline
+
+
+def nested_lists(depth):
+    obj = []
+    for i in range(depth):
+        obj = [i, obj]
+    return obj
+
+
+def nested_dicts(depth):
+    obj = {}
+    for i in range(depth):
+        obj = {"value": i, "next": obj}
+    return obj
+
+
+def wide_dict(size):
+    return {f"key {i}": [i, i * 0.5, str(i), None] for i in range(size)}
+
+
+DATASETS = {
+    "nested lists (depth 300)": nested_lists(300),
+    "nested dicts (depth 30)": nested_dicts(30),
+    "wide dict (2000 keys)": wide_dict(2000),
+}
+
+
+def bench(serializer, obj, number):
+    dumped = serializer.dumps(obj)
+    dump_time = timeit.timeit(lambda: serializer.dumps(obj),
+                              number=number) / number
+    load_time = timeit.timeit(lambda: serializer.loads(dumped),
+                              number=number) / number
+    return dump_time, load_time
+
+
+def bench_once(serializer, obj):
+    start = time.perf_counter()
+    dumped = serializer.dumps(obj)
+    dumped_at = time.perf_counter()
+    serializer.loads(dumped)
+    return dumped_at - start, time.perf_counter() - dumped_at
+
+
+def deep_serializer(ser_type):
+    if ser_type == "json":
+        # indentation would grow with the square of the depth
+        return JsonSerializer(indent=None)
+    return Packer().create_serializer(ser_type)
+
+
+def baseline_worker(path, ser_type, kind, depth):
+    # runs in its own process: the baseline may recurse on every level,
+    # so it gets a big stack and a recursion limit to match
+    spec = importlib.util.spec_from_file_location(
+        "baseline", f"{path}/__init__.py",
+        submodule_search_locations=[path])
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["baseline"] = package
+    spec.loader.exec_module(package)
+    from baseline.packer import Packer as BaselinePacker
+
+    obj = nested_lists(depth) if kind == "lists" else nested_dicts(depth)
+    serializer = BaselinePacker().create_serializer(ser_type)
+    result = []
+    sys.setrecursionlimit(depth * 50 + 1000)
+    threading.stack_size(1 << 30)
+    thread = threading.Thread(
+        target=lambda: result.append(bench_once(serializer, obj)))
+    thread.start()
+    thread.join()
+    print(json.dumps(result[0] if result else None))
+
+
+def bench_baseline(path, ser_type, kind, depth):
+    try:
+        output = subprocess.run(
+            [sys.executable, __file__, "--baseline-worker", path, ser_type,
+             kind, str(depth)], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, timeout=BASELINE_TIMEOUT, text=True)
+    except subprocess.TimeoutExpired:
+        return f"> {BASELINE_TIMEOUT} s"
+    try:
+        times = json.loads(output.stdout)
+    except ValueError:
+        times = None
+    if times is None:
+        return "failed"
+    return f"{times[0] * 1000:.0f} / {times[1] * 1000:.0f}"
+
+
+def bench_deep(baseline):
+    print(f"\n{'deep nesting':<28}{'format':<8}{'dumps / loads, ms':>22}"
+          + (f"{'baseline':>24}" if baseline else ""))
+    for depth in DEEP_DEPTHS:
+        for kind, make in (("lists", nested_lists), ("dicts", nested_dicts)):
+            obj = make(depth)
+            name = f"nested {kind} (depth {depth})"
+            for ser_type in FORMATS:
+                try:
+                    times = bench_once(deep_serializer(ser_type), obj)
+                    current = f"{times[0] * 1000:.0f} / {times[1] * 1000:.0f}"
+                except ValueError:  # deeper than the format allows
+                    current = "refused"
+                line = f"{name:<28}{ser_type:<8}{current:>22}"
+                if baseline:
+                    old = bench_baseline(baseline, ser_type, kind, depth)
+                    line += f"{old:>24}"
+                print(line, flush=True)
+
+
+def bench_parallel_loads(number):
+    # JsonSerializer.loads(workers=N) of a wide document; the speedup is
+    # bounded by the cores there are and by what stays in the parent
+    # (finding the top-level children, merging, _deserialize)
+    serializer = JsonSerializer()
+    dumped = serializer.dumps(wide_dict(PARALLEL_KEYS))
+    size = len(dumped) / 2 ** 20
+    print(f"\n{'parallel json loads':<28}{'workers':<8}{'MB/s':>12}"
+          + f"{'speedup':>12}    ({size:.1f} MB, {os.cpu_count()} cpus)")
+    sequential = None
+    for workers in (None, 2, 4, 8):
+        load_time = timeit.timeit(
+            lambda: serializer.loads(dumped, workers=workers),
+            number=number) / number
+        sequential = sequential or load_time
+        print(f"{'wide dict':<28}{workers or 1:<8}{size / load_time:>12.2f}"
+              + f"{sequential / load_time:>12.2f}")
+
+
+def bench_pool(pool, obj, executor, tasks):
+    # round trips per second through SerializerPool from many workers
+    start = time.perf_counter()
+    dumped = list(executor.map(pool.dumps, [obj] * tasks))
+    list(executor.map(pool.loads, dumped))
+    return tasks / (time.perf_counter() - start)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "--baseline-worker":
+        path, ser_type, kind, depth = sys.argv[2:]
+        return baseline_worker(path, ser_type, kind, int(depth))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("number", nargs="?", type=int, default=5,
+                        help="rounds per measurement")
+    parser.add_argument("--baseline", metavar="DIR",
+                        help="serializers package to compare deep "
+                        + "nesting with")
+    args = parser.parse_args()
+    number = args.number
+    factory = Packer()
+    serializers = [(ser_type, factory.create_serializer(ser_type))
+                   for ser_type in FORMATS]
+    # pure python PyYAML, to compare with the libyaml one
+    serializers.append(("yaml/py", YamlSerializer(use_libyaml=False)))
+    print(f"{'dataset':<28}{'format':<8}{'dumps, ms':>12}{'loads, ms':>12}")
+    for name, obj in DATASETS.items():
+        for ser_type, serializer in serializers:
+            try:
+                dump_time, load_time = bench(serializer, obj, number)
+            except RecursionError:
+                print(f"{name:<28}{ser_type:<8}{'too deep':>24}")
+                continue
+            print(f"{name:<28}{ser_type:<8}"
+                  + f"{dump_time * 1000:>12.2f}{load_time * 1000:>12.2f}")
+
+    bench_deep(args.baseline)
+    bench_parallel_loads(number)
+
+    obj = wide_dict(200)
+    print(f"\n{'workers':<28}{'format':<8}{'threads/s':>12}"
+          + f"{'processes/s':>12}")
+    for ser_type in FORMATS:
+        pool = SerializerPool(ser_type)
+        for workers in (1, 2, 4, 8):
+            with ThreadPoolExecutor(workers) as executor:
+                threaded = bench_pool(pool, obj, executor, number * 16)
+            with ProcessPoolExecutor(workers) as executor:
+                processes = bench_pool(pool, obj, executor, number * 16)
+            print(f"{workers:<28}{ser_type:<8}"
+                  + f"{threaded:>12.1f}{processes:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
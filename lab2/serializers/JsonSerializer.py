@@ -1,17 +1,80 @@
+import asyncio
 import inspect
 import types
 import builtins
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from .compression import open_file, split_compression
+from .container import RecordFile
+from .aio import read_file, write_file
+from .codeobj import code_from_dict, code_to_dict, fields_to_code, \
+    is_code_dict
+from .globalref import global_ref, resolve_global
+from .numeric import is_packed_numeric, pack_numeric, unpack_numeric
+
+
+# matches either a whole json string or a single structural symbol,
+# used to find the top-level children of a document without parsing them
+_STRUCTURE_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[\[\]{},]')
+
+# insignificant whitespace between tokens, skipped in one go
+_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+
+
+# marks an exhausted iterator on the explicit stacks
+_END = object()
+
+
+# batches of top-level children per worker of _evaluate_parallel(), more
+# of them than workers evens out children of different sizes
+BATCHES_PER_WORKER = 4
+
+# the serializer of a worker process of _evaluate_parallel()
+_worker_serializer = None
+
+
+def _init_worker():
+    global _worker_serializer
+    _worker_serializer = JsonSerializer()
+
+
+def _evaluate_span(span):
+    # runs inside of a worker process, so only primitives
+    # (dict, list, str, ...) are sent back to the parent
+    return _worker_serializer._evaluate(span)
 
 
 class JsonSerializer:
-    def __init__(self, indent=4):
+    def __init__(self, indent=4, separators=None, globals_by_ref=False,
+                 portable_code=False, trust_foreign_bytecode=False):
+        # indent=None writes everything on one line, separators are
+        # (item separator, key separator) like in the stdlib json
         self._indent = indent
-        self.builtin_fnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isbuiltin)]
-        self.builtin_cnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isclass)]
+        if separators is None:
+            separators = (",", ":") if indent is None else (",", " : ")
+        self._item_separator, self._key_separator = separators
+        self.builtin_fnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isbuiltin)}
+        self.builtin_cnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isclass)}
+        # importable module-level classes and functions are written as
+        # "<global module:qualname>" instead of being embedded
+        self.globals_by_ref = globals_by_ref
+        self._globals_cache = {}  # resolved globals of the current document
+        # code objects are written field by field instead of as marshal
+        # data; bytecode isn't portable, another python version only
+        # loads them with trust_foreign_bytecode (see codeobj.py)
+        self.portable_code = portable_code
+        self.trust_foreign_bytecode = trust_foreign_bytecode
 
     def dumps_list(self, lst, level):
+        return "".join(self._iterencode(lst, level - 1))
+
+    def dumps_dict(self, dct, level):
+        return "".join(self._iterencode(dct, level - 1))
+
+    def _tagged_items(self, lst):
         # this can be either of list, tuple, set or frozenset,
         # so we add an element at the very beginning which will
         # indictate what it actually is
@@ -26,27 +89,8 @@ class JsonSerializer:
             tmplst.append("frozenset")
         else:
             raise ValueError(f"Cannot dump json array from {lst}.")
-
-        tmplst.extend(list(lst))
-        curr_indent = "\n" + " " * self._indent * level
-        res = curr_indent + "["
-        for el in tmplst:
-            res += curr_indent + self.dumps(el, level) + ","
-        res = res[:-1]  # gettin rid of the last comma
-        res += curr_indent + "]"
-        return res
-
-    def dumps_dict(self, dct, level):
-        if len(dct) == 0:
-            return "{}"
-        curr_indent = "\n" + " " * self._indent * level
-        res = curr_indent + "{"
-        for key in dct.keys():
-            res += curr_indent + f"\"{str(key)}\" : " \
-                + self.dumps(dct[key], level) + ","
-        res = res[:-1]  # getting rid of the last comma
-        res += curr_indent + "}"
-        return res
+        tmplst.extend(lst)
+        return tmplst
 
     def dumps_str(self, string):
         return '"' + string.replace("\\", r"\\").replace("\"", r"\"")\
@@ -64,7 +108,11 @@ class JsonSerializer:
             elif i in self.builtin_cnames:
                 globs[i] = f"<built-in class {i}>"
             elif i in func.__globals__:
-                if inspect.isclass(func.__globals__[i]):
+                ref = global_ref(func.__globals__[i]) \
+                    if self.globals_by_ref else None
+                if ref is not None:
+                    globs[i] = ref
+                elif inspect.isclass(func.__globals__[i]):
                     globs[i] = self.cls_to_dict(func.__globals__[i])
                 elif inspect.isfunction(func.__globals__[i]):
                     if func.__name__ == i:
@@ -102,7 +150,9 @@ class JsonSerializer:
         bases = []
         for base in clsobj.__bases__:
             if base.__name__ != "object":
-                bases.append(self.cls_to_dict(base))
+                ref = global_ref(base) if self.globals_by_ref else None
+                bases.append(ref if ref is not None
+                             else self.cls_to_dict(base))
         clsdict = {}
         attrs = clsobj.__dict__
         for key in attrs:
@@ -126,25 +176,10 @@ class JsonSerializer:
 
     def obj_to_dict(self, obj):
         if isinstance(obj, types.CodeType):
-            return {"co_argcount": obj.co_argcount,
-                    "co_posonlyargcount": obj.co_posonlyargcount,
-                    "co_kwonlyargcount": obj.co_kwonlyargcount,
-                    "co_nlocals": obj.co_nlocals,
-                    "co_stacksize": obj.co_stacksize,
-                    "co_flags": obj.co_flags,
-                    "co_code": obj.co_code,
-                    "co_consts": obj.co_consts,
-                    "co_names": obj.co_names,
-                    "co_varnames": obj.co_varnames,
-                    "co_filename": obj.co_filename,
-                    "co_name": obj.co_name,
-                    "co_firstlineno": obj.co_firstlineno,
-                    "co_lnotab": obj.co_lnotab,
-                    "co_freevars": obj.co_freevars,
-                    "co_cellvars": obj.co_cellvars}
+            return code_to_dict(obj, portable=self.portable_code)
         return {"class": self.cls_to_dict(obj.__class__), "vars": obj.__dict__}
 
-    def dumps(self, obj, level=-1):
+    def _encode_value(self, obj):
         # So, this is a complex object, which can be one of 3 different types:
         #     1. Function (lambdas included)
         #     2. Object (simple or complex, idc)
@@ -157,6 +192,8 @@ class JsonSerializer:
         #     5. Array <or list> ([1,2,"hello"])
         #     6. Objects(!) <in our case dictionaries> {"key" : "value",
         #       "age" : 30}
+        # Simple values are returned as json text, arrays and objects
+        # as (opening bracket, items) to be walked by _iterencode.
         if obj is True:
             return "true"
         elif obj is False:
@@ -168,11 +205,14 @@ class JsonSerializer:
         elif isinstance(obj, str):
             return self.dumps_str(obj)
         elif isinstance(obj, (set, frozenset, list, tuple)):
-            return self.dumps_list(obj, level + 1)
+            packed = pack_numeric(obj)
+            if packed is not None:
+                return "{", packed
+            return "[", self._tagged_items(obj)
         elif isinstance(obj, dict):
-            return self.dumps_dict(obj, level + 1)
+            return "{", obj
         elif isinstance(obj, types.FunctionType):
-            return self.dumps_dict(self.func_to_dict(obj), level + 1)
+            return "{", self.func_to_dict(obj)
         elif isinstance(obj, types.BuiltinFunctionType):
             if obj.__name__ in self.builtin_fnames:
                 return f"\"<built-in function {obj.__name__}>\""
@@ -191,20 +231,89 @@ class JsonSerializer:
             if obj.__name__ in self.builtin_cnames:
                 # built-in class, like exceptions
                 return f"\"<built-in class {obj.__name__}>\""
-            return self.dumps_dict(self.cls_to_dict(obj), level + 1)
+            return "{", self.cls_to_dict(obj)
         elif isinstance(obj, types.CellType):   # for closures
-            return self.dumps(obj.cell_contents)
+            return self._encode_value(obj.cell_contents)
         elif isinstance(obj, object):
-            return self.dumps_dict(self.obj_to_dict(obj), level + 1)
+            packed = pack_numeric(obj)
+            if packed is not None:
+                return "{", packed
+            return "{", self.obj_to_dict(obj)
         else:
             raise TypeError(f"Object {obj} is not JSON-parsable.")
 
-    def dump(self, obj, fname):
-        if not fname.endswith(".json"):
+    def _iterencode(self, obj, level=-1):
+        # Yields the json text of obj chunk by chunk. Nested arrays and
+        # objects are walked with an explicit stack instead of recursion,
+        # so the nesting depth isn't limited by the interpreter.
+        stack = []  # [items iterator, indent, closing bracket, level, first]
+        value = obj
+        while True:
+            encoded = self._encode_value(value)
+            if isinstance(encoded, str):
+                yield encoded
+            elif encoded[0] == "{" and not encoded[1]:
+                yield "{}"
+            else:
+                level += 1
+                if self._indent is None:
+                    curr_indent = ""
+                else:
+                    curr_indent = "\n" + " " * self._indent * level
+                bracket, items = encoded
+                yield curr_indent + bracket
+                if bracket == "{":
+                    stack.append([iter(items.items()), curr_indent,
+                                  "}", level, True])
+                else:
+                    stack.append([iter(items), curr_indent,
+                                  "]", level, True])
+
+            while stack:
+                frame = stack[-1]
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    yield frame[1] + frame[2]
+                    continue
+                if not frame[4]:
+                    yield self._item_separator
+                frame[4] = False
+                level = frame[3]
+                if frame[2] == "}":
+                    yield frame[1] + f"\"{str(item[0])}\"" \
+                        + self._key_separator
+                    value = item[1]
+                else:
+                    yield frame[1]
+                    value = item
+                break
+            else:
+                return
+
+    def dumps(self, obj, level=-1):
+        return "".join(self._iterencode(obj, level))
+
+    def dump(self, obj, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".json"):
             raise AttributeError("File must have .json extension!")
-        with open(fname, "a+") as fhandler:
+        with open_file(fname, "w", compression) as fhandler:
             fhandler.write(self.dumps(obj))
 
+    async def adump(self, obj, fname, compression=None):
+        # the document is encoded and written piece by piece in
+        # an executor, it's never kept in memory as a whole
+        if not split_compression(fname)[0].endswith(".json"):
+            raise AttributeError("File must have .json extension!")
+        await write_file(fname, "w", self._iterencode(obj), compression)
+
+    def append(self, obj, fname):
+        # adds obj as the next record of a container file,
+        # read them back with iterload() or load_record()
+        if not fname.endswith(".json"):
+            raise AttributeError("File must have .json extension!")
+        RecordFile(fname).append(self.dumps(obj).encode())
+
     def _exception_notify(self, jstr, index):
         if index >= 10:
             print(f"Surroundings: {jstr[index - 10 : index + 10]}")
@@ -213,13 +322,22 @@ class JsonSerializer:
         print(f"The actual symbol: {jstr[index]}")
 
     # EVALUATING THE JSON STRING
-    def _parse(self, jstr, index):
+    def _skip_whitespace(self, jstr, index):
+        return _WHITESPACE_RE.match(jstr, index).end()
+
+    def _parse_jkey(self, jstr, index):
+        # "key" : <- returns the key and the index of the value after it
+        key, index = self.parse_jstring(jstr, index)
+        index = self._skip_whitespace(jstr, index)
+        if jstr[index] != ':':
+            self._exception_notify(jstr, index)
+            raise ValueError("No colon after the key!"
+                             + f"Current index: {index}")
+        return key, self._skip_whitespace(jstr, index + 1)
+
+    def _parse_scalar(self, jstr, index):
         if jstr[index] == '"':
             res, index = self.parse_jstring(jstr, index)
-        elif jstr[index] == '[':
-            res, index = self.parse_jarray(jstr, index)
-        elif jstr[index] == '{':
-            res, index = self.parse_jdict(jstr, index)
         elif jstr[index] == 't' and jstr[index: index + 4] == "true":
             index += 4
             res = True
@@ -237,24 +355,86 @@ class JsonSerializer:
             raise ValueError(f"Something is not parsable at index {index}")
         return res, index
 
+    def _parse(self, jstr, index):
+        # Parses the value starting at index. Arrays and objects being
+        # filled are kept on an explicit stack instead of recursing,
+        # so the nesting depth isn't limited by the interpreter.
+        stack = []  # [list] for arrays, [dict, current key] for objects
+        while True:
+            if jstr[index] == '[':
+                index = self._skip_whitespace(jstr, index + 1)
+                if jstr[index] != ']':
+                    stack.append([[]])
+                    continue
+                res, index = [], index + 1
+            elif jstr[index] == '{':
+                index = self._skip_whitespace(jstr, index + 1)
+                if jstr[index] != '}':
+                    key, index = self._parse_jkey(jstr, index)
+                    stack.append([{}, key])
+                    continue
+                res, index = {}, index + 1
+            else:
+                res, index = self._parse_scalar(jstr, index)
+
+            # the value is complete, so it goes to the enclosing container
+            while stack:
+                frame = stack[-1]
+                index = self._skip_whitespace(jstr, index)
+                if len(frame) == 1:
+                    frame[0].append(res)
+                    if jstr[index] == ',':
+                        index = self._skip_whitespace(jstr, index + 1)
+                        if jstr[index] == ']':
+                            self._exception_notify(jstr, index)
+                            raise ValueError("Unneeded comma at the end!"
+                                             + f"Current index: {index}")
+                        break
+                    elif jstr[index] == ']':
+                        stack.pop()
+                        res, index = \
+                            self._make_typed_jarray(frame[0]), index + 1
+                    else:
+                        self._exception_notify(jstr, index)
+                        raise ValueError("One of elements in array is "
+                                         + "not json parsable!"
+                                         + f"Current index: {index}")
+                else:
+                    frame[0][frame[1]] = res
+                    if jstr[index] == ',':
+                        index = self._skip_whitespace(jstr, index + 1)
+                        frame[1], index = self._parse_jkey(jstr, index)
+                        break
+                    elif jstr[index] == '}':
+                        stack.pop()
+                        res, index = frame[0], index + 1
+                    else:
+                        self._exception_notify(jstr, index)
+                        raise ValueError("No comma was encountered!"
+                                         + f"Current index: {index}")
+            else:
+                return res, index
+
     def parse_jstring(self, jstr, index):
         if jstr[index] != '"':
             self._exception_notify(jstr, index)
             raise ValueError(f"This is not a string! Current index: {index}")
-        end_index = index + 1
-
-        try:
-            while True:  # read everything until we get bare " symbol
-                if jstr[end_index] == '\\':  # this one is for sure escaping
-                    end_index += 2
-                    continue
-                if jstr[end_index] == '"':
-                    break
-                end_index += 1
-        except IndexError:
+        # read everything until we get bare " symbol, a quote preceded
+        # by an odd number of backslashes is escaped
+        end_index = jstr.find('"', index + 1)
+        while end_index != -1:
+            backslashes = 0
+            while jstr[end_index - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end_index = jstr.find('"', end_index + 1)
+        if end_index == -1:
             raise IndexError(f"No \" was encountered on the end of string!")
 
         s = jstr[index + 1: end_index]
+        if "\\" not in s:  # nothing to unescape
+            return s, end_index + 1
         # working on escaping symblos
         res, n, i = [], len(s), 0
         while i < n:
@@ -385,50 +565,11 @@ class JsonSerializer:
         if jstr[index] != '[':
             self._exception_notify(jstr, index)
             raise ValueError(f"This is not an array! Current index: {index}")
-        end_index = index + 1
-
-        lst = []
-        comma_encountered = False
-        while True:
-            if jstr[end_index] == ']':
-                if not comma_encountered:
-                    break
-                else:
-                    self._exception_notify(jstr, end_index)
-                    raise ValueError("Unneeded comma at the end!"
-                                     + f"Current index: {end_index}")
-            elif jstr[end_index] == ',':
-                if not comma_encountered:
-                    comma_encountered = True
-                    end_index += 1
-                    continue
-                else:
-                    self._exception_notify(jstr, end_index)
-                    raise ValueError(f"Two commas in a row encountered!"
-                                     + f"Current index: {end_index}")
-            elif jstr[end_index] == '\n' or jstr[end_index] == ' ':
-                end_index += 1
-                continue
-
-            res, end_index = self._parse(jstr, end_index)
+        return self._parse(jstr, index)
 
-            if len(lst) != 0:
-                if comma_encountered:
-                    lst.append(res)
-                    comma_encountered = False
-                else:
-                    self._exception_notify(jstr, end_index)
-                    raise ValueError("One of elements in array is "
-                                     + "not json parsable!"
-                                     + f"Current index: {end_index}")
-            else:
-                lst.append(res)
-        # On this stage we have the fully parsed array.
+    def _make_typed_jarray(self, lst):
         # Now, we want to transfrom it to type needed.
         # Don't forget to get rid of the first element! (if it exists)
-        if not lst:
-            return lst, index + 1
-
         if isinstance(lst[0], str):
             if lst[0] == "list":
                 lst = lst[1:]
@@ -443,82 +584,99 @@ class JsonSerializer:
                                  + "(list, tuple, set, frozenset)"
                                  + "to transfrom to."
                                  + f"Value: {lst}")
-        return lst, end_index + 1
+        return lst
 
     def parse_jdict(self, jstr, index):
         if jstr[index] != '{':
             self._exception_notify(jstr, index)
             raise ValueError("This is not a dictionary!"
                              + f"Current index: {index}")
-        end_index = index + 1
-        if jstr[end_index] == '}':
-            return dict(), end_index + 1
-
-        dct = {}
-        comma_encountered, colon_encountered = False, False
-        key, val = None, None
-        while True:
-            if jstr[end_index] == '}':
-                if not (comma_encountered and colon_encountered):
-                    break
-                else:
-                    self._exception_notify(jstr, end_index)
-                    raise ValueError("Unneeded comma or colon at the end!"
-                                     + f"Current index: {end_index}")
-            elif jstr[end_index] == ',':
-                comma_encountered = True
-                end_index += 1
-                continue
-            elif jstr[end_index] == ':':
-                if key is not None:
-                    colon_encountered = True
-                    end_index += 1
-                    continue
-                else:
-                    self._exception_notify(jstr, end_index)
-                    raise ValueError("Colon encountered before "
-                                     + "the key appeared!"
-                                     + f"Current index: {end_index}")
-            elif jstr[end_index] == '\n' or jstr[end_index] == ' ':
-                end_index += 1
-                continue
-
-            if key is None and not colon_encountered:
-                key, end_index = self.parse_jstring(jstr, end_index)
-                # this can only be a string
-                continue
-
-            if key is not None and colon_encountered:
-                val, end_index = self._parse(jstr, end_index)
-                # this can be anything
-                colon_encountered = False
-            if len(dct) != 0:
-                if comma_encountered:
-                    dct[key] = val
-                    comma_encountered = False
-                else:
-                    self._exception_notify(jstr, end_index)
-                    raise ValueError("No comma was encountered!"
-                                     + f"Current index: {end_index}")
-            else:
-                dct[key] = val
-            key, val = None, None
-        # on this stage we have the fully parsed dictionary
-        return dct, end_index + 1
+        return self._parse(jstr, index)
 
     # this evaluates the json string into python primitives
     # (dict, str, bool, ...)
     def _evaluate(self, jstr):
-        res = None
-        curr_index = 0
-        while True:
-            if jstr[curr_index] == '\n' or jstr[curr_index] == ' ':
-                curr_index += 1
-            else:
-                break
-        res, _ = self._parse(jstr, curr_index)
+        res, _ = self._parse(jstr, self._skip_whitespace(jstr, 0))
         return res
 
+    def split_top_level(self, jstr):
+        # Structural scan of the document: returns the opening bracket
+        # of the top-level container and the source spans of its children
+        # (for objects every span is a whole "key" : value pair).
+        # Nothing is parsed here, so this is cheap compared to _parse.
+        start = _WHITESPACE_RE.match(jstr).end()
+        if start == len(jstr) or jstr[start] not in "[{":
+            return None, []
+
+        spans = []
+        depth = 0
+        span_start = start + 1
+        for match in _STRUCTURE_RE.finditer(jstr, start + 1):
+            symbol = match.group()
+            if symbol in "[{":
+                depth += 1
+            elif symbol in "]}":
+                if depth == 0:
+                    spans.append(jstr[span_start: match.start()])
+                    break
+                depth -= 1
+            elif symbol == "," and depth == 0:
+                spans.append(jstr[span_start: match.start()])
+                span_start = match.end()
+        else:
+            raise ValueError("Top-level container is never closed!")
+
+        if len(spans) == 1 and not spans[0].strip():
+            spans = []  # empty container
+        return jstr[start], spans
+
+    def _evaluate_parallel(self, jstr, workers):
+        # Top-level children are independent of each other, so they are
+        # evaluated in separate processes and merged here afterwards.
+        # Consecutive children go to a worker together as one document
+        # (an object, or an array with its "list" tag), in batches of
+        # about the same size, so a task costs one pickle each way
+        # however many children it has. Rebuilding functions, classes
+        # and code objects is left to _deserialize, which runs in the
+        # parent.
+        opener, spans = self.split_top_level(jstr)
+        if len(spans) < 2:
+            return self._evaluate(jstr)
+
+        if opener == "{":
+            prefix, suffix = "{", "}"
+        else:
+            prefix, suffix = "[\"list\",", "]"
+            # the type tag if there is one, see _make_typed_jarray
+            first = self._evaluate(spans[0])
+            spans = spans[1:]
+        batch_size = sum(map(len, spans)) \
+            // (workers * BATCHES_PER_WORKER) + 1
+        batches = []
+        batch, size = [], 0
+        for span in spans:
+            batch.append(span)
+            size += len(span)
+            if size >= batch_size:
+                batches.append(prefix + ",".join(batch) + suffix)
+                batch, size = [], 0
+        if batch:
+            batches.append(prefix + ",".join(batch) + suffix)
+        del spans, batch
+
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker) as executor:
+            parts = executor.map(_evaluate_span, batches)
+            if opener == "{":
+                res = {}
+                for part in parts:
+                    res.update(part)
+                return res
+            res = [first]
+            for part in parts:
+                res.extend(part)
+        return self._make_typed_jarray(res)
+
     # ACTUALLY GETTING DESERIALIZED OBJECT
     def dict_to_func(self, jsonobj):
         globs = {}
@@ -583,33 +741,18 @@ class JsonSerializer:
         return res
 
     def dict_to_code(self, jsonobj):
-        codeobj = types.CodeType(jsonobj["co_argcount"],
-                                 jsonobj["co_posonlyargcount"],
-                                 jsonobj["co_kwonlyargcount"],
-                                 jsonobj["co_nlocals"],
-                                 jsonobj["co_stacksize"],
-                                 jsonobj["co_flags"],
-                                 bytes(bytearray(
-                                     self.parse_jarray(
-                                         jsonobj["co_code"], 0
-                                     )[0]
-                                 )),
-                                 self._deserialize(jsonobj["co_consts"]),
-                                 tuple(jsonobj["co_names"]),
-                                 tuple(jsonobj["co_varnames"]),
-                                 jsonobj["co_filename"],
-                                 jsonobj["co_name"],
-                                 jsonobj["co_firstlineno"],
-                                 bytes(bytearray(
-                                     self.parse_jarray(
-                                         jsonobj["co_lnotab"], 0
-                                     )[0]
-                                 )),
-                                 tuple(jsonobj["co_freevars"]),
-                                 tuple(jsonobj["co_cellvars"]))
-        return codeobj
-
-    def deserialize_jobj(self, jsonobj):
+        if is_code_dict(jsonobj):
+            return code_from_dict(jsonobj, self._deserialize,
+                                  self.trust_foreign_bytecode)
+        # legacy format, bytes fields were written as "[1, 2, ...]"
+        fields = dict(jsonobj)
+        fields["co_code"] = \
+            bytes(bytearray(self.parse_jarray(jsonobj["co_code"], 0)[0]))
+        fields["co_lnotab"] = \
+            bytes(bytearray(self.parse_jarray(jsonobj["co_lnotab"], 0)[0]))
+        return fields_to_code(fields, self._deserialize)
+
+    def _jobj_kind(self, jsonobj):
         if "co_argcount" in jsonobj \
                 and "co_posonlyargcount" in jsonobj \
                 and "co_kwonlyargcount" in jsonobj \
@@ -626,27 +769,48 @@ class JsonSerializer:
                 and "co_lnotab" in jsonobj \
                 and "co_freevars" in jsonobj \
                 and "co_cellvars" in jsonobj:
-            res = self.dict_to_code(jsonobj)
+            return "code"
+        elif is_code_dict(jsonobj):
+            return "code"
         elif "__globals__" in jsonobj \
                 and "__name__" in jsonobj \
                 and "__code__" in jsonobj:
-            res = self.dict_to_func(jsonobj)
+            return "function"
         elif "class" in jsonobj \
                 and "vars" in jsonobj:
-            res = self.dict_to_obj(jsonobj)
+            return "object"
         elif "name" in jsonobj \
                 and "bases" in jsonobj \
                 and "dict" in jsonobj:
-            res = self.dict_to_class(jsonobj)
+            return "class"
         elif "staticmethod" in jsonobj:
-            res = staticmethod(self.dict_to_func(jsonobj["staticmethod"]))
+            return "staticmethod"
         elif "classmethod" in jsonobj:
+            return "classmethod"
+        elif is_packed_numeric(jsonobj):
+            return "numarray"
+        return None
+
+    def deserialize_jobj(self, jsonobj):
+        kind = self._jobj_kind(jsonobj)
+        if kind == "code":
+            res = self.dict_to_code(jsonobj)
+        elif kind == "function":
+            res = self.dict_to_func(jsonobj)
+        elif kind == "object":
+            res = self.dict_to_obj(jsonobj)
+        elif kind == "class":
+            res = self.dict_to_class(jsonobj)
+        elif kind == "staticmethod":
+            res = staticmethod(self.dict_to_func(jsonobj["staticmethod"]))
+        elif kind == "classmethod":
             res = classmethod(self.dict_to_func(jsonobj["classmethod"]))
+        elif kind == "numarray":
+            res = unpack_numeric(jsonobj)
         else:
             res = {}
             for key, val in jsonobj.items():
                 res[key] = self._deserialize(val)
-
         return res
 
     def deserialize_jarr(self, jsonobj):
@@ -656,10 +820,46 @@ class JsonSerializer:
         return type(jsonobj)(res)
 
     def _deserialize(self, jsonobj):
+        # Plain arrays and dictionaries are rebuilt bottom-up with an
+        # explicit stack instead of recursion, so the nesting depth isn't
+        # limited by the interpreter. Everything else goes to
+        # _deserialize_leaf (functions, classes, objects are rebuilt there).
+        stack = []  # [items iterator, rebuilt items, array type, key]
+        value = jsonobj
+        while True:
+            if isinstance(value, dict) and self._jobj_kind(value) is None:
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                stack.append([iter(value), [], type(value), None])
+                res = _END
+            else:
+                res = self._deserialize_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _deserialize_leaf(self, jsonobj):
         if isinstance(jsonobj, dict):
-            res = self.deserialize_jobj(jsonobj)
-        elif isinstance(jsonobj, (list, tuple, set, frozenset)):
-            res = self.deserialize_jarr(jsonobj)
+            return self.deserialize_jobj(jsonobj)
         elif isinstance(jsonobj, str) and len(jsonobj) != 0:
             if jsonobj[0] == '<' and jsonobj[-1] == '>':
                 tokens = jsonobj[1: -1].split(' ')
@@ -678,6 +878,8 @@ class JsonSerializer:
                         module = __import__(module_name)
                         module_attr = getattr(module, name)
                         return module_attr
+                elif len(tokens) == 2 and tokens[0] == "global":
+                    return resolve_global(tokens[1], self._globals_cache)
                 elif len(tokens) == 2:
                     module_name = tokens[1]
                     try:
@@ -694,20 +896,47 @@ class JsonSerializer:
             res = jsonobj
         return res
 
-    def loads(self, string):
+    def loads(self, string, workers=None):
+        # workers > 1 evaluates the top-level children of big documents
+        # in a process pool
         if not isinstance(string, str):
             raise TypeError("Argument must be a string! "
                             + f"Type: {type(string)}")
+        self._globals_cache = {}
+        if workers is not None and workers > 1:
+            return self._deserialize(
+                self._evaluate_parallel(string, workers))
         return self._deserialize(self._evaluate(string))
 
-    def load(self, fname):
-        if not fname.endswith(".json"):
+    def load(self, fname, workers=None, compression=None):
+        if not split_compression(fname)[0].endswith(".json"):
             raise NameError("File must have .json extension!")
-        with open(fname, "r") as fhandler:
+        with open_file(fname, "r", compression) as fhandler:
             text = fhandler.read()
-            obj = self.loads(text)
+            obj = self.loads(text, workers)
             return obj
 
+    async def aload(self, fname, workers=None, compression=None):
+        # the file is read in chunks in an executor and then parsed
+        # there as a whole, this parser needs the whole document; the
+        # event loop is never blocked
+        if not split_compression(fname)[0].endswith(".json"):
+            raise NameError("File must have .json extension!")
+        text = await read_file(fname, "r", compression)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.loads, text, workers)
+
+    def iterload(self, fname):
+        if not fname.endswith(".json"):
+            raise NameError("File must have .json extension!")
+        for payload in RecordFile(fname):
+            yield self.loads(payload.decode())
+
+    def load_record(self, fname, n):
+        if not fname.endswith(".json"):
+            raise NameError("File must have .json extension!")
+        return self.loads(RecordFile(fname).read(n).decode())
+
 
 def main():
     json = JsonSerializer(2)
@@ -1,36 +1,110 @@
+import asyncio
 import inspect
+import itertools
 import types
 import builtins
-import copy
 import math
 import pickle
 
+from .compression import open_file, split_compression
+from .container import RecordFile
+from .aio import split_chunks, write_file
+from .codeobj import code_from_dict, code_to_dict, fields_to_code, \
+    is_code_dict
+from .globalref import global_ref, resolve_global
+from .numeric import is_packed_numeric, pack_numeric, unpack_numeric
+
+
+# marks an exhausted iterator on the explicit stacks
+_END = object()
+
+# bytes at least this long are handed to buffer_callback (out-of-band)
+OUT_OF_BAND_SIZE = 1 << 16
+
+# The C pickler recurses on every level of nesting, deeper documents are
+# pickled in segments of at most this many levels, see _segments().
+SEGMENT_DEPTH = 100
+# first item of the tuple such a document is pickled as
+SEGMENTS_TAG = "<nested segments>"
+
 
 class PickleSerializer:
     # SERIALIZING SECTION #
-    def __init__(self):
-        self.builtin_fnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isbuiltin)]
-        self.builtin_cnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isclass)]
+    def __init__(self, globals_by_ref=False,
+                 protocol=pickle.HIGHEST_PROTOCOL, portable_code=False,
+                 trust_foreign_bytecode=False):
+        self.protocol = protocol
+        self._out_of_band = False  # set while dumping with buffer_callback
+        self.builtin_fnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isbuiltin)}
+        self.builtin_cnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isclass)}
+        # importable module-level classes and functions are written as
+        # "<global module:qualname>" instead of being embedded
+        self.globals_by_ref = globals_by_ref
+        self._globals_cache = {}  # resolved globals of the current document
+        # code objects are written field by field instead of as marshal
+        # data; bytecode isn't portable, another python version only
+        # loads them with trust_foreign_bytecode (see codeobj.py)
+        self.portable_code = portable_code
+        self.trust_foreign_bytecode = trust_foreign_bytecode
 
     def _expand(self, obj):
+        # Turns obj into primitives (dict, list, str, ...). Containers are
+        # copied bottom-up with an explicit stack instead of recursion, so
+        # the nesting depth isn't limited and obj itself is never modified.
+        stack = []  # [items iterator, expanded items, array type, key]
+        value = obj
+        while True:
+            if isinstance(value, dict):
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (set, frozenset, list, tuple)):
+                res = pack_numeric(value, binary=True)
+                if res is None:
+                    stack.append([iter(value), [], type(value), None])
+                    res = _END
+            else:
+                res = self._expand_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _expand_leaf(self, obj):
         if obj is True:
             return True
         elif obj is False:
             return False
         elif isinstance(obj, (int, float)):
             return obj
-        elif isinstance(obj, bytes):
-            return str(list(bytearray(obj)))
+        elif isinstance(obj, (bytes, bytearray)):
+            if self._out_of_band and len(obj) >= OUT_OF_BAND_SIZE:
+                return pickle.PickleBuffer(obj)
+            return obj
+        elif isinstance(obj, pickle.PickleBuffer):  # already expanded
+            return obj
         elif isinstance(obj, str):
             return obj
-        elif isinstance(obj, (set, frozenset, list, tuple)):
-            return self.expand_list(obj)
-        elif isinstance(obj, dict):
-            return self.expand_dict(obj)
         elif isinstance(obj, types.FunctionType):
-            return self.expand_dict(self.func_to_dict(obj))
+            return self.func_to_dict(obj)
         elif isinstance(obj, types.BuiltinFunctionType):
             if obj.__name__ in self.builtin_fnames:
                 return f"<built-in function {obj.__name__}>"
@@ -48,34 +122,32 @@ class PickleSerializer:
         elif inspect.isclass(obj):
             if obj.__name__ in self.builtin_cnames:
                 return f"<built-in class {obj.__name__}>"
-            return self.expand_dict(self.cls_to_dict(obj))
+            return self.cls_to_dict(obj)
         elif isinstance(obj, types.CellType):   # for closures
             return self._expand(obj.cell_contents)
         elif isinstance(obj, object):
-            return self.expand_dict(self.obj_to_dict(obj))
+            packed = pack_numeric(obj, binary=True)
+            if packed is not None:
+                return packed
+            return self.obj_to_dict(obj)
         else:
             raise TypeError(f"Object {obj} is not PICKLE-parsable.")
 
     def expand_list(self, lst):
         if not isinstance(lst, (tuple, list, set, frozenset)):
             raise ValueError(f"Cannot dump toml array from {lst}.")
-        lst_type = type(lst)
-        tmplist = list(lst)
-
-        for i in range(len(tmplist)):
-            tmplist[i] = self._expand(tmplist[i])
-        return lst_type(tmplist)
+        return self._expand(lst)
 
     def expand_dict(self, dct):
-        for key, val in dct.items():
-            dct[key] = self._expand(val)
-        return dct
+        return self._expand(dct)
 
     def cls_to_dict(self, clsobj):
         bases = []
         for base in clsobj.__bases__:
             if base.__name__ != "object":
-                bases.append(self.cls_to_dict(base))
+                ref = global_ref(base) if self.globals_by_ref else None
+                bases.append(ref if ref is not None
+                             else self.cls_to_dict(base))
         clsdict = {}
         attrs = clsobj.__dict__
         for key in attrs:
@@ -99,22 +171,11 @@ class PickleSerializer:
 
     def obj_to_dict(self, obj):
         if isinstance(obj, types.CodeType):
-            return {"co_argcount": obj.co_argcount,
-                    "co_posonlyargcount": obj.co_posonlyargcount,
-                    "co_kwonlyargcount": obj.co_kwonlyargcount,
-                    "co_nlocals": obj.co_nlocals,
-                    "co_stacksize": obj.co_stacksize,
-                    "co_flags": obj.co_flags,
-                    "co_code": str(list(bytearray(obj.co_code))),
-                    "co_consts": self._expand(obj.co_consts),
-                    "co_names": obj.co_names,
-                    "co_varnames": obj.co_varnames,
-                    "co_filename": obj.co_filename,
-                    "co_name": obj.co_name,
-                    "co_firstlineno": obj.co_firstlineno,
-                    "co_lnotab": str(list(bytearray(obj.co_lnotab))),
-                    "co_freevars": self._expand(obj.co_freevars),
-                    "co_cellvars": self._expand(obj.co_cellvars)}
+            res = code_to_dict(obj, binary=True,
+                               portable=self.portable_code)
+            if "co_fields" in res:
+                res["co_fields"]["co_consts"] = self._expand(obj.co_consts)
+            return res
         return {"class": self._expand(self.cls_to_dict(obj.__class__)),
                 "vars": self._expand(obj.__dict__)}
 
@@ -129,7 +190,11 @@ class PickleSerializer:
             elif i in self.builtin_cnames:
                 globs[i] = f"<built-in class {i}>"
             elif i in func.__globals__:
-                if inspect.isclass(func.__globals__[i]):
+                ref = global_ref(func.__globals__[i]) \
+                    if self.globals_by_ref else None
+                if ref is not None:
+                    globs[i] = ref
+                elif inspect.isclass(func.__globals__[i]):
                     globs[i] = self.cls_to_dict(func.__globals__[i])
                 elif inspect.isfunction(func.__globals__[i]):
                     if func.__name__ == i:
@@ -166,22 +231,118 @@ class PickleSerializer:
                 "__kwdefaults__":
                 self._expand(func.__kwdefaults__)}
 
-    def dumps(self, obj):
-        t_obj = copy.deepcopy(obj)
-        return pickle.dumps(self._expand(t_obj))
+    def _segments(self, expanded):
+        # The containers found every SEGMENT_DEPTH levels, children before
+        # their parents. Pickled in this order ahead of the document, each
+        # of them is in the pickler's memo by the time its parent gets to
+        # it and is written there as a reference, so the pickler never
+        # goes more than SEGMENT_DEPTH levels deep. Unpickling doesn't
+        # recurse at all. Empty for documents that aren't that deep.
+        segments = []
+        stack = [(expanded, 0)]
+        while stack:
+            value, level = stack.pop()
+            if isinstance(value, dict):
+                items = itertools.chain.from_iterable(value.items())
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                items = value
+            else:
+                continue
+            if level and level % SEGMENT_DEPTH == 0:
+                segments.append(value)
+            stack.extend((item, level + 1) for item in items)
+        segments.reverse()
+        return segments
+
+    def dumps(self, obj, buffer_callback=None):
+        # With protocol 5 and a buffer_callback, big bytes are passed to
+        # the callback as PickleBuffers instead of being copied into the
+        # pickle; loads() then needs them back in the same order.
+        self._out_of_band = buffer_callback is not None
+        try:
+            expanded = self._expand(obj)
+        finally:
+            self._out_of_band = False
+        # Deep documents are pickled again in segments. Buffers given to
+        # buffer_callback can't be taken back, with one the segments are
+        # looked for first instead.
+        if buffer_callback is None:
+            try:
+                return pickle.dumps(expanded, protocol=self.protocol)
+            except RecursionError:
+                pass
+        segments = self._segments(expanded)
+        if segments:
+            segments.append(expanded)
+            expanded = (SEGMENTS_TAG, segments)
+        return pickle.dumps(expanded, protocol=self.protocol,
+                            buffer_callback=buffer_callback)
 
-    def dump(self, obj, fname):
+    def dump(self, obj, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".pickle"):
+            raise NameError("File must have .pickle extension!")
+        # pickled in memory first, a retry of a deep document must not
+        # write after what the first attempt already wrote
+        data = self.dumps(obj)
+        with open_file(fname, "wb", compression) as fhandler:
+            fhandler.write(data)
+
+    async def adump(self, obj, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".pickle"):
+            raise NameError("File must have .pickle extension!")
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.dumps, obj)
+        await write_file(fname, "wb", split_chunks(data), compression)
+
+    def append(self, obj, fname):
+        # adds obj as the next record of a container file,
+        # read them back with iterload() or load_record()
         if not fname.endswith(".pickle"):
             raise NameError("File must have .pickle extension!")
-        with open(fname, "ab+") as fhandler:
-            fhandler.write(self.dumps(obj))
+        RecordFile(fname).append(self.dumps(obj))
 
     # DESERIALIZING SECTION #
     def _deserialize(self, obj):
+        # Plain arrays and dictionaries are rebuilt bottom-up with an
+        # explicit stack instead of recursion, so the nesting depth isn't
+        # limited by the interpreter. Everything else goes to
+        # _deserialize_leaf (functions, classes, objects are rebuilt there).
+        stack = []  # [items iterator, rebuilt items, array type, key]
+        value = obj
+        while True:
+            if isinstance(value, dict) and self._obj_kind(value) is None:
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                stack.append([iter(value), [], type(value), None])
+                res = _END
+            else:
+                res = self._deserialize_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _deserialize_leaf(self, obj):
         if isinstance(obj, dict):
-            res = self.deserialize_obj(obj)
-        elif isinstance(obj, (list, tuple, set, frozenset)):
-            res = self.deserialize_arr(obj)
+            return self.deserialize_obj(obj)
         elif isinstance(obj, str) and len(obj) != 0:
             if obj[0] == '<' and obj[-1] == '>':
                 tmp = obj[1: -1].split(' ')
@@ -198,6 +359,8 @@ class PickleSerializer:
                         module = __import__(module_name)
                         module_attr = getattr(module, name)
                         return module_attr
+                elif len(tmp) == 2 and tmp[0] == "global":
+                    return resolve_global(tmp[1], self._globals_cache)
                 elif len(tmp) == 2:
                     module_name = tmp[1]
                     try:
@@ -220,7 +383,7 @@ class PickleSerializer:
             res.append(self._deserialize(el))
         return type(obj)(res)
 
-    def deserialize_obj(self, obj):
+    def _obj_kind(self, obj):
         if "co_argcount" in obj \
                 and "co_posonlyargcount" in obj \
                 and "co_kwonlyargcount" in obj \
@@ -237,22 +400,44 @@ class PickleSerializer:
                 and "co_lnotab" in obj \
                 and "co_freevars" in obj \
                 and "co_cellvars" in obj:
-            res = self.dict_to_code(obj)
+            return "code"
+        elif is_code_dict(obj):
+            return "code"
         elif "__globals__" in obj \
                 and "__name__" in obj \
                 and "__code__" in obj:
-            res = self.dict_to_func(obj)
+            return "function"
         elif "class" in obj \
                 and "vars" in obj:
-            res = self.dict_to_obj(obj)
+            return "object"
         elif "name" in obj \
                 and "bases" in obj \
                 and "dict" in obj:
-            res = self.dict_to_class(obj)
+            return "class"
         elif "staticmethod" in obj:
-            res = staticmethod(self.dict_to_func(obj["staticmethod"]))
+            return "staticmethod"
         elif "classmethod" in obj:
+            return "classmethod"
+        elif is_packed_numeric(obj):
+            return "numarray"
+        return None
+
+    def deserialize_obj(self, obj):
+        kind = self._obj_kind(obj)
+        if kind == "code":
+            res = self.dict_to_code(obj)
+        elif kind == "function":
+            res = self.dict_to_func(obj)
+        elif kind == "object":
+            res = self.dict_to_obj(obj)
+        elif kind == "class":
+            res = self.dict_to_class(obj)
+        elif kind == "staticmethod":
+            res = staticmethod(self.dict_to_func(obj["staticmethod"]))
+        elif kind == "classmethod":
             res = classmethod(self.dict_to_func(obj["classmethod"]))
+        elif kind == "numarray":
+            res = unpack_numeric(obj)
         else:
             res = {}
             for key, val in obj.items():
@@ -322,34 +507,57 @@ class PickleSerializer:
         return res
 
     def dict_to_code(self, obj):
-        codeobj = types.CodeType(obj["co_argcount"],
-                                 obj["co_posonlyargcount"],
-                                 obj["co_kwonlyargcount"],
-                                 obj["co_nlocals"],
-                                 obj["co_stacksize"],
-                                 obj["co_flags"],
-                                 bytes(bytearray(eval(obj["co_code"]))),
-                                 self._deserialize(obj["co_consts"]),
-                                 tuple(obj["co_names"]),
-                                 tuple(obj["co_varnames"]),
-                                 obj["co_filename"],
-                                 obj["co_name"],
-                                 obj["co_firstlineno"],
-                                 bytes(bytearray(eval(obj["co_lnotab"]))),
-                                 tuple(obj["co_freevars"]),
-                                 tuple(obj["co_cellvars"]))
-        return codeobj
-
-    def loads(self, byte_seq):
-        if not isinstance(byte_seq, bytes):
+        if is_code_dict(obj):
+            return code_from_dict(obj, self._deserialize,
+                                  self.trust_foreign_bytecode)
+        # legacy format, bytes fields were written as "[1, 2, ...]"
+        fields = dict(obj)
+        fields["co_code"] = \
+            bytes(bytearray(eval(obj["co_code"])))
+        fields["co_lnotab"] = \
+            bytes(bytearray(eval(obj["co_lnotab"])))
+        return fields_to_code(fields, self._deserialize)
+
+    def loads(self, byte_seq, buffers=None):
+        # byte_seq may be any bytes-like object (e.g. a memoryview of an
+        # mmap). Out-of-band buffers are returned as the very objects
+        # given in buffers, nothing is copied.
+        if not isinstance(byte_seq, (bytes, bytearray, memoryview)):
             raise TypeError("Argument must be bytes! "
                             + f"Type: {type(byte_seq)}")
-        return self._deserialize(pickle.loads(byte_seq))
+        return self._rebuild(pickle.loads(byte_seq, buffers=buffers))
+
+    def _rebuild(self, loaded):
+        self._globals_cache = {}
+        if type(loaded) is tuple and len(loaded) == 2 \
+                and loaded[0] == SEGMENTS_TAG:
+            loaded = loaded[1][-1]  # the document comes last
+        return self._deserialize(loaded)
+
+    def load(self, fname, compression=None):
+        # the unpickler reads the file frame by frame as it goes, the
+        # whole file is never held in memory
+        if not split_compression(fname)[0].endswith(".pickle"):
+            raise NameError("File must have .pickle extension!")
+        with open_file(fname, "rb", compression) as fhandler:
+            return self._rebuild(pickle.load(fhandler))
 
-    def load(self, fname):
+    async def aload(self, fname, compression=None):
+        # load() runs in an executor, reading and unpickling the file
+        # piece by piece there, so the event loop is never blocked
+        if not split_compression(fname)[0].endswith(".pickle"):
+            raise NameError("File must have .pickle extension!")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load, fname,
+                                          compression)
+
+    def iterload(self, fname):
         if not fname.endswith(".pickle"):
             raise NameError("File must have .pickle extension!")
-        with open(fname, "rb") as fhandler:
-            byte_seq = fhandler.read()
-            obj = self.loads(byte_seq)
-            return obj
+        for payload in RecordFile(fname):
+            yield self.loads(payload)
+
+    def load_record(self, fname, n):
+        if not fname.endswith(".pickle"):
+            raise NameError("File must have .pickle extension!")
+        return self.loads(RecordFile(fname).read(n))
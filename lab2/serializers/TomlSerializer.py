@@ -1,18 +1,50 @@
+import asyncio
 import inspect
 import types
 import builtins
-import copy
 from collections import deque
 
 from yaml import tokens
 
+from .compression import open_file, split_compression
+from .container import RecordFile
+from .aio import read_file, write_file
+from .codeobj import code_from_dict, code_to_dict, fields_to_code, \
+    is_code_dict
+from .globalref import global_ref, resolve_global
+from .numeric import is_packed_numeric, pack_numeric, unpack_numeric
+
+
+# marks an exhausted iterator on the explicit stacks
+_END = object()
+
+# Tables nested deeper than this are written under a placeholder, like
+# the ones in arrays, so the dotted table names don't grow with the
+# nesting depth (and the document with its square).
+MAX_TABLE_DEPTH = 16
+
 
 class TomlSerializer:
-    def __init__(self):
-        self.builtin_fnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isbuiltin)]
-        self.builtin_cnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isclass)]
+    def __init__(self, globals_by_ref=False, portable_code=False,
+                 trust_foreign_bytecode=False):
+        self.builtin_fnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isbuiltin)}
+        self.builtin_cnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isclass)}
+        # importable module-level classes and functions are written as
+        # "<global module:qualname>" instead of being embedded
+        self.globals_by_ref = globals_by_ref
+        self._globals_cache = {}  # resolved globals of the current document
+        # code objects are written field by field instead of as marshal
+        # data; bytecode isn't portable, another python version only
+        # loads them with trust_foreign_bytecode (see codeobj.py)
+        self.portable_code = portable_code
+        self.trust_foreign_bytecode = trust_foreign_bytecode
+        self._reset_dump_state()
+
+    def _reset_dump_state(self):
+        # state of the document being written, shared by _expand() and
+        # dumps_dict(); it belongs to one _iterdumps() call at a time
         self.serialization_q = deque()
         self.placeholders_q = deque()
         self.ph_iter = self.generate_placeholder()
@@ -54,6 +86,51 @@ class TomlSerializer:
         return res
 
     def _expand(self, obj):
+        # Turns obj into primitives (dict, list, str, ...). Containers are
+        # copied bottom-up with an explicit stack instead of recursion, so
+        # the nesting depth isn't limited and obj itself is never modified.
+        # Dictionaries inside of arrays are replaced with placeholders.
+        stack = []  # [items iterator, expanded items, array type, key]
+        value = obj
+        while True:
+            if isinstance(value, dict):
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (set, frozenset, list, tuple)):
+                res = pack_numeric(value)
+                if res is None:
+                    stack.append([iter(value), [], type(value), None])
+                    res = _END
+            else:
+                res = self._expand_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        if isinstance(res, dict):
+                            # tables can't be put inside of arrays
+                            ph = next(self.ph_iter)
+                            self.placeholders_q.append((ph, res))
+                            res = ph
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _expand_leaf(self, obj):
         if obj is True:
             return True
         elif obj is False:
@@ -64,12 +141,8 @@ class TomlSerializer:
             return str(list(bytearray(obj)))
         elif isinstance(obj, str):
             return obj
-        elif isinstance(obj, (set, frozenset, list, tuple)):
-            return self.expand_list(obj)
-        elif isinstance(obj, dict):
-            return self.expand_dict(obj)
         elif isinstance(obj, types.FunctionType):
-            return self.expand_dict(self.func_to_dict(obj))
+            return self.func_to_dict(obj)
         elif isinstance(obj, types.BuiltinFunctionType):
             if obj.__name__ in self.builtin_fnames:
                 return f"<built-in function {obj.__name__}>"
@@ -87,54 +160,24 @@ class TomlSerializer:
         elif inspect.isclass(obj):
             if obj.__name__ in self.builtin_cnames:
                 return f"<built-in class {obj.__name__}>"
-            return self.expand_dict(self.cls_to_dict(obj))
+            return self.cls_to_dict(obj)
         elif isinstance(obj, types.CellType):   # for closures
             return self._expand(obj.cell_contents)
         elif isinstance(obj, object):
-            return self.expand_dict(self.obj_to_dict(obj))
+            packed = pack_numeric(obj)
+            if packed is not None:
+                return packed
+            return self.obj_to_dict(obj)
         else:
             raise TypeError(f"Object {obj} is not TOML-parsable.")
 
     def expand_list(self, lst):
-        # this can be either of list, tuple, set or frozenset,
-        # so we add an element at the very beginning which will
-        # indictate what it actually is
-        tmplist = list()
-        if isinstance(lst, list):
-            tmplist.append("<list>")
-        elif isinstance(lst, tuple):
-            tmplist.append("<tuple>")
-        elif isinstance(lst, set):
-            tmplist.append("<set>")
-        elif isinstance(lst, frozenset):
-            tmplist.append("<frozenset>")
-        else:
+        if not isinstance(lst, (tuple, list, set, frozenset)):
             raise ValueError(f"Cannot dump toml array from {lst}.")
-        tmplist.extend(list(lst))
-
-        for i in range(len(tmplist)):
-            tmplist[i] = self._expand(tmplist[i])
-            if isinstance(tmplist[i], dict):
-                ph = next(self.ph_iter)
-                self.placeholders_q.append((ph, tmplist[i]))
-                tmplist[i] = ph
-
-        if tmplist[0][0] == '<' and tmplist[0][-1] == '>':
-            if tmplist[0][1:-1] == "frozenset":
-                tmplist = frozenset(tmplist[1:])
-            elif tmplist[0][1:-1] == "tuple":
-                tmplist = tuple(tmplist[1:])
-            elif tmplist[0][1:-1] == "set":
-                tmplist = set(tmplist[1:])
-            else:
-                tmplist = tmplist[1:]
-
-        return tmplist
+        return self._expand(lst)
 
     def expand_dict(self, dct):
-        for key, val in dct.items():
-            dct[key] = self._expand(val)
-        return dct
+        return self._expand(dct)
 
     def split_key(self, full_key):
         if not isinstance(full_key, str):
@@ -196,7 +239,9 @@ class TomlSerializer:
         bases = []
         for base in clsobj.__bases__:
             if base.__name__ != "object":
-                bases.append(self.cls_to_dict(base))
+                ref = global_ref(base) if self.globals_by_ref else None
+                bases.append(ref if ref is not None
+                             else self.cls_to_dict(base))
         clsdict = {}
         attrs = clsobj.__dict__
         for key in attrs:
@@ -220,22 +265,10 @@ class TomlSerializer:
 
     def obj_to_dict(self, obj):
         if isinstance(obj, types.CodeType):
-            return {"co_argcount": obj.co_argcount,
-                    "co_posonlyargcount": obj.co_posonlyargcount,
-                    "co_kwonlyargcount": obj.co_kwonlyargcount,
-                    "co_nlocals": obj.co_nlocals,
-                    "co_stacksize": obj.co_stacksize,
-                    "co_flags": obj.co_flags,
-                    "co_code": str(list(bytearray(obj.co_code))),
-                    "co_consts": self._expand(obj.co_consts),
-                    "co_names": obj.co_names,
-                    "co_varnames": obj.co_varnames,
-                    "co_filename": obj.co_filename,
-                    "co_name": obj.co_name,
-                    "co_firstlineno": obj.co_firstlineno,
-                    "co_lnotab": str(list(bytearray(obj.co_lnotab))),
-                    "co_freevars": self._expand(obj.co_freevars),
-                    "co_cellvars": self._expand(obj.co_cellvars)}
+            res = code_to_dict(obj, portable=self.portable_code)
+            if "co_fields" in res:
+                res["co_fields"]["co_consts"] = self._expand(obj.co_consts)
+            return res
         return {"class": self._expand(self.cls_to_dict(obj.__class__)),
                 "vars": self._expand(obj.__dict__)}
 
@@ -250,7 +283,11 @@ class TomlSerializer:
             elif i in self.builtin_cnames:
                 globs[i] = f"<built-in class {i}>"
             elif i in func.__globals__:
-                if inspect.isclass(func.__globals__[i]):
+                ref = global_ref(func.__globals__[i]) \
+                    if self.globals_by_ref else None
+                if ref is not None:
+                    globs[i] = ref
+                elif inspect.isclass(func.__globals__[i]):
                     globs[i] = self.cls_to_dict(func.__globals__[i])
                 elif inspect.isfunction(func.__globals__[i]):
                     if func.__name__ == i:
@@ -293,7 +330,7 @@ class TomlSerializer:
             .replace("\f", r"\f").replace("\b", "\\b")\
             .replace("\n", r"\n") + '"'
 
-    def dumps_list(self, lst):
+    def _tagged_items(self, lst):
         tmplist = list()
         if isinstance(lst, list):
             tmplist.append("<list>")
@@ -305,36 +342,61 @@ class TomlSerializer:
             tmplist.append("<frozenset>")
         else:
             raise ValueError(f"Cannot dump toml array from {lst}.")
-        tmplist.extend(list(lst))
+        tmplist.extend(lst)
+        return tmplist
 
-        res = "["
-        for el in tmplist:
-            res += " " + self._dumps(el) + ","
-        res = res[:-1]  # gettin rid of the last comma
-        res += " ]"
-        return res
+    def dumps_list(self, lst):
+        # nested arrays are written with an explicit stack of iterators
+        res = []
+        stack = []  # [items iterator, first item]
+        value = lst
+        while True:
+            if isinstance(value, (set, frozenset, list, tuple)):
+                res.append("[")
+                stack.append([iter(self._tagged_items(value)), True])
+            else:
+                res.append(self._dumps(value))
+
+            while stack:
+                frame = stack[-1]
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res.append(" ]")
+                    continue
+                res.append(" " if frame[1] else ", ")
+                frame[1] = False
+                value = item
+                break
+            else:
+                return "".join(res)
 
     def dumps_dict(self, dct):
-        res = ""
+        res = []
         full_name = self.current_table_key
         if full_name:
-            res = f"[{full_name}]\n"
+            res.append(f"[{full_name}]\n")
+        key_seq = self.split_key(full_name)
 
         for key, val in dct.items():
-            if isinstance(val, dict):
+            if isinstance(val, dict) and len(key_seq) >= MAX_TABLE_DEPTH:
+                ph = next(self.ph_iter)
+                self.serialization_q.append(
+                    (self.generate_key("placeholders", ph), val))
+                res.append(f"{self.generate_key(key)} = "
+                           + f"{self.dumps_str(ph)}\n")
+            elif isinstance(val, dict):
                 self.serialization_q.append(
                     (
-                        self.generate_key(
-                            *self.split_key(full_name),
-                            key),
+                        self.generate_key(*key_seq, key),
                         val)
                 )
             else:
                 # full_key = self.generate_key(*self.split_key(key))
                 full_key = self.generate_key(key)
-                res += f"{full_key} = {self._dumps(val)}\n"
-        res += "\n"
-        return res
+                res.append(f"{full_key} = {self._dumps(val)}\n")
+        res.append("\n")
+        return "".join(res)
 
     def _dumps(self, obj):
         if obj is True:
@@ -379,9 +441,9 @@ class TomlSerializer:
         else:
             raise TypeError(f"Object {obj} is not TOML-parsable.")
 
-    def dumps(self, obj):
+    def _toml_dict(self, obj):
+        # the whole document for simple values, the root table otherwise
         toml_dict = dict()  # primitivated dictionary to convert to TOML
-        obj = copy.deepcopy(obj)
 
         if obj is True:
             return "ttype = \"bool\"\ntvalue = true"
@@ -435,21 +497,53 @@ class TomlSerializer:
         toml_dict["placeholders"] = dict()
         while self.placeholders_q:
             el = self.placeholders_q.pop()
-            toml_dict["placeholders"][el[0]] = self._expand(el[1])
+            toml_dict["placeholders"][el[0]] = el[1]
+        return toml_dict
 
-        self.serialization_q.append(("", toml_dict))
-        res = ""
-        while self.serialization_q:
-            el = self.serialization_q.pop()
-            self.current_table_key = el[0]
-            res += self._dumps(el[1])
-        return res
+    def _iterdumps(self, obj):
+        # Yields the document table by table. Subtables only stay
+        # referenced from the queue, so every table can be freed as soon
+        # as it has been written, and the output is never joined here.
+        # The queues are emptied however the generator ends (a write
+        # error, close(), a caller that stops early), and set up anew
+        # here in case an abandoned generator hasn't been collected yet.
+        self._reset_dump_state()
+        try:
+            toml_dict = self._toml_dict(obj)
+            if isinstance(toml_dict, str):
+                yield toml_dict
+                return
+
+            self.serialization_q.append(("", toml_dict))
+            del toml_dict
+            while self.serialization_q:
+                self.current_table_key, table = self.serialization_q.pop()
+                yield self._dumps(table)
+        finally:
+            self._reset_dump_state()
+
+    def dumps(self, obj):
+        return "".join(self._iterdumps(obj))
+
+    def dump(self, obj, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".toml"):
+            raise NameError("File must have .toml extension!")
+        with open_file(fname, "w", compression) as fhandler:
+            for chunk in self._iterdumps(obj):
+                fhandler.write(chunk)
 
-    def dump(self, obj, fname):
+    async def adump(self, obj, fname, compression=None):
+        # tables are emitted and written one by one in an executor
+        if not split_compression(fname)[0].endswith(".toml"):
+            raise NameError("File must have .toml extension!")
+        await write_file(fname, "w", self._iterdumps(obj), compression)
+
+    def append(self, obj, fname):
+        # adds obj as the next record of a container file,
+        # read them back with iterload() or load_record()
         if not fname.endswith(".toml"):
             raise NameError("File must have .toml extension!")
-        with open(fname, "a+") as fhandler:
-            fhandler.write(self.dumps(obj))
+        RecordFile(fname).append(self.dumps(obj).encode())
 
     # DESERIALIZING SECTION #
     def make_special(self, string):
@@ -465,6 +559,8 @@ class TomlSerializer:
                 return string
             elif tokens[0] == 'module':
                 return __import__(tokens[1])
+            elif tokens[0] == 'global':
+                return resolve_global(tokens[1], self._globals_cache)
         elif len(tokens) == 3:
             if tokens[0] != "recursive" and \
                     (tokens[1] == "function"
@@ -518,6 +614,7 @@ class TomlSerializer:
 
         table_encountered = True
         self.current_table_key = ""
+        table_seq = []  # split once per table, not for every line
         toml_dict = dict()
         if lines[0][0] == '[' and lines[0][-1] == ']':
             table_encountered = False
@@ -528,11 +625,8 @@ class TomlSerializer:
                 if table_encountered is False:
                     table_encountered = True
                     self.current_table_key = line[1:-1]
-                    self.set_val(
-                        toml_dict,
-                        self.current_table_key,
-                        dict()
-                        )
+                    table_seq = self.split_key(self.current_table_key)
+                    self.set_val_seq(toml_dict, table_seq, dict())
                 else:
                     raise KeyError("Table has been already encountered!"
                                    + f"Current table key: "
@@ -544,10 +638,8 @@ class TomlSerializer:
                 key, ind = self.parse_key(line)
                 strval = line[ind:].strip()  # string repr of val
                 val, _ = self._parse(strval, 0)
-                key = self.generate_key(
-                    *self.split_key(self.current_table_key),
-                    *self.split_key(key))
-                self.set_val(toml_dict, key, val)
+                self.set_val_seq(toml_dict,
+                                 table_seq + self.split_key(key), val)
 
         # do things to place all placeholders where needed !!!
         if "placeholders" in toml_dict:
@@ -557,30 +649,55 @@ class TomlSerializer:
             del toml_dict["placeholders"]  # we don't need this anymore
         return toml_dict
 
+    def _is_placeholder(self, val):
+        return isinstance(val, str) and len(val) > 2 \
+            and val[0] == '<' and val[-1] == '>' \
+            and val[1: -1].split()[0] == 'placeholder'
+
     def _pullup_placeholders(self, val, ph_dict):
-        if isinstance(val, dict):
-            for key in val:
-                val[key] = self._pullup_placeholders(val[key], ph_dict)
-        elif isinstance(val, (tuple, list, set, frozenset)):
-            val_type = type(val)
-            val_lst = list(val)
-            for i in range(len(val_lst)):
-                val_lst[i] = self._pullup_placeholders(val_lst[i], ph_dict)
-            return val_type(val_lst)
-        elif isinstance(val, str):
-            if not val:
-                return val
-            elif val[0] == '<' and val[-1] == '>':
-                tokens = val[1: -1].split()
-                if tokens[0] == 'placeholder':
-                    ph_dict[val] = self._pullup_placeholders(
-                        ph_dict[val],
-                        ph_dict)
-                    return ph_dict[val]
-        return val
+        # Puts the tables back in place of their placeholders. Walks with
+        # an explicit stack, dictionaries are updated in place and arrays
+        # are rebuilt (tuples and sets can't be changed).
+        stack = []  # [items iterator, new items, array type, key]
+        value = val
+        while True:
+            if self._is_placeholder(value):
+                value = ph_dict[value]
+                continue
+            if isinstance(value, dict):
+                stack.append([iter(list(value.items())), value, None, None])
+                res = _END
+            elif isinstance(value, (tuple, list, set, frozenset)):
+                stack.append([iter(value), [], type(value), None])
+                res = _END
+            else:
+                res = value
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
 
     def set_val(self, dct, full_key, val):
-        key_seq = self.split_key(full_key)
+        self.set_val_seq(dct, self.split_key(full_key), val)
+
+    def set_val_seq(self, dct, key_seq, val):
         curr_dct_lvl = dct
         for key in key_seq[:-1]:
             try:
@@ -594,50 +711,53 @@ class TomlSerializer:
     def parse_tstring(self, tstr, index):
         if tstr[index] != '"':
             raise ValueError(f"This is not a string! String: {tstr}")
-        end_index = index + 1
-
-        try:
-            while True:  # read everything until we get bare " symbol
-                if tstr[end_index] == '\\':  # this one is for sure escaping
-                    end_index += 2
-                    continue
-                if tstr[end_index] == '"':
-                    break
-                end_index += 1
-        except IndexError:
+        # read everything until we get bare " symbol, a quote preceded
+        # by an odd number of backslashes is escaped
+        end_index = tstr.find('"', index + 1)
+        while end_index != -1:
+            backslashes = 0
+            while tstr[end_index - 1 - backslashes] == '\\':
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end_index = tstr.find('"', end_index + 1)
+        if end_index == -1:
             raise IndexError(f"No \" was encountered on the end of string!")
 
         s = tstr[index+1: end_index]
-        # working on escaping symblos
-        res, n, i = [], len(s), 0
-        while i < n:
-            if s[i] == "\\":
-                if i + 1 == n:
-                    break
-                if s[i + 1] == "\\":
-                    res.append("\\")
-                elif s[i + 1] == "n":
-                    res.append("\n")
-                elif s[i + 1] == "r":
-                    res.append("\r")
-                elif s[i + 1] == "t":
-                    res.append("\t")
-                elif s[i + 1] == '"':
-                    res.append('"')
-                elif s[i + 1] == "b":
-                    res.append("\b")
-                elif s[i + 1] == "f":
-                    res.append("\f")
-                elif s[i + 1] == "/":
-                    res.append("/")
+        if "\\" not in s:  # nothing to unescape
+            res = s
+        else:
+            # working on escaping symblos
+            res, n, i = [], len(s), 0
+            while i < n:
+                if s[i] == "\\":
+                    if i + 1 == n:
+                        break
+                    if s[i + 1] == "\\":
+                        res.append("\\")
+                    elif s[i + 1] == "n":
+                        res.append("\n")
+                    elif s[i + 1] == "r":
+                        res.append("\r")
+                    elif s[i + 1] == "t":
+                        res.append("\t")
+                    elif s[i + 1] == '"':
+                        res.append('"')
+                    elif s[i + 1] == "b":
+                        res.append("\b")
+                    elif s[i + 1] == "f":
+                        res.append("\f")
+                    elif s[i + 1] == "/":
+                        res.append("/")
+                    else:
+                        raise ValueError(f"Can't work out this escaping "
+                                         + f"{s[i : i+2]}.")
+                    i += 1
                 else:
-                    raise ValueError(f"Can't work out this escaping "
-                                     + f"{s[i : i+2]}.")
+                    res.append(s[i])
                 i += 1
-            else:
-                res.append(s[i])
-            i += 1
-        res = "".join(res)
+            res = "".join(res)
         if res and res[0] == '<' and res[-1] == '>':
             res = self.make_special(res)  # if string is like "<None>"
         return res, end_index + 1
@@ -735,50 +855,51 @@ class TomlSerializer:
             raise ValueError(f"This is not a valid digit! Result: {res}")
         return type_of_digit(res), end_index + 1
 
+    def _skip_spaces(self, tstr, index):
+        while tstr[index] == ' ':
+            index += 1
+        return index
+
     def parse_tarray(self, tstr, index):
+        # nested arrays are kept on an explicit stack instead of recursing
         if tstr[index] != '[':
             raise ValueError(f"This is not an array! Current index: {index}")
-        end_index = index + 1
 
-        lst = []
-        comma_encountered = False
+        stack = []
         while True:
-            if tstr[end_index] == ']':
-                if not comma_encountered:
-                    break
-                else:
-                    raise ValueError("Unneeded comma at the end!"
-                                     + f"String: {tstr}")
-            elif tstr[end_index] == ',':
-                if not comma_encountered:
-                    comma_encountered = True
-                    end_index += 1
+            if tstr[index] == '[':
+                index = self._skip_spaces(tstr, index + 1)
+                if tstr[index] != ']':
+                    stack.append([])
                     continue
-                else:
-                    raise ValueError(f"Two commas in a row encountered!"
-                                     + f"String: {tstr}")
-            elif tstr[end_index] == ' ':
-                end_index += 1
-                continue
-
-            res, end_index = self._parse(tstr, end_index)
+                res, index = [], index + 1
+            else:
+                res, index = self._parse(tstr, index)
 
-            if len(lst) != 0:
-                if comma_encountered:
-                    lst.append(res)
-                    comma_encountered = False
+            # the element is complete, so it goes to the enclosing array
+            while stack:
+                lst = stack[-1]
+                lst.append(res)
+                index = self._skip_spaces(tstr, index)
+                if tstr[index] == ',':
+                    index = self._skip_spaces(tstr, index + 1)
+                    if tstr[index] == ']':
+                        raise ValueError("Unneeded comma at the end!"
+                                         + f"String: {tstr}")
+                    break
+                elif tstr[index] == ']':
+                    stack.pop()
+                    res, index = self._make_typed_tarray(lst), index + 1
                 else:
                     raise ValueError("One of elements in array is "
-                                     + "not json parsable!"
-                                     + f"Current index: {end_index}")
+                                     + "not toml parsable!"
+                                     + f"Current index: {index}")
             else:
-                lst.append(res)
-        # On this stage we have the fully parsed array.
+                return res, index
+
+    def _make_typed_tarray(self, lst):
         # Now, we want to transfrom it to type needed.
         # Don't forget to get rid of the first element! (if it exists)
-        if not lst:
-            return lst, index + 1
-
         if isinstance(lst[0], str) \
                 and lst[0][0] == '<' \
                 and lst[0][-1] == '>':
@@ -795,7 +916,7 @@ class TomlSerializer:
                                  + "(list, tuple, set, frozenset)"
                                  + "to transfrom to."
                                  + f"Value: {lst}")
-        return lst, end_index + 1
+        return lst
 
     # ACTUALLY GETTING DESERIALIZED OBJECT
     def dict_to_func(self, tobj):
@@ -861,33 +982,18 @@ class TomlSerializer:
         return res
 
     def dict_to_code(self, tobj):
-        codeobj = types.CodeType(tobj["co_argcount"],
-                                 tobj["co_posonlyargcount"],
-                                 tobj["co_kwonlyargcount"],
-                                 tobj["co_nlocals"],
-                                 tobj["co_stacksize"],
-                                 tobj["co_flags"],
-                                 bytes(bytearray(
-                                     self.parse_tarray(
-                                         tobj["co_code"], 0
-                                     )[0]
-                                 )),
-                                 self._deserialize(tobj["co_consts"]),
-                                 tuple(tobj["co_names"]),
-                                 tuple(tobj["co_varnames"]),
-                                 tobj["co_filename"],
-                                 tobj["co_name"],
-                                 tobj["co_firstlineno"],
-                                 bytes(bytearray(
-                                     self.parse_tarray(
-                                         tobj["co_lnotab"], 0
-                                     )[0]
-                                 )),
-                                 tuple(tobj["co_freevars"]),
-                                 tuple(tobj["co_cellvars"]))
-        return codeobj
-
-    def deserialize_tobj(self, tobj):
+        if is_code_dict(tobj):
+            return code_from_dict(tobj, self._deserialize,
+                                  self.trust_foreign_bytecode)
+        # legacy format, bytes fields were written as "[1, 2, ...]"
+        fields = dict(tobj)
+        fields["co_code"] = \
+            bytes(bytearray(self.parse_tarray(tobj["co_code"], 0)[0]))
+        fields["co_lnotab"] = \
+            bytes(bytearray(self.parse_tarray(tobj["co_lnotab"], 0)[0]))
+        return fields_to_code(fields, self._deserialize)
+
+    def _tobj_kind(self, tobj):
         if "co_argcount" in tobj \
                 and "co_posonlyargcount" in tobj \
                 and "co_kwonlyargcount" in tobj \
@@ -904,22 +1010,44 @@ class TomlSerializer:
                 and "co_lnotab" in tobj \
                 and "co_freevars" in tobj \
                 and "co_cellvars" in tobj:
-            res = self.dict_to_code(tobj)
+            return "code"
+        elif is_code_dict(tobj):
+            return "code"
         elif "__globals__" in tobj \
                 and "__name__" in tobj \
                 and "__code__" in tobj:
-            res = self.dict_to_func(tobj)
+            return "function"
         elif "class" in tobj \
                 and "vars" in tobj:
-            res = self.dict_to_obj(tobj)
+            return "object"
         elif "name" in tobj \
                 and "bases" in tobj \
                 and "dict" in tobj:
-            res = self.dict_to_class(tobj)
+            return "class"
         elif "staticmethod" in tobj:
-            res = staticmethod(self.dict_to_func(tobj["staticmethod"]))
+            return "staticmethod"
         elif "classmethod" in tobj:
+            return "classmethod"
+        elif is_packed_numeric(tobj):
+            return "numarray"
+        return None
+
+    def deserialize_tobj(self, tobj):
+        kind = self._tobj_kind(tobj)
+        if kind == "code":
+            res = self.dict_to_code(tobj)
+        elif kind == "function":
+            res = self.dict_to_func(tobj)
+        elif kind == "object":
+            res = self.dict_to_obj(tobj)
+        elif kind == "class":
+            res = self.dict_to_class(tobj)
+        elif kind == "staticmethod":
+            res = staticmethod(self.dict_to_func(tobj["staticmethod"]))
+        elif kind == "classmethod":
             res = classmethod(self.dict_to_func(tobj["classmethod"]))
+        elif kind == "numarray":
+            res = unpack_numeric(tobj)
         else:
             res = {}
             for key, val in tobj.items():
@@ -933,10 +1061,46 @@ class TomlSerializer:
         return type(tobj)(res)
 
     def _deserialize(self, tobj):
+        # Plain arrays and dictionaries are rebuilt bottom-up with an
+        # explicit stack instead of recursion, so the nesting depth isn't
+        # limited by the interpreter. Everything else goes to
+        # _deserialize_leaf (functions, classes, objects are rebuilt there).
+        stack = []  # [items iterator, rebuilt items, array type, key]
+        value = tobj
+        while True:
+            if isinstance(value, dict) and self._tobj_kind(value) is None:
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                stack.append([iter(value), [], type(value), None])
+                res = _END
+            else:
+                res = self._deserialize_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _deserialize_leaf(self, tobj):
         if isinstance(tobj, dict):
-            res = self.deserialize_tobj(tobj)
-        elif isinstance(tobj, (list, tuple, set, frozenset)):
-            res = self.deserialize_tarr(tobj)
+            return self.deserialize_tobj(tobj)
         elif isinstance(tobj, str) and len(tobj) != 0:
             if tobj[0] == '<' and tobj[-1] == '>':
                 tokens = tobj[1: -1].split(' ')
@@ -975,13 +1139,35 @@ class TomlSerializer:
         if not isinstance(string, str):
             raise TypeError("Argument must be a string! "
                             + f"Type: {type(string)}")
+        self._globals_cache = {}
         toml_dict = self._deserialize(self._evaluate(string))
         return toml_dict["tvalue"]
 
-    def load(self, fname):
-        if not fname.endswith(".toml"):
+    def load(self, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".toml"):
             raise NameError("File must have .toml extension!")
-        with open(fname, "r") as fhandler:
+        with open_file(fname, "r", compression) as fhandler:
             text = fhandler.read()
             obj = self.loads(text)
             return obj
+
+    async def aload(self, fname, compression=None):
+        # the file is read in chunks in an executor and then parsed
+        # there as a whole, this parser needs the whole document; the
+        # event loop is never blocked
+        if not split_compression(fname)[0].endswith(".toml"):
+            raise NameError("File must have .toml extension!")
+        text = await read_file(fname, "r", compression)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.loads, text)
+
+    def iterload(self, fname):
+        if not fname.endswith(".toml"):
+            raise NameError("File must have .toml extension!")
+        for payload in RecordFile(fname):
+            yield self.loads(payload.decode())
+
+    def load_record(self, fname, n):
+        if not fname.endswith(".toml"):
+            raise NameError("File must have .toml extension!")
+        return self.loads(RecordFile(fname).read(n).decode())
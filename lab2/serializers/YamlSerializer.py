@@ -1,20 +1,152 @@
+import asyncio
 import inspect
+import io
+import itertools
 import types
 import builtins
-import copy
 import math
 import yaml
 
+from .compression import open_file, split_compression
+from .container import RecordFile
+from .aio import split_chunks, write_file
+from .codeobj import code_from_dict, code_to_dict, fields_to_code, \
+    is_code_dict
+from .globalref import global_ref, resolve_global
+from .numeric import is_packed_numeric, pack_numeric, unpack_numeric
+
+
+# marks an exhausted iterator on the explicit stacks
+_END = object()
+
+# PyYAML's representer, composer and constructor recurse on every level,
+# only its emitter and parser don't. Deep documents are turned into
+# events and built back from them here instead, see _emit_nested() and
+# _load_nested(). They are written in flow style on a single line, in
+# block style the indentation grows with every level; even so PyYAML's
+# scanners take time growing with the square of the depth to read them
+# back, so deeper documents than this are refused.
+MAX_DEPTH = 10000
+FLOW_WIDTH = 2 ** 31 - 1  # no line breaks
+
+SEQ_TAG = "tag:yaml.org,2002:seq"
+MAP_TAG = "tag:yaml.org,2002:map"
+SET_TAG = "tag:yaml.org,2002:set"
+OMAP_TAGS = ("tag:yaml.org,2002:omap", "tag:yaml.org,2002:pairs")
+MERGE_TAG = "tag:yaml.org,2002:merge"
+
+# the "<<" key of a mapping while it's being loaded
+_MERGE = object()
+
+
+# The expanded documents only hold plain data, so the safe loader and
+# dumper are enough once they know tuples and frozensets. The tags are
+# the ones yaml.Dumper writes, so older files still load.
+TUPLE_TAG = "tag:yaml.org,2002:python/tuple"
+FROZENSET_TAG = "tag:yaml.org,2002:python/object/apply:builtins.frozenset"
+
+
+def _represent_tuple(dumper, data):
+    return dumper.represent_sequence(TUPLE_TAG, data)
+
+
+def _represent_frozenset(dumper, data):
+    return dumper.represent_sequence(FROZENSET_TAG, [list(data)])
+
+
+def _construct_tuple(loader, node):
+    return tuple(loader.construct_sequence(node, deep=True))
+
+
+def _construct_frozenset(loader, node):
+    args = loader.construct_sequence(node, deep=True)
+    return frozenset(args[0]) if args else frozenset()
+
+
+def _make_loader(base):
+    loader = type("Loader", (base,), {})
+    loader.add_constructor(TUPLE_TAG, _construct_tuple)
+    loader.add_constructor(FROZENSET_TAG, _construct_frozenset)
+    return loader
+
+
+def _make_dumper(base):
+    dumper = type("Dumper", (base,), {})
+    dumper.add_representer(tuple, _represent_tuple)
+    dumper.add_representer(frozenset, _represent_frozenset)
+    return dumper
+
+
+PyLoader = _make_loader(yaml.SafeLoader)
+PyDumper = _make_dumper(yaml.SafeDumper)
+if yaml.__with_libyaml__:  # PyYAML was built with libyaml
+    CLoader = _make_loader(yaml.CSafeLoader)
+    CDumper = _make_dumper(yaml.CSafeDumper)
+else:
+    CLoader, CDumper = PyLoader, PyDumper
+
 
 class YamlSerializer:
     # SERIALIZING SECTION #
-    def __init__(self):
-        self.builtin_fnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isbuiltin)]
-        self.builtin_cnames = [el[0] for el in
-                               inspect.getmembers(builtins, inspect.isclass)]
+    def __init__(self, globals_by_ref=False, use_libyaml=True,
+                 portable_code=False, trust_foreign_bytecode=False):
+        # use_libyaml=False forces the pure python loader and dumper
+        self._loader = CLoader if use_libyaml else PyLoader
+        self._dumper = CDumper if use_libyaml else PyDumper
+        self.builtin_fnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isbuiltin)}
+        self.builtin_cnames = {el[0] for el in
+                               inspect.getmembers(builtins, inspect.isclass)}
+        # importable module-level classes and functions are written as
+        # "<global module:qualname>" instead of being embedded
+        self.globals_by_ref = globals_by_ref
+        self._globals_cache = {}  # resolved globals of the current document
+        # code objects are written field by field instead of as marshal
+        # data; bytecode isn't portable, another python version only
+        # loads them with trust_foreign_bytecode (see codeobj.py)
+        self.portable_code = portable_code
+        self.trust_foreign_bytecode = trust_foreign_bytecode
 
     def _expand(self, obj):
+        # Turns obj into primitives (dict, list, str, ...). Containers are
+        # copied bottom-up with an explicit stack instead of recursion, so
+        # the nesting depth isn't limited and obj itself is never modified.
+        stack = []  # [items iterator, expanded items, array type, key]
+        value = obj
+        while True:
+            if isinstance(value, dict):
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (set, frozenset, list, tuple)):
+                res = pack_numeric(value)
+                if res is None:
+                    stack.append([iter(value), [], type(value), None])
+                    res = _END
+            else:
+                res = self._expand_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _expand_leaf(self, obj):
         if obj is True:
             return True
         elif obj is False:
@@ -25,12 +157,8 @@ class YamlSerializer:
             return str(list(bytearray(obj)))
         elif isinstance(obj, str):
             return obj
-        elif isinstance(obj, (set, frozenset, list, tuple)):
-            return self.expand_list(obj)
-        elif isinstance(obj, dict):
-            return self.expand_dict(obj)
         elif isinstance(obj, types.FunctionType):
-            return self.expand_dict(self.func_to_dict(obj))
+            return self.func_to_dict(obj)
         elif isinstance(obj, types.BuiltinFunctionType):
             if obj.__name__ in self.builtin_fnames:
                 return f"<built-in function {obj.__name__}>"
@@ -48,34 +176,32 @@ class YamlSerializer:
         elif inspect.isclass(obj):
             if obj.__name__ in self.builtin_cnames:
                 return f"<built-in class {obj.__name__}>"
-            return self.expand_dict(self.cls_to_dict(obj))
+            return self.cls_to_dict(obj)
         elif isinstance(obj, types.CellType):   # for closures
             return self._expand(obj.cell_contents)
         elif isinstance(obj, object):
-            return self.expand_dict(self.obj_to_dict(obj))
+            packed = pack_numeric(obj)
+            if packed is not None:
+                return packed
+            return self.obj_to_dict(obj)
         else:
             raise TypeError(f"Object {obj} is not PICKLE-parsable.")
 
     def expand_list(self, lst):
         if not isinstance(lst, (tuple, list, set, frozenset)):
             raise ValueError(f"Cannot dump toml array from {lst}.")
-        lst_type = type(lst)
-        tmplist = list(lst)
-
-        for i in range(len(tmplist)):
-            tmplist[i] = self._expand(tmplist[i])
-        return lst_type(tmplist)
+        return self._expand(lst)
 
     def expand_dict(self, dct):
-        for key, val in dct.items():
-            dct[key] = self._expand(val)
-        return dct
+        return self._expand(dct)
 
     def cls_to_dict(self, clsobj):
         bases = []
         for base in clsobj.__bases__:
             if base.__name__ != "object":
-                bases.append(self.cls_to_dict(base))
+                ref = global_ref(base) if self.globals_by_ref else None
+                bases.append(ref if ref is not None
+                             else self.cls_to_dict(base))
         clsdict = {}
         attrs = clsobj.__dict__
         for key in attrs:
@@ -99,22 +225,10 @@ class YamlSerializer:
 
     def obj_to_dict(self, obj):
         if isinstance(obj, types.CodeType):
-            return {"co_argcount": obj.co_argcount,
-                    "co_posonlyargcount": obj.co_posonlyargcount,
-                    "co_kwonlyargcount": obj.co_kwonlyargcount,
-                    "co_nlocals": obj.co_nlocals,
-                    "co_stacksize": obj.co_stacksize,
-                    "co_flags": obj.co_flags,
-                    "co_code": str(list(bytearray(obj.co_code))),
-                    "co_consts": self._expand(obj.co_consts),
-                    "co_names": obj.co_names,
-                    "co_varnames": obj.co_varnames,
-                    "co_filename": obj.co_filename,
-                    "co_name": obj.co_name,
-                    "co_firstlineno": obj.co_firstlineno,
-                    "co_lnotab": str(list(bytearray(obj.co_lnotab))),
-                    "co_freevars": self._expand(obj.co_freevars),
-                    "co_cellvars": self._expand(obj.co_cellvars)}
+            res = code_to_dict(obj, portable=self.portable_code)
+            if "co_fields" in res:
+                res["co_fields"]["co_consts"] = self._expand(obj.co_consts)
+            return res
         return {"class": self._expand(self.cls_to_dict(obj.__class__)),
                 "vars": self._expand(obj.__dict__)}
 
@@ -129,7 +243,11 @@ class YamlSerializer:
             elif i in self.builtin_cnames:
                 globs[i] = f"<built-in class {i}>"
             elif i in func.__globals__:
-                if inspect.isclass(func.__globals__[i]):
+                ref = global_ref(func.__globals__[i]) \
+                    if self.globals_by_ref else None
+                if ref is not None:
+                    globs[i] = ref
+                elif inspect.isclass(func.__globals__[i]):
                     globs[i] = self.cls_to_dict(func.__globals__[i])
                 elif inspect.isfunction(func.__globals__[i]):
                     if func.__name__ == i:
@@ -167,21 +285,162 @@ class YamlSerializer:
                 self._expand(func.__kwdefaults__)}
 
     def dumps(self, obj):
-        t_obj = copy.deepcopy(obj)
-        return yaml.dump(self._expand(t_obj))
+        expanded = self._expand(obj)
+        try:
+            return yaml.dump(expanded, Dumper=self._dumper)
+        except RecursionError:
+            return self._emit_nested(expanded)
 
-    def dump(self, obj, fname):
-        if not fname.endswith(".yaml"):
+    def _emit_nested(self, expanded):
+        stream = io.StringIO()
+        dumper = self._dumper(stream, default_flow_style=True,
+                              width=FLOW_WIDTH)
+        try:
+            dumper.emit(yaml.StreamStartEvent())
+            dumper.emit(yaml.DocumentStartEvent())
+            for event in self._events(dumper, expanded):
+                dumper.emit(event)
+            dumper.emit(yaml.DocumentEndEvent())
+            dumper.emit(yaml.StreamEndEvent())
+        finally:
+            dumper.dispose()
+        return stream.getvalue()
+
+    def _events(self, dumper, expanded):
+        # The events yaml.dump() would emit for expanded (in flow style,
+        # without anchors), walked with an explicit stack. Scalars still
+        # go through the dumper's representer, they don't nest.
+        stack = []  # [items iterator, end events]
+        level = 0
+        value = expanded
+        while True:
+            if isinstance(value, dict):
+                start = [(MAP_TAG, yaml.MappingStartEvent)]
+                items = list(value.items())
+                if dumper.sort_keys:
+                    try:
+                        items.sort()
+                    except TypeError:
+                        pass
+                items = itertools.chain.from_iterable(items)
+            elif isinstance(value, (set, frozenset)):
+                if isinstance(value, frozenset):
+                    start = [(FROZENSET_TAG, yaml.SequenceStartEvent),
+                             (SEQ_TAG, yaml.SequenceStartEvent)]
+                    items = iter(value)
+                else:
+                    start = [(SET_TAG, yaml.MappingStartEvent)]
+                    items = itertools.chain.from_iterable(
+                        (item, None) for item in value)
+            elif isinstance(value, (list, tuple)):
+                start = [(SEQ_TAG if isinstance(value, list) else TUPLE_TAG,
+                          yaml.SequenceStartEvent)]
+                items = iter(value)
+            else:
+                node = dumper.represent_data(value)
+                implicit = (
+                    node.tag == dumper.resolve(yaml.ScalarNode, node.value,
+                                               (True, False)),
+                    node.tag == dumper.resolve(yaml.ScalarNode, node.value,
+                                               (False, True)))
+                yield yaml.ScalarEvent(None, node.tag, implicit, node.value,
+                                       style=node.style)
+                start = None
+
+            if start is not None:
+                level += len(start)
+                if level > MAX_DEPTH:
+                    raise ValueError("Document is nested more than "
+                                     + f"{MAX_DEPTH} levels deep, YAML is "
+                                     + f"limited to {MAX_DEPTH}.")
+                ends = []
+                for tag, event in start:
+                    if event is yaml.MappingStartEvent:
+                        node_class, ends = yaml.MappingNode, \
+                            [yaml.MappingEndEvent] + ends
+                    else:
+                        node_class, ends = yaml.SequenceNode, \
+                            [yaml.SequenceEndEvent] + ends
+                    implicit = tag == dumper.resolve(node_class, None, True)
+                    yield event(None, tag, implicit, flow_style=True)
+                stack.append([items, ends])
+
+            while stack:
+                frame = stack[-1]
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    level -= len(frame[1])
+                    for event in frame[1]:
+                        yield event()
+                    continue
+                value = item
+                break
+            else:
+                return
+
+    def dump(self, obj, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".yaml"):
             raise NameError("File must have .yaml extension!")
-        with open(fname, "a+") as fhandler:
+        with open_file(fname, "w", compression) as fhandler:
             fhandler.write(self.dumps(obj))
 
+    async def adump(self, obj, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".yaml"):
+            raise NameError("File must have .yaml extension!")
+        loop = asyncio.get_running_loop()
+        data = await loop.run_in_executor(None, self.dumps, obj)
+        await write_file(fname, "w", split_chunks(data), compression)
+
+    def append(self, obj, fname):
+        # adds obj as the next record of a container file,
+        # read them back with iterload() or load_record()
+        if not fname.endswith(".yaml"):
+            raise NameError("File must have .yaml extension!")
+        RecordFile(fname).append(self.dumps(obj).encode())
+
     # DESERIALIZING SECTION #
     def _deserialize(self, obj):
+        # Plain arrays and dictionaries are rebuilt bottom-up with an
+        # explicit stack instead of recursion, so the nesting depth isn't
+        # limited by the interpreter. Everything else goes to
+        # _deserialize_leaf (functions, classes, objects are rebuilt there).
+        stack = []  # [items iterator, rebuilt items, array type, key]
+        value = obj
+        while True:
+            if isinstance(value, dict) and self._obj_kind(value) is None:
+                stack.append([iter(value.items()), {}, None, None])
+                res = _END
+            elif isinstance(value, (list, tuple, set, frozenset)):
+                stack.append([iter(value), [], type(value), None])
+                res = _END
+            else:
+                res = self._deserialize_leaf(value)
+
+            while stack:
+                frame = stack[-1]
+                if res is not _END:
+                    if frame[2] is None:
+                        frame[1][frame[3]] = res
+                    else:
+                        frame[1].append(res)
+                item = next(frame[0], _END)
+                if item is _END:
+                    stack.pop()
+                    res = frame[1] if frame[2] is None \
+                        else frame[2](frame[1])
+                    continue
+                if frame[2] is None:
+                    frame[3], value = item
+                else:
+                    value = item
+                break
+            else:
+                return res
+
+    def _deserialize_leaf(self, obj):
         if isinstance(obj, dict):
-            res = self.deserialize_obj(obj)
-        elif isinstance(obj, (list, tuple, set, frozenset)):
-            res = self.deserialize_arr(obj)
+            return self.deserialize_obj(obj)
         elif isinstance(obj, str) and len(obj) != 0:
             if obj[0] == '<' and obj[-1] == '>':
                 tmp = obj[1: -1].split(' ')
@@ -198,6 +457,8 @@ class YamlSerializer:
                         module = __import__(module_name)
                         module_attr = getattr(module, name)
                         return module_attr
+                elif len(tmp) == 2 and tmp[0] == "global":
+                    return resolve_global(tmp[1], self._globals_cache)
                 elif len(tmp) == 2:
                     module_name = tmp[1]
                     try:
@@ -220,7 +481,7 @@ class YamlSerializer:
             res.append(self._deserialize(el))
         return type(obj)(res)
 
-    def deserialize_obj(self, obj):
+    def _obj_kind(self, obj):
         if "co_argcount" in obj \
                 and "co_posonlyargcount" in obj \
                 and "co_kwonlyargcount" in obj \
@@ -237,22 +498,44 @@ class YamlSerializer:
                 and "co_lnotab" in obj \
                 and "co_freevars" in obj \
                 and "co_cellvars" in obj:
-            res = self.dict_to_code(obj)
+            return "code"
+        elif is_code_dict(obj):
+            return "code"
         elif "__globals__" in obj \
                 and "__name__" in obj \
                 and "__code__" in obj:
-            res = self.dict_to_func(obj)
+            return "function"
         elif "class" in obj \
                 and "vars" in obj:
-            res = self.dict_to_obj(obj)
+            return "object"
         elif "name" in obj \
                 and "bases" in obj \
                 and "dict" in obj:
-            res = self.dict_to_class(obj)
+            return "class"
         elif "staticmethod" in obj:
-            res = staticmethod(self.dict_to_func(obj["staticmethod"]))
+            return "staticmethod"
         elif "classmethod" in obj:
+            return "classmethod"
+        elif is_packed_numeric(obj):
+            return "numarray"
+        return None
+
+    def deserialize_obj(self, obj):
+        kind = self._obj_kind(obj)
+        if kind == "code":
+            res = self.dict_to_code(obj)
+        elif kind == "function":
+            res = self.dict_to_func(obj)
+        elif kind == "object":
+            res = self.dict_to_obj(obj)
+        elif kind == "class":
+            res = self.dict_to_class(obj)
+        elif kind == "staticmethod":
+            res = staticmethod(self.dict_to_func(obj["staticmethod"]))
+        elif kind == "classmethod":
             res = classmethod(self.dict_to_func(obj["classmethod"]))
+        elif kind == "numarray":
+            res = unpack_numeric(obj)
         else:
             res = {}
             for key, val in obj.items():
@@ -322,34 +605,187 @@ class YamlSerializer:
         return res
 
     def dict_to_code(self, obj):
-        codeobj = types.CodeType(obj["co_argcount"],
-                                 obj["co_posonlyargcount"],
-                                 obj["co_kwonlyargcount"],
-                                 obj["co_nlocals"],
-                                 obj["co_stacksize"],
-                                 obj["co_flags"],
-                                 bytes(bytearray(eval(obj["co_code"]))),
-                                 self._deserialize(obj["co_consts"]),
-                                 tuple(obj["co_names"]),
-                                 tuple(obj["co_varnames"]),
-                                 obj["co_filename"],
-                                 obj["co_name"],
-                                 obj["co_firstlineno"],
-                                 bytes(bytearray(eval(obj["co_lnotab"]))),
-                                 tuple(obj["co_freevars"]),
-                                 tuple(obj["co_cellvars"]))
-        return codeobj
+        if is_code_dict(obj):
+            return code_from_dict(obj, self._deserialize,
+                                  self.trust_foreign_bytecode)
+        # legacy format, bytes fields were written as "[1, 2, ...]"
+        fields = dict(obj)
+        fields["co_code"] = \
+            bytes(bytearray(eval(obj["co_code"])))
+        fields["co_lnotab"] = \
+            bytes(bytearray(eval(obj["co_lnotab"])))
+        return fields_to_code(fields, self._deserialize)
 
     def loads(self, ystr):
         if not isinstance(ystr, str):
             raise TypeError("Argument must be a string! "
                             + f"Type: {type(ystr)}")
-        return self._deserialize(yaml.load(ystr.encode(), yaml.Loader))
+        return self._load(ystr.encode())
+
+    def _load(self, data):
+        # data is the document's bytes or a file the parser reads
+        # piece by piece as it goes
+        self._globals_cache = {}
+        # libyaml's composer is C code recursing without any limit, a
+        # deep enough document crashes the interpreter; its events are
+        # taken instead, that's as fast. The pure python composer raises
+        # RecursionError.
+        if self._loader is not PyLoader:
+            loaded = self._load_nested(data)
+        else:
+            try:
+                loaded = yaml.load(data, self._loader)
+            except RecursionError:
+                if not isinstance(data, bytes):
+                    data.seek(0)
+                loaded = self._load_nested(data)
+        return self._deserialize(loaded)
+
+    def _load_nested(self, data):
+        # What yaml.load() returns, built from the parser's events with an
+        # explicit stack. Scalars still go through the loader's
+        # constructor, they don't nest.
+        loader = self._loader(data)
+        try:
+            stack = []  # [tag, items, anchor, start mark]
+            anchors = {}
+            res = None
+            documents = 0
+            while loader.check_event():
+                event = loader.get_event()
+                if isinstance(event, yaml.DocumentStartEvent):
+                    documents += 1
+                    if documents > 1:
+                        raise yaml.composer.ComposerError(
+                            "expected a single document in the stream",
+                            None, "but found another document",
+                            event.start_mark)
+                    continue
+                elif isinstance(event, yaml.AliasEvent):
+                    if event.anchor not in anchors:
+                        raise yaml.composer.ComposerError(
+                            None, None, f"found undefined alias "
+                            + f"{event.anchor!r}", event.start_mark)
+                    value = anchors[event.anchor]
+                elif isinstance(event, yaml.ScalarEvent):
+                    tag = event.tag
+                    if tag is None or tag == "!":
+                        tag = loader.resolve(yaml.ScalarNode, event.value,
+                                             event.implicit)
+                    if tag == MERGE_TAG:
+                        value = _MERGE
+                    else:
+                        value = loader.construct_object(yaml.ScalarNode(
+                            tag, event.value, event.start_mark,
+                            event.end_mark, style=event.style))
+                    if event.anchor is not None:
+                        anchors[event.anchor] = value
+                elif isinstance(event, (yaml.SequenceStartEvent,
+                                        yaml.MappingStartEvent)):
+                    node_class = yaml.SequenceNode \
+                        if isinstance(event, yaml.SequenceStartEvent) \
+                        else yaml.MappingNode
+                    tag = event.tag
+                    if tag is None or tag == "!":
+                        tag = loader.resolve(node_class, None,
+                                             event.implicit)
+                    stack.append([tag, [], event.anchor, event.start_mark])
+                    if len(stack) > MAX_DEPTH:
+                        raise ValueError("Document is nested more than "
+                                         + f"{MAX_DEPTH} levels deep, YAML "
+                                         + f"is limited to {MAX_DEPTH}.")
+                    continue
+                elif isinstance(event, (yaml.SequenceEndEvent,
+                                        yaml.MappingEndEvent)):
+                    tag, items, anchor, mark = stack.pop()
+                    value = self._collection(tag, items, mark)
+                    if anchor is not None:
+                        anchors[anchor] = value
+                else:  # start and end of the stream, end of the document
+                    continue
+
+                if stack:
+                    stack[-1][1].append(value)
+                else:
+                    res = value
+            return res
+        finally:
+            loader.dispose()
+
+    def _collection(self, tag, items, mark):
+        # items are the values of a sequence, the keys and values of a
+        # mapping one after another
+        if tag == SEQ_TAG:
+            return items
+        elif tag == TUPLE_TAG:
+            return tuple(items)
+        elif tag == FROZENSET_TAG:
+            return frozenset(items[0]) if items else frozenset()
+        elif tag in OMAP_TAGS:
+            if not all(isinstance(item, dict) and len(item) == 1
+                       for item in items):
+                raise yaml.constructor.ConstructorError(
+                    f"while constructing {tag}", mark,
+                    "expected mappings of a single key", mark)
+            return [pair for item in items for pair in item.items()]
+        elif tag not in (MAP_TAG, SET_TAG):
+            raise yaml.constructor.ConstructorError(
+                None, None, "could not determine a constructor for the "
+                + f"tag {tag!r}", mark)
+        pairs = list(zip(items[::2], items[1::2]))
+        try:
+            if tag == SET_TAG:
+                return {key for key, _ in pairs}
+            if any(key is _MERGE for key, _ in pairs):
+                return self._merge(pairs, mark)
+            return dict(pairs)
+        except TypeError as error:
+            raise yaml.constructor.ConstructorError(
+                "while constructing a mapping", mark,
+                f"found unhashable key ({error})", mark) from None
 
-    def load(self, fname):
+    def _merge(self, pairs, mark):
+        # "<<: *a" and "<<: [*a, *b]" like SafeConstructor.flatten_mapping:
+        # the merged keys come first, the mapping's own and those of the
+        # earlier mappings of a list win
+        res = {}
+        for key, value in pairs:
+            if key is not _MERGE:
+                continue
+            merged = reversed(value) if isinstance(value, list) else [value]
+            for other in merged:
+                if not isinstance(other, dict):
+                    raise yaml.constructor.ConstructorError(
+                        "while constructing a mapping", mark,
+                        "expected a mapping or list of mappings for "
+                        + "merging", mark)
+                res.update(other)
+        res.update((key, value) for key, value in pairs
+                   if key is not _MERGE)
+        return res
+
+    def load(self, fname, compression=None):
+        if not split_compression(fname)[0].endswith(".yaml"):
+            raise NameError("File must have .yaml extension!")
+        with open_file(fname, "r", compression) as fhandler:
+            return self._load(fhandler)
+
+    async def aload(self, fname, compression=None):
+        # load() runs in an executor, reading and parsing the file
+        # piece by piece there, so the event loop is never blocked
+        if not split_compression(fname)[0].endswith(".yaml"):
+            raise NameError("File must have .yaml extension!")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.load, fname,
+                                          compression)
+
+    def iterload(self, fname):
         if not fname.endswith(".yaml"):
             raise NameError("File must have .yaml extension!")
-        with open(fname, "r") as fhandler:
-            text = fhandler.read()
-            obj = self.loads(text)
-            return obj
+        for payload in RecordFile(fname):
+            yield self.loads(payload.decode())
+
+    def load_record(self, fname, n):
+        if not fname.endswith(".yaml"):
+            raise NameError("File must have .yaml extension!")
+        return self.loads(RecordFile(fname).read(n).decode())
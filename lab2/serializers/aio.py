@@ -0,0 +1,59 @@
+import asyncio
+
+from .compression import open_file
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def _write_some(fhandler, chunks):
+    # Writes chunks until about CHUNK_SIZE was written, returns False
+    # once the iterator is exhausted. The iterator itself is advanced
+    # here too, so lazy encoders don't run on the event loop thread.
+    size = 0
+    for chunk in chunks:
+        fhandler.write(chunk)
+        size += len(chunk)
+        if size >= CHUNK_SIZE:
+            return True
+    return False
+
+
+async def read_file(fname, mode, compression=None):
+    # Reads the whole file in CHUNK_SIZE pieces, every blocking call
+    # goes to the default executor of the running loop. For the parsers
+    # that need the whole document (json, toml); pickle and yaml read
+    # the file themselves as they parse it.
+    loop = asyncio.get_running_loop()
+    fhandler = await loop.run_in_executor(None, open_file, fname, mode,
+                                          compression)
+    try:
+        chunks = []
+        while True:
+            chunk = await loop.run_in_executor(None, fhandler.read,
+                                               CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    finally:
+        await loop.run_in_executor(None, fhandler.close)
+    return (b"" if "b" in mode else "").join(chunks)
+
+
+async def write_file(fname, mode, chunks, compression=None):
+    # chunks is any iterable of str/bytes, it's consumed in
+    # the executor batch by batch
+    loop = asyncio.get_running_loop()
+    chunks = iter(chunks)
+    fhandler = await loop.run_in_executor(None, open_file, fname, mode,
+                                          compression)
+    try:
+        while await loop.run_in_executor(None, _write_some, fhandler,
+                                         chunks):
+            pass
+    finally:
+        await loop.run_in_executor(None, fhandler.close)
+
+
+def split_chunks(data):
+    return (data[i: i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE))
@@ -0,0 +1,80 @@
+import hashlib
+import os
+import shutil
+
+from . import __version__
+
+
+CHUNK_SIZE = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as fhandler:
+        for chunk in iter(lambda: fhandler.read(CHUNK_SIZE), b""):
+            content_hash.update(chunk)
+    return content_hash.hexdigest()
+
+
+def default_cache_dir() -> str:
+    base = os.environ.get("XDG_CACHE_HOME") \
+        or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "s-tool", "convert")
+
+
+class ConversionCache:
+    # On-disk cache of converted files. Entries are named by a hash of
+    # (source content, source format, target format, compression,
+    # tool version), so a changed source or a new release never hits
+    # a stale entry. Entry mtimes are bumped on every hit and the least
+    # recently used entries are evicted once the cache outgrows max_size.
+    def __init__(self, cache_dir=None, max_size=256 * 1024 * 1024):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+
+    def make_key(self, source_path, old_ext, new_ext, compression=None):
+        key = "\0".join([file_sha256(source_path), old_ext, new_ext,
+                         compression or "", __version__])
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key, target_path) -> bool:
+        # copies the cached conversion to target_path, if there is one
+        entry = self._entry_path(key)
+        try:
+            shutil.copyfile(entry, target_path)
+        except FileNotFoundError:
+            return False
+        os.utime(entry)
+        return True
+
+    def put(self, key, produced_path):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        entry = self._entry_path(key)
+        tmp_entry = f"{entry}.{os.getpid()}.tmp"
+        shutil.copyfile(produced_path, tmp_entry)
+        os.replace(tmp_entry, entry)  # readers never see a partial entry
+        self.evict()
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.is_file() or entry.name.endswith(".tmp"):
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
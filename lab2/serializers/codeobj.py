@@ -0,0 +1,136 @@
+import base64
+import functools
+import importlib.util
+import marshal
+import sys
+import warnings
+
+
+# Code objects are written as
+#     {"co_python": CODE_TAG, "co_marshal": ...}
+# and rebuilt from the marshal data in one call, which only works on an
+# interpreter with the same tag. With portable=True they are written as
+#     {"co_python": CODE_TAG, "co_fields": {...}}
+# instead and rebuilt field by field with code.replace(), taking only
+# the fields the reading interpreter knows about. That survives changes
+# of the code object's layout, not of the bytecode in co_code: it's
+# only loaded where the magic number (the bytecode version) of the tag
+# is the same, unless the reader passes trust_foreign_bytecode=True.
+# The two forms aren't combined: the marshal data already holds the
+# nested code objects of co_consts, next to the fields every nesting
+# level would be repeated.
+CODE_TAG = f"{sys.implementation.cache_tag}:" \
+    + importlib.util.MAGIC_NUMBER.hex()
+
+# every field some python version has, the ones this interpreter
+# doesn't accept in code.replace() are left out below
+ALL_FIELDS = ("co_argcount", "co_posonlyargcount", "co_kwonlyargcount",
+              "co_nlocals", "co_stacksize", "co_flags", "co_code",
+              "co_consts", "co_names", "co_varnames", "co_filename",
+              "co_name", "co_qualname", "co_firstlineno", "co_lnotab",
+              "co_linetable", "co_exceptiontable", "co_freevars",
+              "co_cellvars")
+
+BYTES_FIELDS = {"co_code", "co_lnotab", "co_linetable", "co_exceptiontable"}
+
+
+def _template():
+    return (lambda: None).__code__
+
+
+def _replace_fields():
+    template = _template()
+    fields = []
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)  # co_lnotab
+        for name in ALL_FIELDS:
+            try:
+                template.replace(**{name: getattr(template, name)})
+            except (AttributeError, TypeError, ValueError):
+                continue
+            fields.append(name)
+    return tuple(fields)
+
+
+REPLACE_FIELDS = _replace_fields()
+
+
+def _encode_bytes(data, binary):
+    return data if binary else base64.b64encode(data).decode("ascii")
+
+
+def _decode_bytes(data):
+    return data if isinstance(data, bytes) else base64.b64decode(data)
+
+
+def is_code_dict(obj):
+    return "co_python" in obj \
+        and ("co_marshal" in obj or "co_fields" in obj)
+
+
+def code_to_dict(codeobj, binary=False, portable=False):
+    # bytes fields are base64 encoded unless binary is set (for pickle),
+    # co_consts is left as is for the serializer to expand
+    if not portable:
+        return {"co_python": CODE_TAG,
+                "co_marshal": _encode_bytes(marshal.dumps(codeobj), binary)}
+    fields = {}
+    for name in REPLACE_FIELDS:
+        value = getattr(codeobj, name)
+        if name in BYTES_FIELDS:
+            value = _encode_bytes(value, binary)
+        fields[name] = value
+    return {"co_python": CODE_TAG, "co_fields": fields}
+
+
+@functools.lru_cache(maxsize=1024)
+def _unmarshal(data):
+    # code objects are immutable, so functions loaded from the same
+    # bytecode can share one
+    return marshal.loads(_decode_bytes(data))
+
+
+def fields_to_code(fields, deserialize_consts):
+    # Field-wise path, also used for the legacy format (16 fields of the
+    # python 3.8 code() signature). Fields this interpreter needs but the
+    # writer didn't have get empty line/exception tables.
+    kwargs = {}
+    for name in REPLACE_FIELDS:
+        if name in fields:
+            value = fields[name]
+        elif name in BYTES_FIELDS:
+            value = b""
+        elif name == "co_qualname":
+            value = fields["co_name"]
+        else:
+            raise ValueError(f"Code object field {name} is missing.")
+
+        if name in BYTES_FIELDS:
+            value = _decode_bytes(value)
+        elif name == "co_consts":
+            value = tuple(deserialize_consts(value))
+        elif isinstance(value, list):
+            value = tuple(value)
+        kwargs[name] = value
+    return _template().replace(**kwargs)
+
+
+def _magic(tag):
+    return tag.rpartition(":")[2]
+
+
+def code_from_dict(obj, deserialize_consts, trust_foreign_bytecode=False):
+    if "co_marshal" in obj:
+        if obj["co_python"] != CODE_TAG:
+            raise ValueError(f"Code object was written by {obj['co_python']}"
+                             + f", can't be loaded by {CODE_TAG}; "
+                             + "dump it with portable_code=True.")
+        return _unmarshal(obj["co_marshal"])
+    # bytecode of another version may misbehave or crash when it runs
+    if _magic(obj["co_python"]) != _magic(CODE_TAG) \
+            and not trust_foreign_bytecode:
+        raise ValueError(f"Code object was written by {obj['co_python']}, "
+                         + f"its bytecode may not run on {CODE_TAG}; load "
+                         + "it with trust_foreign_bytecode=True to take "
+                         + "it anyway.")
+    return fields_to_code(obj["co_fields"], deserialize_consts)
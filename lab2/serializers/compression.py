@@ -0,0 +1,50 @@
+import bz2
+import gzip
+import lzma
+
+
+# compression name -> (file suffix, opener), stdlib only
+COMPRESSORS = {
+    "gzip": (".gz", gzip.open),
+    "bz2": (".bz2", bz2.open),
+    "lzma": (".xz", lzma.open),
+}
+
+SUFFIXES = {
+    ".gz": "gzip",
+    ".bz2": "bz2",
+    ".xz": "lzma",
+    ".lzma": "lzma",
+}
+
+
+def split_compression(fname: str):
+    # "a/b.json.gz" -> ("a/b.json", "gzip"), "a/b.json" -> ("a/b.json", None)
+    for suffix, compression in SUFFIXES.items():
+        if fname.endswith(suffix):
+            return fname[: -len(suffix)], compression
+    return fname, None
+
+
+def compression_suffix(compression):
+    if compression is None:
+        return ""
+    if compression not in COMPRESSORS:
+        raise NameError(f"No such compression found: {compression}")
+    return COMPRESSORS[compression][0]
+
+
+def open_file(fname: str, mode: str, compression=None):
+    # Works like open(), but the file is transparently (de)compressed
+    # when compression is given or can be guessed from the suffix.
+    # The stdlib openers compress while writing, so the whole
+    # compressed document is never kept in memory.
+    if compression is None:
+        compression = split_compression(fname)[1]
+    if compression is None:
+        return open(fname, mode)
+    if compression not in COMPRESSORS:
+        raise NameError(f"No such compression found: {compression}")
+    if "b" not in mode and "t" not in mode:
+        mode += "t"
+    return COMPRESSORS[compression][1](fname, mode)
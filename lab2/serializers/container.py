@@ -0,0 +1,161 @@
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:  # no flock on Windows, appends aren't locked there
+    fcntl = None
+
+
+class RecordFile:
+    # Append-only container for several serialized documents.
+    # Layout of the file:
+    #     MAGIC
+    #     b"R" + payload length (8 bytes, big-endian) + payload   <- record
+    #     ...
+    #     b"I" + count + count * record offset                    <- index
+    #     index offset + INDEX_MAGIC                              <- footer
+    # The trailing index is optional, records can always be found
+    # by skipping from one header to the next. append() only ever adds
+    # a record at the end of the file, it doesn't touch the index: an
+    # index followed by more records is stale and skipped, readers scan
+    # until write_index() is called again. So write_index() is meant to
+    # run once, when the appending is done.
+    # Writers hold an exclusive flock on the file, readers a shared one.
+    MAGIC = b"SREC\x00\x01"
+    INDEX_MAGIC = b"SIDX"
+    RECORD_TAG = b"R"
+    INDEX_TAG = b"I"
+    _number = struct.Struct(">Q")
+    _footer = struct.Struct(">Q4s")
+
+    def __init__(self, fname):
+        self.fname = fname
+
+    def _open(self, mode):
+        fhandler = open(self.fname, mode)
+        if fcntl is not None:
+            fcntl.flock(fhandler, fcntl.LOCK_SH if mode == "rb"
+                        else fcntl.LOCK_EX)
+        if "r" in mode and fhandler.read(len(self.MAGIC)) != self.MAGIC:
+            fhandler.close()
+            raise ValueError(f"{self.fname} is not a record container!")
+        return fhandler
+
+    def _read_exactly(self, fhandler, size):
+        data = fhandler.read(size)
+        if len(data) != size:
+            raise ValueError(f"{self.fname} is truncated at "
+                             + f"{fhandler.tell()}, "
+                             + "was a write interrupted?")
+        return data
+
+    def _read_number(self, fhandler):
+        return self._number.unpack(
+            self._read_exactly(fhandler, self._number.size))[0]
+
+    def _skip_index(self, fhandler):
+        # the file is positioned after the tag of a stale index
+        count = self._read_number(fhandler)
+        fhandler.seek(count * self._number.size + self._footer.size,
+                      os.SEEK_CUR)
+
+    def _next_record(self, fhandler):
+        # positions the file after the header of the next record and
+        # returns its payload length, None at the end of the records
+        while True:
+            tag = fhandler.read(1)
+            if tag == self.RECORD_TAG:
+                return self._read_number(fhandler)
+            if tag != self.INDEX_TAG:
+                return None
+            self._skip_index(fhandler)
+
+    def _read_index(self, fhandler):
+        # returns (index offset, record offsets) or None
+        fhandler.seek(0, os.SEEK_END)
+        size = fhandler.tell()
+        if size < len(self.MAGIC) + self._footer.size:
+            return None
+        fhandler.seek(size - self._footer.size)
+        offset, magic = self._footer.unpack(fhandler.read(self._footer.size))
+        if magic != self.INDEX_MAGIC or offset >= size:
+            return None
+        fhandler.seek(offset)
+        if fhandler.read(1) != self.INDEX_TAG:
+            return None
+        count = self._read_number(fhandler)
+        if offset + 1 + self._number.size * (count + 1) \
+                + self._footer.size != size:
+            return None
+        offsets = [self._read_number(fhandler) for _ in range(count)]
+        return offset, offsets
+
+    def _write_index(self, fhandler, offsets):
+        index_offset = fhandler.tell()
+        fhandler.write(self.INDEX_TAG + self._number.pack(len(offsets)))
+        fhandler.write(b"".join(self._number.pack(el) for el in offsets))
+        fhandler.write(self._footer.pack(index_offset, self.INDEX_MAGIC))
+
+    def _scan_offsets(self, fhandler):
+        # walks over the record headers without reading the payloads
+        offsets = []
+        size = fhandler.seek(0, os.SEEK_END)
+        fhandler.seek(len(self.MAGIC))
+        while True:
+            length = self._next_record(fhandler)
+            if length is None:
+                return offsets
+            offset = fhandler.tell() - 1 - self._number.size
+            if fhandler.tell() + length > size:
+                self._read_exactly(fhandler, length)  # raises
+            offsets.append(offset)
+            fhandler.seek(length, os.SEEK_CUR)
+
+    def append(self, payload):
+        # "ab" is O_APPEND, the record is written with one call at the
+        # end of the file whatever other appenders did meanwhile
+        with self._open("ab") as fhandler:
+            # the size is taken under the lock, two appenders creating
+            # the file don't both write MAGIC
+            if fhandler.seek(0, os.SEEK_END) == 0:
+                fhandler.write(self.MAGIC)
+            fhandler.write(self.RECORD_TAG + self._number.pack(len(payload))
+                           + payload)
+
+    def write_index(self):
+        with self._open("r+b") as fhandler:
+            if self._read_index(fhandler) is not None:
+                return
+            offsets = self._scan_offsets(fhandler)
+            fhandler.seek(0, os.SEEK_END)
+            self._write_index(fhandler, offsets)
+
+    def __len__(self):
+        with self._open("rb") as fhandler:
+            index = self._read_index(fhandler)
+            if index is not None:
+                return len(index[1])
+            return len(self._scan_offsets(fhandler))
+
+    def __iter__(self):
+        with self._open("rb") as fhandler:
+            while True:
+                length = self._next_record(fhandler)
+                if length is None:
+                    return
+                yield self._read_exactly(fhandler, length)
+
+    def read(self, n):
+        with self._open("rb") as fhandler:
+            index = self._read_index(fhandler)
+            offsets = index[1] if index is not None \
+                else self._scan_offsets(fhandler)
+            try:
+                offset = offsets[n]
+            except IndexError:
+                raise IndexError(f"No record {n} in {self.fname}, "
+                                 + f"records: {len(offsets)}")
+            fhandler.seek(offset + 1)
+            return self._read_exactly(fhandler,
+                                      self._read_number(fhandler))
@@ -0,0 +1,42 @@
+import importlib
+
+
+def _lookup(module_name, qualname):
+    obj = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def global_ref(obj):
+    # "<global module:qualname>" when obj can be imported back by name,
+    # None for everything defined locally or in __main__ (those are
+    # embedded as before)
+    module_name = getattr(obj, "__module__", None)
+    qualname = getattr(obj, "__qualname__", None)
+    if not isinstance(module_name, str) or not isinstance(qualname, str) \
+            or module_name == "__main__" \
+            or "<" in qualname or " " in qualname:
+        return None
+    try:
+        if _lookup(module_name, qualname) is not obj:
+            return None
+    except (ImportError, AttributeError):
+        return None
+    return f"<global {module_name}:{qualname}>"
+
+
+def resolve_global(ref, cache):
+    # ref is "module:qualname", cache holds what was already resolved
+    # while loading the current document
+    try:
+        return cache[ref]
+    except KeyError:
+        pass
+    module_name, _, qualname = ref.partition(":")
+    try:
+        obj = _lookup(module_name, qualname)
+    except (ImportError, AttributeError):
+        raise NameError(f"Cannot resolve global {ref}.")
+    cache[ref] = obj
+    return obj
@@ -1,14 +1,22 @@
 from serializers.packer import Packer
+from serializers.cache import ConversionCache
+from serializers.compression import COMPRESSORS, SUFFIXES, \
+    compression_suffix, split_compression
+from serializers.watcher import Watcher
 import argparse
 import os
 
 
+FORMATS = ("json", "toml", "yaml", "pickle")
+
+
 class Config:
     def __init__(self, conf: dict):
         self.source_path = conf["source path"]
         self.old_ext = get_extension(conf["source path"])
         self.target_path = conf["target path"]
         self.new_ext = conf["new extension"]
+        self.compression = conf.get("compression")
 
 
 def create_argument_parser() -> argparse.ArgumentParser:
@@ -37,11 +45,97 @@ def create_argument_parser() -> argparse.ArgumentParser:
         dest="cfg_path",
         help="Path to config file (all other arguments will be ignored)")
 
+    cmd_parser.add_argument(
+        "--compress",
+        type=str,
+        dest="compression",
+        choices=sorted(COMPRESSORS),
+        help="Compress converted file (compressed sources are detected"
+             + " by their suffix, e.g. .json.gz)")
+
+    cmd_parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        dest="no_cache",
+        help="Always convert, don't use the conversion cache")
+
+    cmd_parser.add_argument(
+        "--cache-dir",
+        type=str,
+        dest="cache_dir",
+        help="Conversion cache directory")
+
+    cmd_parser.add_argument(
+        "--cache-size",
+        type=int,
+        dest="cache_size",
+        default=256,
+        help="Conversion cache size limit in megabytes")
+
+    cmd_parser.add_argument(
+        "--watch",
+        type=str,
+        dest="watch_dir",
+        help="Keep converting changed files of this directory"
+             + " (--ofp and --cfg are ignored)")
+
+    cmd_parser.add_argument(
+        "--interval",
+        type=float,
+        dest="interval",
+        default=1.0,
+        help="Polling interval of --watch in seconds")
+
     return cmd_parser
 
 
 def get_extension(fp: str) -> str:
-    return os.path.splitext(fp)[1][1:]
+    return os.path.splitext(split_compression(fp)[0])[1][1:]
+
+
+def get_target_path(config: Config) -> str:
+    source_name = split_compression(os.path.split(config.source_path)[1])[0]
+    return config.target_path \
+        + os.path.splitext(source_name)[0] \
+        + '.' + config.new_ext \
+        + compression_suffix(config.compression)
+
+
+def convert(config: Config, ser_fabric: Packer, cache=None) -> str:
+    new_path = get_target_path(config)
+    if cache is not None:
+        key = cache.make_key(config.source_path, config.old_ext,
+                             config.new_ext, config.compression)
+        if cache.get(key, new_path):
+            return new_path
+
+    deserializer = ser_fabric.create_serializer(config.old_ext)
+    serializer = ser_fabric.create_serializer(config.new_ext)
+
+    obj = deserializer.load(config.source_path)
+    serializer.dump(obj, new_path, config.compression)
+    if cache is not None:
+        cache.put(key, new_path)
+    return new_path
+
+
+def watch(cmd_args, ser_fabric: Packer, cache=None):
+    if cmd_args.new_dir_path is None or cmd_args.new_ext is None:
+        raise ValueError("Missing one of arguments: --np, --ext")
+    new_ext = cmd_args.new_ext.lower()
+    extensions = tuple(f".{ext}{suffix}"
+                       for ext in FORMATS if ext != new_ext
+                       for suffix in ("", *SUFFIXES))
+
+    def convert_file(source_path):
+        return convert(Config({"source path": source_path,
+                               "target path": cmd_args.new_dir_path,
+                               "new extension": new_ext,
+                               "compression": cmd_args.compression}),
+                       ser_fabric, cache)
+
+    Watcher(cmd_args.watch_dir, cmd_args.new_dir_path,
+            convert_file, extensions).run(cmd_args.interval)
 
 
 def main():
@@ -49,6 +143,18 @@ def main():
     cmd_args = create_argument_parser().parse_args()
     conf_dict = None
 
+    cache = None
+    if not cmd_args.no_cache:
+        cache = ConversionCache(cmd_args.cache_dir,
+                                cmd_args.cache_size * 1024 * 1024)
+
+    if cmd_args.watch_dir is not None:
+        try:
+            watch(cmd_args, ser_fabric, cache)
+        except Exception as e:
+            print(e)
+        return
+
     if cmd_args.cfg_path is not None:
         config_reader = ser_fabric\
                 .create_serializer(get_extension(cmd_args.cfg_path))
@@ -66,24 +172,20 @@ def main():
             config = Config({
                     "source path": cmd_args.old_file_fullpath,
                     "target path": cmd_args.new_dir_path,
-                    "new extension": cmd_args.new_ext.lower()
+                    "new extension": cmd_args.new_ext.lower(),
+                    "compression": cmd_args.compression
                 })
     except Exception as e:
         print(e)
         exit()
 
     try:
-        if config.old_ext == config.new_ext:
+        if config.old_ext == config.new_ext \
+                and split_compression(config.source_path)[1] \
+                == config.compression:
             raise ValueError("Same extensions provided.")
 
-        deserializer = ser_fabric.create_serializer(config.old_ext)
-        serializer = ser_fabric.create_serializer(config.new_ext)
-
-        obj = deserializer.load(config.source_path)
-        new_path = config.target_path \
-            + os.path.splitext(os.path.split(config.source_path)[1])[0] \
-            + '.' + config.new_ext
-        serializer.dump(obj, new_path)
+        new_path = convert(config, ser_fabric, cache)
         print(f"New file path: {new_path}")
     except Exception as e:
         print(e)
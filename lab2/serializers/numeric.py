@@ -0,0 +1,113 @@
+import array
+import base64
+import sys
+
+
+# shorter sequences are cheaper to write element by element
+MIN_LENGTH = 16
+
+# typecodes whose item size depends on the platform are stored
+# as the fixed-size one, so the data reads back anywhere
+SIGNED_TYPECODES = {1: "b", 2: "h", 4: "i", 8: "q"}
+UNSIGNED_TYPECODES = {1: "B", 2: "H", 4: "I", 8: "Q"}
+
+
+def _canonical(arr):
+    if arr.typecode in "fd":
+        return arr
+    if arr.typecode in "bhilq":
+        typecode = SIGNED_TYPECODES[arr.itemsize]
+    else:
+        typecode = UNSIGNED_TYPECODES[arr.itemsize]
+    if typecode == arr.typecode:
+        return arr
+    res = array.array(typecode)
+    res.frombytes(arr.tobytes())
+    return res
+
+
+def _sequence_to_array(seq):
+    # homogeneous int or float sequence -> array.array, None otherwise
+    if len(seq) < MIN_LENGTH:
+        return None
+    item_type = type(seq[0])
+    if item_type is float:
+        typecode = "d"
+    elif item_type is int:
+        typecode = "q"
+    else:
+        return None
+    for item in seq:
+        if type(item) is not item_type:
+            return None
+    try:
+        return array.array(typecode, seq)
+    except OverflowError:  # ints that don't fit into 64 bits
+        return None
+
+
+def _buffer_to_array(obj):
+    try:
+        view = memoryview(obj)
+    except TypeError:
+        return None
+    if view.format not in array.typecodes or view.format == "u":
+        return None
+    res = array.array(view.format)
+    res.frombytes(view.tobytes())
+    return res
+
+
+def pack_numeric(obj, binary=False):
+    # Returns a numeric sequence as one typed block:
+    #     {"numarray": "list" | "tuple" | "array",
+    #      "typecode": ..., "data": ...}
+    # Data is little-endian and base64 encoded, or raw bytes when
+    # binary is set (for pickle). Returns None for anything else,
+    # which is then written element by element as before.
+    if type(obj) is list or type(obj) is tuple:
+        arr = _sequence_to_array(obj)
+        kind = type(obj).__name__
+    elif isinstance(obj, array.array):
+        arr = obj if obj.typecode != "u" else None
+        kind = "array"
+    elif isinstance(obj, (str, bytes, bytearray)):
+        return None
+    else:
+        arr = _buffer_to_array(obj)
+        kind = "array"
+    if arr is None:
+        return None
+
+    arr = _canonical(arr)
+    if sys.byteorder == "big":
+        arr = array.array(arr.typecode, arr)
+        arr.byteswap()
+    data = arr.tobytes()
+    if not binary:
+        data = base64.b64encode(data).decode("ascii")
+    return {"numarray": kind, "typecode": arr.typecode, "data": data}
+
+
+def is_packed_numeric(obj):
+    return "numarray" in obj \
+        and "typecode" in obj \
+        and "data" in obj
+
+
+def unpack_numeric(obj):
+    data = obj["data"]
+    if isinstance(data, str):
+        data = base64.b64decode(data)
+    arr = array.array(obj["typecode"])
+    arr.frombytes(data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+
+    if obj["numarray"] == "list":
+        return arr.tolist()
+    elif obj["numarray"] == "tuple":
+        return tuple(arr.tolist())
+    elif obj["numarray"] == "array":
+        return arr
+    raise ValueError(f"Unknown numeric array kind: {obj['numarray']}")
@@ -1,3 +1,6 @@
+import asyncio
+import threading
+
 from .JsonSerializer import JsonSerializer
 from .TomlSerializer import TomlSerializer
 from .YamlSerializer import YamlSerializer
@@ -18,3 +21,60 @@ class Packer:
             return PickleSerializer()
         else:
             raise NameError(f"No such serializer found: {ser_type}")
+
+
+# one serializer per thread and format, TomlSerializer (and the caches
+# of the others) keep state between calls, so instances aren't shared
+_thread_serializers = threading.local()
+
+
+def local_serializer(ser_type: str):
+    serializers = getattr(_thread_serializers, "serializers", None)
+    if serializers is None:
+        serializers = _thread_serializers.serializers = {}
+    key = ser_type.lower().strip()
+    serializer = serializers.get(key)
+    if serializer is None:
+        serializer = serializers[key] = Packer().create_serializer(key)
+    return serializer
+
+
+def _pooled_dumps(ser_type, obj):
+    return local_serializer(ser_type).dumps(obj)
+
+
+def _pooled_loads(ser_type, data):
+    return local_serializer(ser_type).loads(data)
+
+
+class SerializerPool:
+    # Thread-safe front of one format: every thread calling dumps/loads
+    # gets its own serializer. adumps/aloads run them in an executor
+    # (the event loop's default thread pool unless one is given), so
+    # they don't block the event loop. The serializers are pure python
+    # and hold the GIL, so threads keep the loop responsive but don't
+    # add throughput; a ProcessPoolExecutor does, as long as the objects
+    # can be sent to the workers with the stdlib pickle.
+    def __init__(self, ser_type: str, executor=None):
+        Packer().create_serializer(ser_type)  # fails early on bad types
+        self.ser_type = ser_type
+        self.executor = executor
+
+    def get(self):
+        return local_serializer(self.ser_type)
+
+    def dumps(self, obj):
+        return _pooled_dumps(self.ser_type, obj)
+
+    def loads(self, data):
+        return _pooled_loads(self.ser_type, data)
+
+    async def adumps(self, obj):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _pooled_dumps,
+                                          self.ser_type, obj)
+
+    async def aloads(self, data):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, _pooled_loads,
+                                          self.ser_type, data)
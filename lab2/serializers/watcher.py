@@ -0,0 +1,98 @@
+import json
+import os
+import time
+
+from .cache import file_sha256
+
+
+class Watcher:
+    # Polls a source directory and re-converts only the files that have
+    # changed since their last conversion. What was converted, and from
+    # which content, is kept in a manifest in the target directory, so
+    # nothing is redone after a restart either. A file counts as changed
+    # when its size or mtime differ and its content hash differs too
+    # (a plain touch doesn't trigger a conversion).
+    MANIFEST_NAME = ".convert-manifest.json"
+
+    def __init__(self, source_dir, target_dir, convert_file,
+                 extensions, manifest_path=None):
+        # convert_file(source path) -> target path
+        self.source_dir = source_dir
+        self.target_dir = target_dir
+        self.convert_file = convert_file
+        self.extensions = extensions
+        self.manifest_path = manifest_path \
+            or os.path.join(target_dir, self.MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, "r") as fhandler:
+                return json.load(fhandler)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w") as fhandler:
+            json.dump(self.manifest, fhandler, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _source_files(self):
+        manifest_path = os.path.abspath(self.manifest_path)
+        with os.scandir(self.source_dir) as it:
+            for entry in it:
+                if entry.is_file() \
+                        and entry.name.endswith(self.extensions) \
+                        and os.path.abspath(entry.path) != manifest_path:
+                    yield entry.path, entry.stat()
+
+    def poll(self):
+        # one pass over the source directory, returns converted paths
+        converted = []
+        seen = set()
+        manifest_changed = False
+        for path, stat in self._source_files():
+            seen.add(path)
+            entry = self.manifest.get(path)
+            if entry is not None \
+                    and entry["mtime_ns"] == stat.st_mtime_ns \
+                    and entry["size"] == stat.st_size \
+                    and os.path.exists(entry["target"]):
+                continue
+
+            content_hash = file_sha256(path)
+            if entry is None or entry["sha256"] != content_hash \
+                    or not os.path.exists(entry["target"]):
+                try:
+                    target = self.convert_file(path)
+                except Exception as e:
+                    print(f"{path}: {e}")
+                    continue
+                converted.append(target)
+            else:
+                target = entry["target"]
+
+            self.manifest[path] = {"mtime_ns": stat.st_mtime_ns,
+                                   "size": stat.st_size,
+                                   "sha256": content_hash,
+                                   "target": target}
+            manifest_changed = True
+
+        for path in list(self.manifest):
+            if path not in seen:
+                del self.manifest[path]
+                manifest_changed = True
+
+        if manifest_changed:
+            self._save_manifest()
+        return converted
+
+    def run(self, interval=1.0):
+        try:
+            while True:
+                for target in self.poll():
+                    print(f"New file path: {target}")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
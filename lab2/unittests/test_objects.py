@@ -76,13 +76,35 @@ class MyClass:
 myclass_obj = MyClass()
 
 
+# for test_globals_by_ref()
+def make_a_fact(a):  # uses a global class and a global function
+    return A().check_prop2()[0] + fact(a)
+
+
+class B(A):
+    pass
+
+
 # for test_files()
+dumpings_dir = "./unittests/dumpings"
 filepath_j = "./unittests/dumpings/fact.json"
 filepath_t = "./unittests/dumpings/fact.toml"
 filepath_p = "./unittests/dumpings/fact.pickle"
 filepath_y = "./unittests/dumpings/fact.yaml"
 expected_fact_ans = 720
 
+# for test_conversion_cache()
+cache_dir = "./unittests/dumpings/cache"
+
+# for test_watcher()
+watch_dir = "./unittests/dumpings/watch"
+
+# for test_records()
+container_path_j = "./unittests/dumpings/records.json"
+container_path_t = "./unittests/dumpings/records.toml"
+container_path_p = "./unittests/dumpings/records.pickle"
+container_path_y = "./unittests/dumpings/records.yaml"
+
 # for test_dict()
 dct = {
         "builtin_class": ArithmeticError,
@@ -1,5 +1,19 @@
+import array
+import asyncio
+import os
+import sys
+import threading
+import yaml
 import unittest
-from serializers.packer import Packer
+from serializers.packer import Packer, SerializerPool
+from serializers.YamlSerializer import MAX_DEPTH as YAML_MAX_DEPTH, \
+    YamlSerializer
+from serializers.JsonSerializer import JsonSerializer
+from serializers import codeobj
+from serializers.container import RecordFile
+from serializers.cache import ConversionCache
+from serializers.main import Config, convert
+from serializers.watcher import Watcher
 from unittests.test_objects import *
 
 
@@ -12,6 +26,10 @@ class SerializerTester(unittest.TestCase):
         self.toml_serializer = factory.create_serializer("toml")
         self.yaml_serializer = factory.create_serializer("yaml")
 
+    @classmethod
+    def setUpClass(cls):
+        os.makedirs(dumpings_dir, exist_ok=True)
+
     def test_none(self):
         jobj = self.json_serializer.loads(
                 self.json_serializer.dumps(none_obj))
@@ -168,3 +186,360 @@ class SerializerTester(unittest.TestCase):
         self.assertEquals(pobj, ArithmeticError)
         self.assertEquals(tobj, ArithmeticError)
         self.assertEquals(yobj, ArithmeticError)
+
+    def test_parallel_loads(self):
+        jstr = self.json_serializer.dumps(dct)
+        jobj = self.json_serializer.loads(jstr, workers=2)
+        self.assertEqual(jobj, dct)
+
+        jstr = self.json_serializer.dumps(iterable_obj)
+        jobj = self.json_serializer.loads(jstr, workers=2)
+        self.assertEqual(jobj, iterable_obj)
+
+        # many children in a few batches, the array type tag kept
+        for obj in ({f"key {i}": [i, str(i)] for i in range(1000)},
+                    tuple(map(str, range(1000))), (None, [1], {"a": (2,)})):
+            jstr = self.json_serializer.dumps(obj)
+            self.assertEqual(self.json_serializer.loads(jstr, workers=3), obj)
+        self.assertEqual(self.json_serializer.loads('[1, [2], {"a": 3}]',
+                                                    workers=2),
+                         [1, [2], {"a": 3}])
+
+    def test_records(self):
+        serializers = ((self.json_serializer, container_path_j),
+                       (self.pickle_serializer, container_path_p),
+                       (self.toml_serializer, container_path_t),
+                       (self.yaml_serializer, container_path_y))
+        for serializer, fname in serializers:
+            if os.path.exists(fname):
+                os.remove(fname)
+            serializer.append(dct, fname)
+            serializer.append(iterable_obj, fname)
+            RecordFile(fname).write_index()
+            serializer.append(none_obj, fname)
+
+            self.assertEqual(list(serializer.iterload(fname)),
+                             [dct, iterable_obj, none_obj])
+            self.assertEqual(serializer.load_record(fname, 1), iterable_obj)
+            self.assertEqual(serializer.load_record(fname, 2), none_obj)
+            self.assertEqual(len(RecordFile(fname)), 3)
+
+            RecordFile(fname).write_index()
+            self.assertEqual(serializer.load_record(fname, 2), none_obj)
+
+            # a record cut short by an interrupted write
+            serializer.append(dct, fname)
+            with open(fname, "rb+") as fhandler:
+                fhandler.truncate(os.path.getsize(fname) - 1)
+            with self.assertRaises(ValueError):
+                list(RecordFile(fname))
+            with self.assertRaises(ValueError):
+                RecordFile(fname).read(3)
+
+    def test_compressed_files(self):
+        serializers = ((self.json_serializer, filepath_j),
+                       (self.pickle_serializer, filepath_p),
+                       (self.toml_serializer, filepath_t),
+                       (self.yaml_serializer, filepath_y))
+        for serializer, fname in serializers:
+            for suffix in (".gz", ".bz2", ".xz"):
+                serializer.dump(dct, fname + suffix)
+                self.assertEqual(serializer.load(fname + suffix), dct)
+
+            serializer.dump(dct, fname, compression="gzip")
+            self.assertEqual(serializer.load(fname, compression="gzip"), dct)
+
+    def test_conversion_cache(self):
+        cache = ConversionCache(cache_dir, max_size=1024 * 1024)
+        self.json_serializer.dump(dct, filepath_j)
+        config = Config({"source path": filepath_j,
+                         "target path": dumpings_dir + "/",
+                         "new extension": "yaml"})
+        key = cache.make_key(filepath_j, "json", "yaml")
+        if os.path.exists(os.path.join(cache_dir, key)):
+            os.remove(os.path.join(cache_dir, key))
+
+        new_path = convert(config, Packer(), cache)
+        self.assertTrue(os.path.exists(os.path.join(cache_dir, key)))
+        os.remove(new_path)
+        self.assertTrue(cache.get(key, new_path))
+        self.assertEqual(self.yaml_serializer.load(new_path), dct)
+
+        cache.max_size = 0
+        cache.evict()
+        self.assertFalse(cache.get(key, new_path))
+
+    def test_watcher(self):
+        os.makedirs(watch_dir, exist_ok=True)
+        for name in os.listdir(watch_dir):
+            os.remove(os.path.join(watch_dir, name))
+        source_1 = os.path.join(watch_dir, "first.json")
+        source_2 = os.path.join(watch_dir, "second.json")
+        self.json_serializer.dump(dct, source_1)
+        self.json_serializer.dump(iterable_obj, source_2)
+
+        def convert_file(source_path):
+            return convert(Config({"source path": source_path,
+                                   "target path": watch_dir + "/",
+                                   "new extension": "yaml"}), Packer())
+
+        watcher = Watcher(watch_dir, watch_dir, convert_file, (".json",))
+        self.assertEqual(len(watcher.poll()), 2)
+        self.assertEqual(watcher.poll(), [])
+
+        os.utime(source_1, ns=(0, 0))  # touched, but not changed
+        self.assertEqual(watcher.poll(), [])
+
+        self.json_serializer.dump(none_obj, source_2)
+        watcher = Watcher(watch_dir, watch_dir, convert_file, (".json",))
+        converted = watcher.poll()
+        self.assertEqual(converted, [os.path.join(watch_dir, "second.yaml")])
+        self.assertEqual(self.yaml_serializer.load(converted[0]), none_obj)
+
+    def _nested(self, depth):
+        lst, dct = [], {}
+        for i in range(depth):
+            lst, dct = [i, (lst,)], {"value": i, "next": dct}
+        return lst, dct
+
+    def _assert_nested(self, lst, dct, depth):
+        for i in reversed(range(depth)):
+            self.assertEqual(lst[0], i)
+            self.assertIsInstance(lst[1], tuple)
+            self.assertEqual(dct["value"], i)
+            lst, dct = lst[1][0], dct["next"]
+        self.assertEqual(lst, [])
+        self.assertEqual(dct, {})
+
+    def test_deep_nesting(self):
+        recursion_limit = sys.getrecursionlimit()
+        depth = 100000
+        lst, dct = self._nested(depth)
+        # indentation would grow quadratically with the depth
+        for serializer in (JsonSerializer(indent=None), self.toml_serializer,
+                           self.pickle_serializer):
+            self._assert_nested(serializer.loads(serializer.dumps(lst)),
+                                serializer.loads(serializer.dumps(dct)),
+                                depth)
+
+        # YAML up to its limit, every level here is a list and a tuple
+        depth = YAML_MAX_DEPTH // 2 - 1
+        lst, dct = self._nested(depth)
+        for serializer in (self.yaml_serializer,
+                           YamlSerializer(use_libyaml=False)):
+            self._assert_nested(serializer.loads(serializer.dumps(lst)),
+                                serializer.loads(serializer.dumps(dct)),
+                                depth)
+        with self.assertRaises(ValueError):
+            self.yaml_serializer.dumps(self._nested(depth + 1)[0])
+        # refused while parsing, libyaml's own composer would crash
+        with self.assertRaises(ValueError):
+            self.yaml_serializer.loads("[" * 100000 + "]" * 100000)
+
+        # out-of-band buffers of a document pickled in segments
+        depth = 1000
+        lst = self._nested(depth)[0]
+        buffers = []
+        data = self.pickle_serializer.dumps([lst, bytes(1 << 16)],
+                                            buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 1)
+        raw = buffers[0].raw()
+        loaded = self.pickle_serializer.loads(data, buffers=[raw])
+        self._assert_nested(loaded[0], self._nested(depth)[1], depth)
+        self.assertIs(loaded[1], raw)
+        self.assertEqual(sys.getrecursionlimit(), recursion_limit)
+
+    def test_compact_json(self):
+        compact = JsonSerializer(indent=None)
+        self.assertEqual(compact.dumps({"a": [1, 2.5, (None, "x")], "b": {}}),
+                         '{"a":["list",1,2.5,["tuple",null,"x"]],"b":{}}')
+        spaced = JsonSerializer(indent=None, separators=(", ", ": "))
+        self.assertEqual(spaced.dumps([1, {"b": True}]),
+                         '["list", 1, {"b": true}]')
+        for serializer in (compact, spaced):
+            self.assertEqual(serializer.loads(serializer.dumps(dct)), dct)
+        self.assertEqual(compact.loads('{\t"a" :\r\n [\t"tuple", 1 ,2]\r\n}'),
+                         {"a": (1, 2)})
+
+    def test_numeric_arrays(self):
+        obj = {"floats": [i * 0.25 for i in range(100)],
+               "ints": tuple(range(-50, 50)),
+               "array": array.array("l", range(30)),
+               "buffer": memoryview(array.array("f", [1.5] * 20)),
+               "short": [1, 2, 3],
+               "mixed": [1, 2.5] * 10,
+               "huge": [2 ** 70] * 20}
+        expected = dict(obj, buffer=array.array("f", [1.5] * 20))
+        for serializer in (self.json_serializer, self.toml_serializer,
+                           self.yaml_serializer, self.pickle_serializer):
+            loaded = serializer.loads(serializer.dumps(obj))
+            self.assertEqual(loaded, expected)
+            self.assertIsInstance(loaded["ints"], tuple)
+            self.assertIsInstance(loaded["array"], array.array)
+        self.assertIn('"numarray"', self.json_serializer.dumps(obj["floats"]))
+
+    def test_code_objects(self):
+        for serializer in (self.json_serializer, self.toml_serializer,
+                           self.yaml_serializer, self.pickle_serializer):
+            dumped = serializer.dumps(fact)
+            first, second = serializer.loads(dumped), serializer.loads(dumped)
+            self.assertIs(first.__code__, second.__code__)
+            self.assertEqual(first(6), expected_fact_ans)
+
+            portable = type(serializer)(portable_code=True)
+            portable_dumped = portable.dumps(fact)
+            trusting = type(serializer)(trust_foreign_bytecode=True)
+            code_tag = codeobj.CODE_TAG
+            # as if it was written by another build of this python version
+            codeobj.CODE_TAG = "other:" + code_tag.rpartition(":")[2]
+            try:
+                with self.assertRaises(ValueError):
+                    serializer.loads(dumped)
+                self.assertEqual(portable.loads(portable_dumped)(6),
+                                 expected_fact_ans)
+                # and by another python version, with other bytecode
+                codeobj.CODE_TAG = "other:00000000"
+                with self.assertRaises(ValueError):
+                    portable.loads(portable_dumped)
+                func = trusting.loads(portable_dumped)
+            finally:
+                codeobj.CODE_TAG = code_tag
+            self.assertEqual(func(6), expected_fact_ans)
+            self.assertEqual(func.__code__.co_code, fact.__code__.co_code)
+
+        # nested code objects are written once, not again at every level
+        def outer():
+            def middle():
+                def inner():
+                    return 1
+                return inner
+            return middle
+        code = outer.__code__
+        self.assertNotIn("co_fields", codeobj.code_to_dict(code))
+        fields = codeobj.code_to_dict(code, portable=True)
+        self.assertNotIn("co_marshal", fields)
+        self.assertIs(fields["co_fields"]["co_consts"][1],
+                      code.co_consts[1])
+
+    def test_globals_by_ref(self):
+        factory = Packer()
+        for ser_type in ("json", "toml", "yaml", "pickle"):
+            embedding = factory.create_serializer(ser_type)
+            serializer = type(embedding)(globals_by_ref=True)
+            dumped = serializer.dumps(make_a_fact)
+            self.assertLess(len(dumped) * 2, len(embedding.dumps(make_a_fact)))
+
+            func = serializer.loads(dumped)
+            self.assertIs(func.__globals__["A"], A)
+            self.assertIs(func.__globals__["fact"], fact)
+            self.assertEqual(func(6), 12 + expected_fact_ans)
+
+            cls = serializer.loads(serializer.dumps(B))
+            self.assertEqual(cls.__bases__, (A,))
+            self.assertEqual(cls.cmeth(6), expected_fact_ans)
+
+    def test_serializer_pool(self):
+        pool = SerializerPool("toml")
+        serializers, results = [], []
+
+        def work():
+            serializers.append(pool.get())
+            for _ in range(20):
+                results.append(pool.loads(pool.dumps(dct)))
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(map(id, serializers))), 4)
+        self.assertEqual(results, [dct] * 80)
+        self.assertIs(pool.get(), pool.get())
+
+        async def roundtrip():
+            return await pool.aloads(await pool.adumps(iterable_obj))
+
+        self.assertEqual(asyncio.run(roundtrip()), iterable_obj)
+        self.assertRaises(NameError, SerializerPool, "xml")
+
+    def test_async_files(self):
+        async def roundtrip(serializer, fname):
+            await serializer.adump(dct, fname)
+            return await serializer.aload(fname)
+
+        for serializer, fname in ((self.json_serializer, filepath_j),
+                                  (self.toml_serializer, filepath_t),
+                                  (self.yaml_serializer, filepath_y),
+                                  (self.pickle_serializer, filepath_p),
+                                  (self.json_serializer, filepath_j + ".gz")):
+            self.assertEqual(asyncio.run(roundtrip(serializer, fname)), dct)
+        self.assertEqual(self.json_serializer.load(filepath_j), dct)
+        self.assertRaises(AttributeError, asyncio.run,
+                          self.json_serializer.adump(dct, filepath_t))
+
+        # pickle and yaml parse the file as they read it, a document too
+        # deep for yaml.load is read again from the start
+        depth = 600
+        lst, dct_ = self._nested(depth)
+        for serializer, fname in ((YamlSerializer(use_libyaml=False),
+                                   filepath_y),
+                                  (self.yaml_serializer, filepath_y + ".bz2"),
+                                  (self.pickle_serializer, filepath_p + ".gz")):
+            serializer.dump([lst, dct_], fname)
+            loaded = asyncio.run(serializer.aload(fname))
+            self._assert_nested(loaded[0], loaded[1], depth)
+
+    def test_yaml_loaders(self):
+        pure = YamlSerializer(use_libyaml=False)
+        for serializer in (self.yaml_serializer, pure):
+            self.assertEqual(serializer.loads(serializer.dumps(dct)), dct)
+            # written by yaml.dump() with the full dumper
+            self.assertEqual(
+                serializer.loads(yaml.dump([(1, 2), frozenset({3}), {4}])),
+                [(1, 2), frozenset({3}), {4}])
+            self.assertRaises(yaml.constructor.ConstructorError,
+                              serializer.loads,
+                              "!!python/object/apply:os.getcwd []")
+            self.assertEqual(
+                serializer.loads("a: &a {x: 1, y: 2}\n"
+                                 + "b: {<<: [*a, {z: 3}], y: 0}\n"),
+                {"a": {"x": 1, "y": 2}, "b": {"x": 1, "y": 0, "z": 3}})
+        self.assertEqual(self.yaml_serializer.dumps(iterable_obj),
+                         pure.dumps(iterable_obj))
+
+    def test_pickle_buffers(self):
+        obj = MyClass()
+        obj.payload = bytes(range(256)) * 4096
+        obj.small = b"small"
+        loaded = self.pickle_serializer.loads(
+            self.pickle_serializer.dumps(obj))
+        self.assertEqual((loaded.payload, loaded.small),
+                         (obj.payload, obj.small))
+
+        buffers = []
+        dumped = self.pickle_serializer.dumps(
+            obj, buffer_callback=buffers.append)
+        self.assertEqual(len(buffers), 1)
+        self.assertLess(len(dumped), len(obj.payload))
+        raw = buffers[0].raw()
+        loaded = self.pickle_serializer.loads(dumped, buffers=[raw])
+        self.assertIs(loaded.payload, raw)  # not copied
+        self.assertEqual(loaded.small, obj.small)
+        self.assertEqual(loaded.d.check_prop2(), obj.d.prop2)
+
+    def test_toml_streaming(self):
+        chunks = list(self.toml_serializer._iterdumps(myclass_obj))
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks),
+                         self.toml_serializer.dumps(myclass_obj))
+        self.toml_serializer.dump(dct, filepath_t)
+        with open(filepath_t) as fhandler:
+            self.assertEqual(fhandler.read(), self.toml_serializer.dumps(dct))
+
+        # nothing of an abandoned document leaks into the next one
+        expected = self.toml_serializer.dumps({"x": 1})
+        chunks = self.toml_serializer._iterdumps(dct)
+        next(chunks)
+        self.assertEqual(self.toml_serializer.dumps({"x": 1}), expected)
+        chunks.close()
+        self.assertEqual(self.toml_serializer.dumps({"x": 1}), expected)
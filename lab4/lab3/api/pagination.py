@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PostCursorPagination(CursorPagination):
+    # newest first, backed by the post_created_id_idx index
+    ordering = ('-created_date', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class UserCursorPagination(CursorPagination):
+    ordering = ('id',)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class SearchPagination(PageNumberPagination):
+    # search results are ordered by rank, which cursors can't follow
+    page_size_query_param = 'page_size'
+    max_page_size = 100
@@ -1,16 +1,44 @@
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 from django.contrib.auth.models import User
+from blog.images import srcsets
 from blog.models import Post
 
 
-class PostSerializer(serializers.ModelSerializer):
+def requested_fields(request):
+    # ?fields=id,title -> {'id', 'title'}, None when all fields are wanted
+    if request is None or request.method not in permissions.SAFE_METHODS:
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()}
+
+
+class SparseFieldsMixin:
+    # drops the fields that weren't asked for with ?fields=
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = requested_fields(self.context.get('request'))
+        if fields is not None:
+            for name in set(self.fields) - fields:
+                self.fields.pop(name)
+
+
+class PostSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     author = serializers.ReadOnlyField(source='author.username')
+    pic_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Post
-        fields = ['id','author', 'title', 'text', 'pic']
+        fields = ['id','author', 'title', 'text', 'pic', 'pic_srcset']
+
+    def get_pic_srcset(self, post):
+        # {'webp': 'url 125w, ...', 'jpeg': ...} once the thumbnails
+        # are made, absolute urls like the ones of pic
+        request = self.context.get('request')
+        return srcsets(post, request.build_absolute_uri if request else None)
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username']
@@ -1,3 +1,106 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from blog.models import Post
+from blog.tests import QueryCountMixin
+
+
+class PostListApiTests(QueryCountMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        now = timezone.now()
+        cls.posts = []
+        for i in range(7):
+            post = Post.objects.create(author=cls.author, title=f'post {i}',
+                                       text='secret text')
+            # pairs of posts share a created_date, so ids break the ties
+            Post.objects.filter(pk=post.pk).update(
+                created_date=now - timedelta(minutes=i // 2))
+            cls.posts.append(post)
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_pages(self):
+        pages = [self.get_json('/api/posts/?page_size=3')]
+        self.assertIsNone(pages[0]['previous'])
+        while pages[-1]['next']:
+            pages.append(self.get_json(pages[-1]['next']))
+        self.assertEqual([len(page['results']) for page in pages], [3, 3, 1])
+        ids = [post['id'] for page in pages for post in page['results']]
+        self.assertEqual(
+            ids,
+            list(Post.objects.order_by('-created_date', '-id')
+                 .values_list('id', flat=True)))
+
+        back = self.get_json(pages[-1]['previous'])
+        self.assertEqual(back['results'], pages[1]['results'])
+
+    def test_no_offset(self):
+        # DRF only skips with OFFSET over created_date ties cut by the
+        # page boundary, pages of 2 don't cut the pairs
+        url = self.get_json('/api/posts/?page_size=2')['next']
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json(url)
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_page_size(self):
+        data = self.get_json('/api/posts/?page_size=5')
+        self.assertEqual(len(data['results']), 5)
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json('/api/posts/?fields=id,title')
+        self.assertEqual(set(data['results'][0]), {'id', 'title'})
+        self.assertFalse(any('"text"' in query['sql'] for query in queries))
+
+    def test_sparse_related_field(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.get_json('/api/posts/?fields=id,author')
+        self.assertEqual(data['results'][0]['author'], 'author')
+        # the validators and the posts with their authors
+        self.assertEqual(len(queries), 2)
+        self.assertFalse(any('"text"' in query['sql'] for query in queries))
+
+    def test_sparse_detail(self):
+        post = self.posts[0]
+        data = self.get_json(f'/api/posts/{post.pk}/?fields=title')
+        self.assertEqual(data, {'title': post.title})
+
+    def test_users(self):
+        data = self.get_json('/api/users/?fields=username')
+        self.assertEqual(data['results'], [{'username': 'author'}])
+
+    def test_query_count(self):
+        # validators, posts with their authors, however many there are
+        self.assertViewQueries(2, '/api/posts/')
+        self.assertViewQueries(2, f'/api/posts/{self.posts[0].pk}/')
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/posts/')
+        etag, last_modified = response['ETag'], response['Last-Modified']
+        self.assertEqual(
+            self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(
+            '/api/posts/', HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        self.posts[0].delete()
+        self.assertEqual(
+            self.client.get('/api/posts/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
 
-# Create your tests here.
+    def test_conditional_get_detail(self):
+        url = f'/api/posts/{self.posts[1].pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.posts[1].text = 'changed'
+        self.posts[1].save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.assertEqual(self.client.get('/api/posts/1000/').status_code, 404)
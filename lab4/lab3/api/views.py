@@ -1,29 +1,119 @@
 from rest_framework import generics, permissions
 from django.contrib.auth.models import User
+from django.db.models import Count, Max
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from blog.models import Post
-from .serializers import PostSerializer, UserSerializer
+from blog.search import search_posts
+from .pagination import PostCursorPagination, SearchPagination, UserCursorPagination
+from .serializers import PostSerializer, UserSerializer, requested_fields
 from .permissions import IsAuthorOrReadOnly
 
 
-class PostList(generics.ListCreateAPIView):
-    queryset = Post.objects.all()
+class SparseFieldsViewMixin:
+    # With ?fields=, only the columns behind the requested serializer
+    # fields (plus the pk and the pagination ordering) are loaded.
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = requested_fields(self.request)
+        if fields is None:
+            return queryset
+
+        serializer_fields = self.get_serializer_class()().fields
+        only = {'pk'}
+        related = set()
+        for name in fields & set(serializer_fields):
+            source = serializer_fields[name].source
+            if source == '*':
+                return queryset
+            parts = source.split('.')
+            if len(parts) > 1:
+                related.add(parts[0])
+                only.add(parts[0])
+            only.add('__'.join(parts))
+
+        ordering = getattr(self.paginator, 'ordering', ())
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        only.update(field.lstrip('-') for field in ordering)
+
+        # joins of the full queryset are dropped, a deferred relation
+        # can't be followed by select_related
+        queryset = queryset.select_related(None).only(*only)
+        if related:
+            queryset = queryset.select_related(*related)
+        return queryset
+
+
+# ETag/Last-Modified of the post endpoints, from updated_at. The list
+# counts the posts too, deleting one doesn't move the latest updated_at.
+
+def _posts_state(request):
+    if not hasattr(request, '_posts_state'):
+        request._posts_state = Post.objects.aggregate(
+            count=Count('id'), updated=Max('updated_at'))
+    return request._posts_state
+
+def post_list_last_modified(request, *args, **kwargs):
+    return _posts_state(request)['updated']
+
+def post_list_etag(request, *args, **kwargs):
+    state = _posts_state(request)
+    timestamp = state['updated'].timestamp() if state['updated'] else 0
+    return f"{state['count']}-{timestamp}"
+
+def post_last_modified(request, pk):
+    if not hasattr(request, '_post_updated_at'):
+        request._post_updated_at = (
+            Post.objects.filter(pk=pk).values_list('updated_at', flat=True).first())
+    return request._post_updated_at
+
+def post_etag(request, pk):
+    updated_at = post_last_modified(request, pk)
+    return str(updated_at.timestamp()) if updated_at else None
+
+
+@method_decorator(condition(etag_func=post_list_etag,
+                            last_modified_func=post_list_last_modified), name='get')
+class PostList(SparseFieldsViewMixin, generics.ListCreateAPIView):
+    queryset = Post.objects.select_related('author')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = PostCursorPagination
+
+    def search_query(self):
+        return self.request.query_params.get('search', '').strip()
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            self._paginator = (SearchPagination() if self.search_query()
+                               else self.pagination_class())
+        return self._paginator
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.search_query():
+            queryset = search_posts(queryset, self.search_query())
+        return queryset
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
-class PostDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Post.objects.all()
+@method_decorator(condition(etag_func=post_etag,
+                            last_modified_func=post_last_modified), name='get')
+class PostDetail(SparseFieldsViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    queryset = Post.objects.select_related('author')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly,
                           IsAuthorOrReadOnly]
 
-class UserList(generics.ListAPIView):
+class UserList(SparseFieldsViewMixin, generics.ListAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    pagination_class = UserCursorPagination
 
 
-class UserDetail(generics.RetrieveAPIView):
+class UserDetail(SparseFieldsViewMixin, generics.RetrieveAPIView):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import AdditionalUserFeatures, Category, Post
+from .models import AdditionalUserFeatures, AuditEvent, Category, Post
 
 admin.site.register(Post)
 admin.site.register(AdditionalUserFeatures)
-admin.site.register(Category)
\ No newline at end of file
+admin.site.register(Category)
+admin.site.register(AuditEvent)
@@ -0,0 +1,91 @@
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .models import AuditEvent
+
+log = logging.getLogger(__name__)
+
+
+# Audit log of what users do with posts. Views only put the event on a
+# bounded queue, a daemon thread saves the events in batches with
+# bulk_create and passes them on to the logger, so neither the database
+# write nor the log handlers are on the request path. When the writer
+# can't keep up the queue fills and new events are dropped (and
+# counted) instead of slowing requests down.
+
+class AuditLog:
+    def __init__(self, maxsize=1000, batch_size=100):
+        self.queue = queue.Queue(maxsize)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def record(self, user, action, message):
+        event = AuditEvent(username=getattr(user, 'username', ''),
+                           action=action, message=message)
+        if settings.AUDIT_LOG_SYNC:
+            self.write([event])
+            return
+        self._start()
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+            log.warning('audit queue is full, dropped: %s', message)
+
+    def flush(self):
+        # waits until everything recorded so far is written
+        if self._thread is not None:
+            self.queue.join()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='audit-log',
+                                          daemon=True)
+                thread.start()
+                atexit.register(self.flush)
+                self._thread = thread
+
+    def _next_batch(self):
+        # waits for one event and takes whatever queued up behind it,
+        # batches grow with the load
+        batch = [self.queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.write(batch)
+            except Exception:
+                log.exception('lost %d audit events', len(batch))
+            finally:
+                close_old_connections()
+                for _ in batch:
+                    self.queue.task_done()
+
+    def write(self, events):
+        AuditEvent.objects.bulk_create(events)
+        for event in events:
+            log.info(event.message)
+
+
+audit_log = AuditLog(maxsize=settings.AUDIT_LOG_QUEUE_SIZE)
+
+
+def record(user, action, message):
+    audit_log.record(user, action, message)
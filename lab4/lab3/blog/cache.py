@@ -0,0 +1,50 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Rendered fragments of post_list and post_detail are cached with
+# {% cache %} and vary on a version number kept in the cache. The
+# signals in blog/signals.py replace the version of a post when it (or
+# one of its categories) changes and the version of the list when any
+# post does, so stale fragments are never looked up again and simply
+# expire. Versions are timestamps rather than counters: a version
+# evicted from the cache comes back as a new value instead of one an
+# old fragment was stored under.
+
+POST_LIST_KEY = 'blog:post_list:version'
+POST_KEY = 'blog:post:{}:version'
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def post_list_version():
+    return cache.get_or_set(POST_LIST_KEY, _new_version, settings.BLOG_CACHE_TIMEOUT)
+
+
+def post_version(pk):
+    return cache.get_or_set(POST_KEY.format(pk), _new_version, settings.BLOG_CACHE_TIMEOUT)
+
+
+def post_list_cached(name, func):
+    # func() cached for as long as the current post list version
+    key = f'blog:post_list:{post_list_version()}:{name}'
+    return cache.get_or_set(key, func, settings.BLOG_CACHE_TIMEOUT)
+
+
+def post_cached(pk, name, func):
+    key = f'blog:post:{pk}:{post_version(pk)}:{name}'
+    return cache.get_or_set(key, func, settings.BLOG_CACHE_TIMEOUT)
+
+
+def invalidate_post_list():
+    cache.set(POST_LIST_KEY, _new_version(), settings.BLOG_CACHE_TIMEOUT)
+
+
+def invalidate_posts(pks):
+    version = _new_version()
+    cache.set_many({POST_KEY.format(pk): version for pk in pks},
+                   settings.BLOG_CACHE_TIMEOUT)
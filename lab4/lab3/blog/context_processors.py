@@ -0,0 +1,17 @@
+from .models import AdditionalUserFeatures
+
+
+def favourite_post(request):
+    # The heart in the navbar only needs the id of the favourite post,
+    # one values query instead of loading the features row and then
+    # the post through request.user.features.favourite_post.
+    if not request.user.is_authenticated:
+        return {'favourite_post_id': None}
+    if not hasattr(request, '_favourite_post_id'):
+        request._favourite_post_id = (
+            AdditionalUserFeatures.objects
+            .filter(user_id=request.user.pk)
+            .values_list('favourite_post_id', flat=True)
+            .first()
+        )
+    return {'favourite_post_id': request._favourite_post_id}
@@ -1,10 +1,17 @@
+from django import forms
 from django.db.models import fields
 from django.forms.models import ModelForm
 from django.contrib.auth.models import User
 
-from .models import Post
+from .models import Category, Post
 
 class PostForm(ModelForm):
+    # posted by the category buttons of post_edit.html as
+    # categories=<name>, validated with a single name__in query
+    categories = forms.ModelMultipleChoiceField(
+        queryset=Category.objects.all(), to_field_name='name', required=False,
+        widget=forms.MultipleHiddenInput)
+
     class Meta:
         model = Post
         fields = ('title', 'text', 'pic')
@@ -0,0 +1,168 @@
+import hashlib
+import io
+import logging
+import os
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .cache import invalidate_post_list, invalidate_posts
+from .models import Post
+
+log = logging.getLogger(__name__)
+
+
+# Square thumbnails of Post.pic in WebP and JPEG, stored next to the
+# original as <name>.<version>.<width>.<format> so nginx serves them
+# straight from mediafiles/. The version is a hash of the thumbnails:
+# nginx lets browsers keep media files for 30 days, remade thumbnails
+# that came out different (new WIDTHS, QUALITY, Pillow) get new urls.
+# The pictures are shown as 125px (post_list) and 500px (post_detail)
+# circles, these widths cover both at 1x and 2x. They are made by a
+# background thread after the post is saved; until they are there
+# (Post.thumbnails) the pages fall back to the original.
+
+WIDTHS = (125, 250, 500, 1000)
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+QUALITY = 80
+VERSION_LENGTH = 10
+
+
+def variant_name(name, width, fmt, version):
+    root, _ = os.path.splitext(name)
+    return f'{root}.{version}.{width}.{fmt}'
+
+
+def srcsets(post, build_url=None):
+    # {'webp': 'url 125w, ...', 'jpeg': ...}, None without thumbnails;
+    # build_url makes the urls absolute, e.g. request.build_absolute_uri
+    thumbnails = post.thumbnails
+    if not post.pic or thumbnails.get('name') != post.pic.name \
+            or 'version' not in thumbnails:
+        return None
+    srcsets = {}
+    for fmt in FORMATS:
+        candidates = []
+        for width in thumbnails['widths']:
+            url = default_storage.url(variant_name(
+                post.pic.name, width, fmt, thumbnails['version']))
+            if build_url is not None:
+                url = build_url(url)
+            candidates.append(f'{url} {width}w')
+        srcsets[fmt] = ', '.join(candidates)
+    return srcsets
+
+
+def _encode(image, fmt):
+    if fmt == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    data = io.BytesIO()
+    image.save(data, FORMATS[fmt], quality=QUALITY)
+    return data.getvalue()
+
+
+def make_thumbnails(name):
+    # writes the variants of the picture stored as name, returns the
+    # widths made and their version; widths above the picture's short
+    # side are skipped (except the smallest) rather than upscaled
+    with default_storage.open(name, 'rb') as fhandler:
+        image = ImageOps.exif_transpose(Image.open(fhandler))
+        image.load()
+    side = min(image.size)
+    widths = [width for width in WIDTHS if width <= side] or WIDTHS[:1]
+    variants = {}
+    digest = hashlib.sha256()
+    for width in widths:
+        thumbnail = ImageOps.fit(image, (width, width), Image.LANCZOS)
+        for fmt in FORMATS:
+            variants[width, fmt] = data = _encode(thumbnail, fmt)
+            digest.update(data)
+    version = digest.hexdigest()[:VERSION_LENGTH]
+    for (width, fmt), data in variants.items():
+        # the same version has the same content, rewriting it is safe
+        target = variant_name(name, width, fmt, version)
+        default_storage.delete(target)
+        default_storage.save(target, ContentFile(data))
+    return widths, version
+
+
+def delete_thumbnails(name, thumbnails):
+    for width in thumbnails['widths']:
+        for fmt in FORMATS:
+            default_storage.delete(
+                variant_name(name, width, fmt, thumbnails['version']))
+
+
+def process_post(pk):
+    row = Post.objects.filter(pk=pk).values_list('pic', 'thumbnails').first()
+    if row is None or not row[0]:
+        return
+    name, old = row
+    widths, version = make_thumbnails(name)
+    # update() doesn't send post_save, the caches are invalidated here;
+    # the filter on pic skips posts whose picture changed meanwhile
+    updated = Post.objects.filter(pk=pk, pic=name).update(
+        thumbnails={'name': name, 'widths': widths, 'version': version},
+        updated_at=timezone.now())
+    invalidate_post_list()
+    invalidate_posts([pk])
+    # the files of the previous version of this picture's thumbnails
+    if updated and old.get('name') == name \
+            and old.get('version') not in (None, version):
+        delete_thumbnails(name, old)
+
+
+class ThumbnailWorker:
+    # one daemon thread working through the ids of saved posts; when
+    # the queue is full the post keeps its original picture until
+    # `manage.py make_thumbnails` is run
+    def __init__(self, maxsize=100):
+        self.queue = queue.Queue(maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, pk):
+        if settings.THUMBNAILS_SYNC:
+            process_post(pk)
+            return
+        self._start()
+        try:
+            self.queue.put_nowait(pk)
+        except queue.Full:
+            log.warning('thumbnail queue is full, skipped post %s', pk)
+
+    def join(self):
+        if self._thread is not None:
+            self.queue.join()
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name='thumbnails',
+                                          daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        while True:
+            pk = self.queue.get()
+            try:
+                process_post(pk)
+            except Exception:
+                log.exception('no thumbnails for post %s', pk)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+
+worker = ThumbnailWorker()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import process_post
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Makes the missing thumbnails of post pictures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='remake the thumbnails that already exist too')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(pic='').exclude(pic__isnull=True)
+        made = 0
+        for pk, pic, thumbnails in posts.values_list('pk', 'pic', 'thumbnails'):
+            # thumbnails without a version are from before they had one
+            if options['all'] or thumbnails.get('name') != pic \
+                    or 'version' not in thumbnails:
+                process_post(pk)
+                made += 1
+        self.stdout.write(f'made thumbnails of {made} posts')
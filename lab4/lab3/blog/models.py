@@ -9,10 +9,20 @@ class Post(models.Model):
     text = models.TextField()
     created_date = models.DateTimeField(default=timezone.now)
     published_date = models.DateTimeField(blank=True, null=True)
+    # also moved by blog/signals.py when the categories change
+    updated_at = models.DateTimeField(auto_now=True)
     pic = models.ImageField(upload_to='blog/%Y/%m/%d', null=True, blank=True)
+    # {'name': <pic they were made of>, 'widths': [...]}, see blog/images.py
+    thumbnails = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['-created_date']
+        indexes = [
+            # keyset pagination of post_list, see blog/pagination.py
+            models.Index(fields=['-published_date', '-id'], name='post_published_id_idx'),
+            # cursor pagination of the API, see api/pagination.py
+            models.Index(fields=['-created_date', '-id'], name='post_created_id_idx'),
+        ]
 
     def publish(self):
         self.published_date = timezone.now()
@@ -21,6 +31,11 @@ class Post(models.Model):
     def __str__(self):
         return self.title
 
+    @property
+    def pic_srcsets(self):
+        from .images import srcsets
+        return srcsets(self)
+
 class AdditionalUserFeatures(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='features')
     favourite_post = models.OneToOneField(Post, on_delete=models.SET_NULL, null=True, blank=True)
@@ -30,7 +45,20 @@ class AdditionalUserFeatures(models.Model):
 
 class Category(models.Model):
     posts = models.ManyToManyField(Post, related_name='categories', blank=True)
-    name = models.CharField(max_length=50, null=False, blank=False)
+    name = models.CharField(max_length=50, null=False, blank=False, unique=True)
 
     def __str__(self):
         return self.name
+
+class AuditEvent(models.Model):
+    created_date = models.DateTimeField(default=timezone.now)
+    # kept as text, the events outlive deleted users and posts
+    username = models.CharField(max_length=150, blank=True)
+    action = models.CharField(max_length=20)
+    message = models.TextField()
+
+    class Meta:
+        ordering = ['-created_date']
+
+    def __str__(self):
+        return self.message
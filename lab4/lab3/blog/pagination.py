@@ -0,0 +1,99 @@
+import base64
+import binascii
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+
+# Keyset (a.k.a. seek) pagination over posts ordered by
+# (published_date, id) descending. A page is fetched with a WHERE on the
+# last/first row of the neighbouring page instead of OFFSET, so every
+# page costs the same no matter how deep it is. Uses the
+# post_published_id_idx index.
+
+def encode_cursor(post):
+    raw = f'{post.published_date.isoformat()}|{post.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        published_date, pk = raw.rsplit('|', 1)
+        published_date = parse_datetime(published_date)
+        pk = int(pk)
+    except (binascii.Error, UnicodeError, ValueError):
+        return None
+    if published_date is None:
+        return None
+    return published_date, pk
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def page_cursor(params):
+    # params are the GET parameters: ?after=<cursor> gives the page of
+    # older posts, ?before=<cursor> the page of newer ones. Returns the
+    # decoded cursors, at most one of them is set; a broken cursor gives
+    # the first page.
+    after = decode_cursor(params.get('after', ''))
+    before = decode_cursor(params.get('before', '')) if after is None else None
+    return after, before
+
+
+def page_cache_key(params):
+    # the page as a {% cache %} key: the decoded cursor it is read from,
+    # so the same page always has the same key and junk in the query
+    # string doesn't make new ones. None for a broken cursor, that page
+    # isn't cached.
+    after, before = page_cursor(params)
+    for name, cursor in (('after', after), ('before', before)):
+        if cursor is not None:
+            published_date, pk = cursor
+            if timezone.is_aware(published_date):
+                published_date = published_date.astimezone(timezone.utc)
+            return f'{name}:{published_date.isoformat()}|{pk}'
+    if params.get('after') or params.get('before'):
+        return None
+    return 'first'
+
+
+def keyset_paginate(queryset, params, per_page):
+    # see page_cursor() for params
+    after, before = page_cursor(params)
+
+    if before is not None:
+        published_date, pk = before
+        rows = list(queryset.filter(
+            Q(published_date__gt=published_date)
+            | Q(published_date=published_date, pk__gt=pk)
+        ).order_by('published_date', 'pk')[:per_page + 1])
+        has_newer = len(rows) > per_page
+        items = rows[:per_page][::-1]
+        has_older = True
+    else:
+        if after is not None:
+            published_date, pk = after
+            queryset = queryset.filter(
+                Q(published_date__lt=published_date)
+                | Q(published_date=published_date, pk__lt=pk)
+            )
+        rows = list(queryset.order_by('-published_date', '-pk')[:per_page + 1])
+        has_older = len(rows) > per_page
+        items = rows[:per_page]
+        has_newer = after is not None
+
+    return KeysetPage(
+        items,
+        next_cursor=encode_cursor(items[-1]) if items and has_older else None,
+        prev_cursor=encode_cursor(items[0]) if items and has_newer else None,
+    )
@@ -0,0 +1,93 @@
+from django.db import connections, router
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+
+# Full-text search over post titles and texts. The index lives outside
+# of the models and is created by install() after migrate:
+#   - PostgreSQL: a GIN index on the tsvector expression below, the
+#     queries use the same expression so the planner picks the index;
+#   - SQLite: an FTS5 table with the posts as external content, kept in
+#     sync by triggers (so update() and raw SQL can't bypass it).
+# search_posts() filters a Post queryset and annotates it with a rank,
+# higher is better.
+
+FTS_TABLE = 'blog_post_fts'
+PG_INDEX = 'blog_post_search_idx'
+PG_VECTOR = "to_tsvector('simple', coalesce({0}title, '') || ' ' || coalesce({0}text, ''))"
+PG_QUERY = "websearch_to_tsquery('simple', %s)"
+
+
+def install(using='default', **kwargs):
+    # post_migrate receiver of BlogConfig
+    if not router.allow_migrate_model(using, Post):
+        return
+    connection = connections[using]
+    table = Post._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {PG_INDEX} '
+                           f'ON {table} USING gin (({PG_VECTOR.format("")}))')
+        elif connection.vendor == 'sqlite':
+            if FTS_TABLE in connection.introspection.table_names(cursor):
+                return
+            cursor.execute(f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+                           f"title, text, content='{table}', content_rowid='id')")
+            cursor.execute(f'''
+                CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {FTS_TABLE}(rowid, title, text)
+                    VALUES (new.id, new.title, new.text);
+                END''')
+            cursor.execute(f'''
+                CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text)
+                    VALUES ('delete', old.id, old.title, old.text);
+                END''')
+            cursor.execute(f'''
+                CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF title, text ON {table} BEGIN
+                    INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, text)
+                    VALUES ('delete', old.id, old.title, old.text);
+                    INSERT INTO {FTS_TABLE}(rowid, title, text)
+                    VALUES (new.id, new.title, new.text);
+                END''')
+            # posts written before the table existed
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def _fts_match(query):
+    # every word as a quoted string, FTS5 ANDs them; keeps the query
+    # syntax (NEAR, column filters, ...) out of user input
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+
+def search_posts(queryset, query):
+    connection = connections[queryset.db]
+    table = Post._meta.db_table
+    if connection.vendor == 'postgresql':
+        vector = PG_VECTOR.format(f'{table}.')
+        return queryset.filter(
+            RawSQL(f'{vector} @@ {PG_QUERY}', (query,), output_field=BooleanField())
+        ).annotate(
+            rank=RawSQL(f'ts_rank({vector}, {PG_QUERY})', (query,), output_field=FloatField())
+        ).order_by('-rank', '-pk')
+    if connection.vendor == 'sqlite':
+        match = _fts_match(query)
+        if not match:
+            return queryset.none()
+        return queryset.filter(
+            pk__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+                          (match,))
+        ).annotate(
+            # bm25() is lower for better matches
+            rank=RawSQL(f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+                        f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id',
+                        (match,), output_field=FloatField())
+        ).order_by('-rank', '-pk')
+    # no index for other databases, a plain scan without ranking
+    words = Q()
+    for word in query.split():
+        words &= Q(title__icontains=word) | Q(text__icontains=word)
+    return queryset.filter(words).annotate(
+        rank=Value(0.0, output_field=FloatField())).order_by('-pk')
@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import images
+from .cache import invalidate_post_list, invalidate_posts
+from .models import Category, Post
+
+
+def categories_changed(pks):
+    pks = list(pks)
+    Post.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+    invalidate_posts(pks)
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate_post_list()
+    invalidate_posts([instance.pk])
+
+
+@receiver(post_save, sender=Post)
+def make_thumbnails(sender, instance, **kwargs):
+    if instance.pic and instance.thumbnails.get('name') != instance.pic.name:
+        pk = instance.pk
+        transaction.on_commit(lambda: images.worker.submit(pk))
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # the posts of a deleted category are gone by post_delete
+    categories_changed(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Category.posts.through)
+def post_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # through category.posts instance is the category and pk_set holds
+    # post ids, through post.categories (reverse) instance is the post
+    if action in ('post_add', 'post_remove'):
+        categories_changed([instance.pk] if reverse else pk_set)
+    elif action == 'pre_clear':
+        categories_changed([instance.pk] if reverse
+                           else instance.posts.values_list('pk', flat=True))
@@ -1,3 +1,423 @@
-from django.test import TestCase
+import base64
+import io
+import shutil
+import tempfile
+import threading
+from datetime import timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .audit import AuditLog
+from .images import variant_name
+from .models import AdditionalUserFeatures, AuditEvent, Category, Post
+
+
+class QueryCountMixin:
+    # Fails when a view runs a different number of queries, an N+1
+    # shows up as soon as the fixture has more than one row.
+    def assertViewQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+
+@override_settings(POSTS_PER_PAGE=4)
+class PostListPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', password='secret')
+        now = timezone.now()
+        # pairs of posts share a published_date, so ids break the ties
+        cls.posts = [
+            Post.objects.create(author=author, title=f'post {i}', text='text',
+                                published_date=now - timedelta(minutes=i // 2))
+            for i in range(10)
+        ]
+        Post.objects.create(author=author, title='draft', text='text')
+        Post.objects.create(author=author, title='future', text='text',
+                            published_date=now + timedelta(days=1))
+
+    def get_page(self, query=''):
+        response = self.client.get(reverse('post_list') + query)
+        self.assertEqual(response.status_code, 200)
+        return response.context['page']
+
+    def test_pages_forward_and_back(self):
+        expected = sorted(self.posts, key=lambda p: (p.published_date, p.pk), reverse=True)
+        pages = [self.get_page()]
+        self.assertIsNone(pages[0].prev_cursor)
+        while pages[-1].next_cursor:
+            pages.append(self.get_page(f'?after={pages[-1].next_cursor}'))
+        self.assertEqual([len(page.items) for page in pages], [4, 4, 2])
+        self.assertEqual([post for page in pages for post in page], expected)
+
+        back = self.get_page(f'?before={pages[-1].prev_cursor}')
+        self.assertEqual(back.items, pages[1].items)
+        back = self.get_page(f'?before={back.prev_cursor}')
+        self.assertEqual(back.items, pages[0].items)
+        self.assertIsNone(back.prev_cursor)
+
+    def test_no_offset(self):
+        cursor = self.get_page().next_cursor
+        with CaptureQueriesContext(connection) as queries:
+            self.get_page(f'?after={cursor}')
+        self.assertFalse(any('OFFSET' in query['sql'] for query in queries))
+
+    def test_broken_cursor(self):
+        self.assertEqual(self.get_page('?after=garbage').items, self.get_page().items)
+
+
+class PostQueryCountTests(QueryCountMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.posts = [
+            Post.objects.create(author=cls.author, title=f'post {i}', text='text',
+                                published_date=timezone.now())
+            for i in range(5)
+        ]
+        cls.categories = [Category.objects.create(name=f'cat {i}') for i in range(5)]
+        cls.posts[0].categories.set(cls.categories)
+        AdditionalUserFeatures.objects.create(user=cls.author,
+                                              favourite_post=cls.posts[0])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.author)
+
+    def test_post_list(self):
+        # session, user, favourite post id, list state, posts
+        self.assertViewQueries(5, reverse('post_list'))
+
+    def test_post_detail(self):
+        # session, user, favourite post id, updated_at, post with author,
+        # categories
+        response = self.assertViewQueries(
+            6, reverse('post_detail', kwargs={'pk': self.posts[0].pk}))
+        self.assertContains(response, 'fas fa-heart')
+        self.assertContains(response, 'cat 4')
+
+    def test_post_edit(self):
+        # session, user, post with author, its categories, all categories,
+        # favourite post id
+        response = self.assertViewQueries(
+            6, reverse('post_edit', kwargs={'pk': self.posts[0].pk}))
+        self.assertContains(response, 'checked', count=len(self.categories))
+
+    def test_anonymous(self):
+        self.client.logout()
+        self.assertViewQueries(2, reverse('post_list'))
+
+
+@override_settings(AUDIT_LOG_SYNC=True)
+class PostCategoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.categories = [Category.objects.create(name=f'cat {i}') for i in range(8)]
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def create_post(self, title, names):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('post_new'), {
+                'title': title, 'text': 'text', 'categories': names})
+        self.assertEqual(response.status_code, 302)
+        post = Post.objects.get(title=title)
+        self.assertEqual(sorted(post.categories.values_list('name', flat=True)),
+                         sorted(names))
+        return len(queries)
+
+    def test_queries_dont_grow(self):
+        one = self.create_post('one', ['cat 0'])
+        many = self.create_post('many', [cat.name for cat in self.categories])
+        self.assertEqual(one, many)
+
+    def test_edit(self):
+        self.create_post('post', ['cat 0', 'cat 1'])
+        post = Post.objects.get(title='post')
+        response = self.client.post(reverse('post_edit', kwargs={'pk': post.pk}), {
+            'title': 'post', 'text': 'text', 'categories': ['cat 1', 'cat 2']})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(sorted(post.categories.values_list('name', flat=True)),
+                         ['cat 1', 'cat 2'])
+
+    def test_unknown_category(self):
+        response = self.client.post(reverse('post_new'), {
+            'title': 'post', 'text': 'text', 'categories': ['nope']})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Post.objects.exists())
+
+    def test_audit_event(self):
+        self.create_post('post', [])
+        event = AuditEvent.objects.get()
+        self.assertEqual((event.username, event.action), ('author', 'post_added'))
+
+
+class PageCacheTests(QueryCountMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.post = Post.objects.create(author=cls.author, title='post', text='text',
+                                       published_date=timezone.now())
+        cls.category = Category.objects.create(name='cat')
+        cls.post.categories.add(cls.category)
+
+    def setUp(self):
+        cache.clear()
+
+    def detail_url(self, post):
+        return reverse('post_detail', kwargs={'pk': post.pk})
+
+    def test_anonymous_hits_skip_the_database(self):
+        self.assertViewQueries(2, reverse('post_list'))
+        self.assertViewQueries(0, reverse('post_list'))
+        self.assertViewQueries(3, self.detail_url(self.post))
+        response = self.assertViewQueries(0, self.detail_url(self.post))
+        self.assertContains(response, 'cat')
+
+    def test_cursor_cache_key(self):
+        # the page of a valid cursor is cached however it is spelt,
+        # broken cursors aren't cached at all
+        utc = self.post.published_date.astimezone(timezone.utc)
+        urls = [reverse('post_list') + '?after=' + base64.urlsafe_b64encode(
+                    f'{date.isoformat()}|{self.post.pk}'.encode()).decode()
+                for date in (utc, utc.astimezone(dt_timezone(timedelta(hours=3))))]
+        self.assertViewQueries(2, urls[0])
+        self.assertViewQueries(0, urls[1])
+        # only the etag query is cached for those
+        for _ in range(2):
+            self.assertViewQueries(1, reverse('post_list') + '?after=junk')
+
+    def test_post_change(self):
+        self.client.get(reverse('post_list'))
+        self.client.get(self.detail_url(self.post))
+        self.post.title = 'renamed'
+        self.post.save()
+        self.assertContains(self.client.get(reverse('post_list')), 'renamed')
+        self.assertContains(self.client.get(self.detail_url(self.post)), 'renamed')
+
+    def test_new_and_deleted_post(self):
+        self.client.get(reverse('post_list'))
+        post = Post.objects.create(author=self.author, title='new', text='text',
+                                   published_date=timezone.now())
+        self.assertContains(self.client.get(reverse('post_list')), 'new')
+        url = self.detail_url(post)
+        self.client.get(url)
+        post.delete()
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_category_change(self):
+        self.client.get(self.detail_url(self.post))
+        self.category.name = 'renamed cat'
+        self.category.save()
+        self.assertContains(self.client.get(self.detail_url(self.post)), 'renamed cat')
+
+        other = Category.objects.create(name='other')
+        other.posts.add(self.post)
+        self.assertContains(self.client.get(self.detail_url(self.post)), 'other')
+        self.category.posts.clear()
+        self.assertNotContains(self.client.get(self.detail_url(self.post)), 'renamed cat')
+        self.post.categories.add(self.category)
+        self.assertContains(self.client.get(self.detail_url(self.post)), 'renamed cat')
+        self.post.categories.clear()
+        self.assertNotContains(self.client.get(self.detail_url(self.post)), 'renamed cat')
+        other.posts.add(self.post)
+        other.delete()
+        self.assertNotContains(self.client.get(self.detail_url(self.post)), 'other')
+
+    def test_conditional_get(self):
+        response = self.client.get(self.detail_url(self.post))
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        response = self.client.get(self.detail_url(self.post), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.category.posts.remove(self.post)
+        response = self.client.get(self.detail_url(self.post), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = self.client.get(reverse('post_list'))['ETag']
+        response = self.client.get(reverse('post_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('post_list'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_missing_post(self):
+        response = self.client.get(reverse('post_detail', kwargs={'pk': 1000}))
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(POSTS_PER_PAGE=2)
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='secret')
+        now = timezone.now()
+        cls.strong = Post.objects.create(author=cls.author, title='django tips',
+                                         text='django, django', published_date=now)
+        cls.weak = Post.objects.create(author=cls.author, title='notes',
+                                       text='python ' * 50 + 'django', published_date=now)
+        cls.other = Post.objects.create(author=cls.author, title='other',
+                                        text='flask "quoted" text', published_date=now)
+        Post.objects.create(author=cls.author, title='draft', text='django')
+
+    def search(self, query, page=1):
+        response = self.client.get(reverse('post_search'), {'q': query, 'page': page})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['page'].object_list)
+
+    def test_ranked(self):
+        self.assertEqual(self.search('django'), [self.strong, self.weak])
+        self.assertEqual(self.search('DJANGO tips'), [self.strong])
+        self.assertEqual(self.search('"quoted'), [self.other])
+        self.assertEqual(self.search('nothing'), [])
+        self.assertEqual(self.search(''), [])
+
+    def test_paginated(self):
+        Post.objects.create(author=self.author, title='more django', text='text',
+                            published_date=timezone.now())
+        self.assertEqual(len(self.search('django')), 2)
+        self.assertEqual(len(self.search('django', page=2)), 1)
+
+    def test_index_follows_changes(self):
+        self.other.text = 'now about django'
+        self.other.save()
+        self.assertIn(self.other, self.search('django'))
+        self.assertEqual(self.search('flask'), [])
+        Post.objects.filter(pk=self.strong.pk).update(title='renamed', text='gone')
+        self.assertEqual(self.search('tips'), [])
+        self.weak.delete()
+        self.assertEqual(self.search('python'), [])
+
+    def test_api(self):
+        data = self.client.get('/api/posts/', {'search': 'django'}).json()
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(data['results'][0]['id'], self.strong.pk)
+        data = self.client.get('/api/posts/', {'search': 'django', 'fields': 'id'}).json()
+        self.assertEqual(data['results'][0], {'id': self.strong.pk})
+
+
+def make_picture(name, size):
+    data = io.BytesIO()
+    Image.new('RGBA', size, (255, 0, 0, 128)).save(data, 'PNG')
+    return SimpleUploadedFile(name, data.getvalue(), content_type='image/png')
+
+
+@override_settings(THUMBNAILS_SYNC=True, AUDIT_LOG_SYNC=True)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.settings_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        shutil.rmtree(cls.media_root)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', password='secret')
+        self.client.force_login(self.author)
+
+    def create_post(self, size):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('post_new'), {
+                'title': 'post', 'text': 'text', 'pic': make_picture('pic.png', size)})
+        return Post.objects.get(title='post')
+
+    def test_thumbnails(self):
+        post = self.create_post((800, 600))
+        version = post.thumbnails['version']
+        self.assertEqual(post.thumbnails, {
+            'name': post.pic.name, 'widths': [125, 250, 500], 'version': version})
+        for width in (125, 250, 500):
+            for fmt in ('webp', 'jpeg'):
+                name = variant_name(post.pic.name, width, fmt, version)
+                with default_storage.open(name) as f:
+                    self.assertEqual(Image.open(f).size, (width, width))
+        self.assertFalse(default_storage.exists(
+            variant_name(post.pic.name, 1000, 'webp', version)))
+
+        srcset = default_storage.url(
+            variant_name(post.pic.name, 125, 'webp', version)) + ' 125w'
+        self.assertContains(self.client.get(reverse('post_list')), srcset)
+        self.assertContains(self.client.get(reverse('post_detail', kwargs={'pk': post.pk})),
+                            srcset)
+        data = self.client.get(f'/api/posts/{post.pk}/').json()
+        self.assertTrue(data['pic_srcset']['jpeg'].startswith('http://testserver/'))
+
+    def test_small_picture(self):
+        post = self.create_post((40, 40))
+        self.assertEqual(post.thumbnails['widths'], [125])
+
+    def test_command(self):
+        # outside captureOnCommitCallbacks the thumbnails aren't made
+        post = Post.objects.create(author=self.author, title='post', text='text',
+                                   pic=make_picture('pic.png', (300, 300)))
+        self.assertEqual(post.pic_srcsets, None)
+        call_command('make_thumbnails', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertIn('webp', post.pic_srcsets)
+
+    def test_remade_thumbnails_get_new_names(self):
+        # browsers keep media files, changed thumbnails must not reuse a url
+        post = self.create_post((300, 300))
+        old = variant_name(post.pic.name, 125, 'jpeg', post.thumbnails['version'])
+        call_command('make_thumbnails', '--all', stdout=io.StringIO())
+        post.refresh_from_db()
+        self.assertTrue(default_storage.exists(old))  # same content, same name
+        with mock.patch('blog.images.QUALITY', 50):
+            call_command('make_thumbnails', '--all', stdout=io.StringIO())
+        post.refresh_from_db()
+        new = variant_name(post.pic.name, 125, 'jpeg', post.thumbnails['version'])
+        self.assertNotEqual(new, old)
+        self.assertTrue(default_storage.exists(new))
+        self.assertFalse(default_storage.exists(old))
+
+
+class BlockingAuditLog(AuditLog):
+    # keeps the written batches, write() waits until release is set
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+        self.writing = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, events):
+        self.writing.set()
+        self.release.wait(5)
+        self.batches.append([event.message for event in events])
+
+
+class AuditLogTests(SimpleTestCase):
+    def test_batches_and_backpressure(self):
+        audit_log = BlockingAuditLog(maxsize=2)
+        audit_log.record(None, 'test', 'event 0')
+        self.assertTrue(audit_log.writing.wait(5))
+        with self.assertLogs('blog.audit', 'WARNING'):
+            for i in range(1, 5):
+                audit_log.record(None, 'test', f'event {i}')
+        self.assertEqual(audit_log.dropped, 2)
+
+        audit_log.release.set()
+        audit_log.flush()
+        self.assertEqual(audit_log.batches, [['event 0'], ['event 1', 'event 2']])
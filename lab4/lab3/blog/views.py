@@ -1,14 +1,20 @@
+from django.conf import settings
 from django.contrib.auth import logout, login
+from django.core.paginator import Paginator
+from django.db.models import Count, Max
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
 from .models import AdditionalUserFeatures, Category, Post
+from .cache import post_cached, post_list_cached, post_list_version, post_version
+from .context_processors import favourite_post
+from .pagination import keyset_paginate, page_cache_key
+from .search import search_posts
 from .forms import PostForm
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth.decorators import login_required
-from multiprocessing import Process
-import logging
-
-log = logging.getLogger(__name__)
+from . import audit
 
 def empty_page(request):
     return render(
@@ -17,14 +23,80 @@ def empty_page(request):
         {}
     )
 
+# ETag/Last-Modified of post_list and post_detail. They are computed
+# from updated_at and cached like the fragments. The ETag also carries
+# who is asking, the navbar and the edit buttons differ per user;
+# Django ignores If-Modified-Since when If-None-Match is sent.
+
+def _user_etag(request):
+    if not request.user.is_authenticated:
+        return 'anonymous'
+    return f"{request.user.pk}.{favourite_post(request)['favourite_post_id']}"
+
+def _post_list_state():
+    # a deleted post changes the count, a post coming due the dates
+    state = Post.objects.filter(published_date__lte=timezone.now()).aggregate(
+        count=Count('id'), updated=Max('updated_at'), published=Max('published_date'))
+    dates = [date for date in (state['updated'], state['published']) if date]
+    return state['count'], max(dates, default=None)
+
+def post_list_last_modified(request):
+    return post_list_cached('state', _post_list_state)[1]
+
+def post_list_etag(request):
+    count, last_modified = post_list_cached('state', _post_list_state)
+    timestamp = last_modified.timestamp() if last_modified else 0
+    return f'{count}-{timestamp}-{_user_etag(request)}'
+
+def post_detail_last_modified(request, pk):
+    return post_cached(pk, 'updated_at', lambda: (
+        Post.objects.filter(pk=pk).values_list('updated_at', flat=True).first()))
+
+def post_detail_etag(request, pk):
+    updated_at = post_detail_last_modified(request, pk)
+    if updated_at is None:
+        return None
+    return f'{updated_at.timestamp()}-{_user_etag(request)}'
+
+# The pages are rendered from lazy objects: when the {% cache %}
+# fragments of the template are there, the posts are never loaded.
+
+@condition(etag_func=post_list_etag, last_modified_func=post_list_last_modified)
 def post_list(request):
-    posts = Post.objects.filter(published_date__lte=timezone.now()).order_by('-published_date')
-    return render(request, 'blog/post_list.html', {'posts': posts})
+    posts = Post.objects.filter(published_date__lte=timezone.now())
+    page = SimpleLazyObject(
+        lambda: keyset_paginate(posts, request.GET, settings.POSTS_PER_PAGE))
+    return render(request, 'blog/post_list.html', {
+        'page': page,
+        'page_cache_key': page_cache_key(request.GET),
+        'cache_version': post_list_version(),
+        'cache_timeout': settings.BLOG_CACHE_TIMEOUT,
+    })
 
+@condition(etag_func=post_detail_etag, last_modified_func=post_detail_last_modified)
 def post_detail(request, pk):
-    post = get_object_or_404(Post, pk=pk)
-    can_edit = post.author.username == request.user.username
-    return render(request, 'blog/post_detail.html', {'post': post, 'can_edit': can_edit})
+    # a missing post is only noticed on a cache miss, its fragments are
+    # gone with the version replaced when it was deleted
+    post = SimpleLazyObject(lambda: get_object_or_404(
+        Post.objects.select_related('author').prefetch_related('categories'), pk=pk))
+    can_edit = (request.user.is_authenticated
+                and post.author.username == request.user.username)
+    return render(request, 'blog/post_detail.html', {
+        'post': post,
+        'can_edit': can_edit,
+        'post_id': pk,
+        'cache_version': post_version(pk),
+        'cache_timeout': settings.BLOG_CACHE_TIMEOUT,
+    })
+
+def post_search(request):
+    # ranked, so paged by number rather than by keyset
+    query = request.GET.get('q', '').strip()
+    posts = Post.objects.none()
+    if query:
+        posts = search_posts(Post.objects.filter(published_date__lte=timezone.now()), query)
+    page = Paginator(posts, settings.POSTS_PER_PAGE).get_page(request.GET.get('page'))
+    return render(request, 'blog/search_page.html', {'query': query, 'page': page})
 
 @login_required(login_url='login')
 def post_new(request):
@@ -35,18 +107,12 @@ def post_new(request):
         print("POST: ", request.POST)
         if form.is_valid():
             post = form.save(commit=False)
-            p = Process(target=log.info(f'{request.user} added a post {post.title}'))
             post.author = request.user
             post.published_date = timezone.now()
-
-            new_cats = []
-            catnames =  [cat.name for cat in Category.objects.all()]
-            for name in catnames:
-                if name in request.POST.keys():
-                    cat = Category.objects.get(name=name)
-                    new_cats.append(cat)
             post.save()
-            post.categories.set(new_cats)
+            post.categories.set(form.cleaned_data['categories'])
+            audit.record(request.user, 'post_added',
+                         f'{request.user} added a post {post.title}')
             return redirect('post_detail', pk=post.pk)
         else:
             title = request.POST['title'].strip()
@@ -64,7 +130,8 @@ def post_new(request):
 @login_required(login_url='login')
 def post_edit(request, pk):
     error_title = None
-    post = get_object_or_404(Post, pk=pk)
+    post = get_object_or_404(
+        Post.objects.select_related('author').prefetch_related('categories'), pk=pk)
     can_edit = post.author.username == request.user.username
     if not can_edit:
         return redirect('post_detail', pk=post.pk)
@@ -74,19 +141,13 @@ def post_edit(request, pk):
         if form.is_valid():
             print('Form is valid.')
             post = form.save(commit=False)
-            p = Process(target=log.info(f'{request.user} edited a post {post.title}'))
             post.author = request.user
             post.published_date = timezone.now()
-
-            new_cats = []
-            catnames =  [cat.name for cat in Category.objects.all()]
-            for name in catnames:
-                if name in request.POST.keys():
-                    cat = Category.objects.get(name=name)
-                    new_cats.append(cat)
-            post.categories.set(new_cats)
+            post.categories.set(form.cleaned_data['categories'])
 
             post.save()
+            audit.record(request.user, 'post_edited',
+                         f'{request.user} edited a post {post.title}')
             return redirect('post_detail', pk=post.pk)
         else:
             title = request.POST['title'].strip()
@@ -103,25 +164,26 @@ def post_edit(request, pk):
 
 @login_required(login_url='login')
 def post_delete(request, pk):
-    post = get_object_or_404(Post, pk=pk)
+    post = get_object_or_404(Post.objects.select_related('author'), pk=pk)
     can_edit = post.author.username == request.user.username
     if not can_edit:
         return redirect('post_detail', pk=post.pk)
     else:
         post.delete()
-        p = Process(target=log.info(f'{request.user} deleted a post {post.title}'))
+        audit.record(request.user, 'post_deleted',
+                     f'{request.user} deleted a post {post.title}')
         return redirect('post_list')
 
 def register_user(request):
     if request.method == 'POST':
         form = UserCreationForm(request.POST)
         if form.is_valid():
-            p = Process(target=log.info(f'{request.user} registred'))
             user = form.save(commit=False)
             features = AdditionalUserFeatures()
             features.user = user
             user.save()
             features.save()
+            audit.record(user, 'registered', f'{user} registred')
             return redirect('login')
     else:
         form = UserCreationForm()
@@ -158,14 +220,11 @@ def logout_user(request):
 
 @login_required(login_url='login')
 def post_toggle_favourite(request, pk):
-    fav_post = request.user.features.favourite_post
+    features = request.user.features
     this_post = get_object_or_404(Post.objects.filter(author=request.user), pk=pk)
-    if fav_post is not None:
-        if fav_post == this_post:
-            request.user.features.favourite_post = None
-        else:
-            request.user.features.favourite_post = this_post
+    if features.favourite_post_id == this_post.pk:
+        features.favourite_post = None
     else:
-        request.user.features.favourite_post = this_post
-    request.user.features.save()
+        features.favourite_post = this_post
+    features.save()
     return redirect('post_detail', pk=pk)
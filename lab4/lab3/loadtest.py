@@ -0,0 +1,134 @@
+"""Request latency with and without persistent/pooled connections.
+
+    python loadtest.py [-n 500] [--url /api/posts/]
+
+Every configuration runs in its own process and serves the requests
+through the WSGI handler, like gunicorn does, so connections are closed
+(or kept) at the end of each request as in production. The database is
+the one of the SQL_* environment variables; without SQL_ENGINE a
+throw-away SQLite database with a few posts stands in, where opening a
+connection is cheap and the differences are small. The pool is only
+measured on PostgreSQL.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+CONFIGURATIONS = [
+    ("new connection per request", {"SQL_CONN_MAX_AGE": "0"}),
+    ("persistent", {"SQL_CONN_MAX_AGE": "60", "SQL_CONN_HEALTH_CHECKS": "0"}),
+    ("persistent, health checks", {"SQL_CONN_MAX_AGE": "60", "SQL_CONN_HEALTH_CHECKS": "1"}),
+]
+POOL_CONFIGURATION = ("pool", {"SQL_CONN_MAX_AGE": "0", "SQL_POOL_SIZE": "2"})
+WARMUP = 20
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mysite.settings")
+    import django
+    django.setup()
+
+
+def seed():
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.utils import timezone
+    from blog.models import Post
+
+    call_command("migrate", run_syncdb=True, verbosity=0)
+    author = User.objects.create_user("loadtest")
+    for i in range(30):
+        Post.objects.create(author=author, title=f"post {i}", text="text " * 100,
+                            published_date=timezone.now())
+
+
+def request(application, url):
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": url, "QUERY_STRING": "",
+        "SCRIPT_NAME": "", "SERVER_NAME": "localhost", "SERVER_PORT": "80",
+        "HTTP_HOST": "localhost", "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr, "wsgi.multithread": False,
+        "wsgi.multiprocess": True, "wsgi.run_once": False,
+    }
+    statuses = []
+    response = application(environ, lambda status, headers: statuses.append(status))
+    try:
+        for _ in response:
+            pass
+    finally:
+        response.close()  # sends request_finished
+    if not statuses[0].startswith("200"):
+        raise RuntimeError(f"{url}: {statuses[0]}")
+
+
+def measure(url, n):
+    setup_django()
+    from django.core.wsgi import get_wsgi_application
+    application = get_wsgi_application()
+
+    for _ in range(WARMUP):
+        request(application, url)
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        request(application, url)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    print(json.dumps({
+        "mean": statistics.mean(latencies),
+        "p50": latencies[len(latencies) // 2],
+        "p95": latencies[int(len(latencies) * 0.95)],
+    }))
+
+
+def run(extra_env, *worker_args):
+    env = {**os.environ, **extra_env}
+    # whitenoise warns about a missing collectstatic on every start
+    result = subprocess.run([sys.executable, "-W", "ignore:No directory at",
+                             __file__, *worker_args], env=env,
+                            stdout=subprocess.PIPE, check=True, text=True)
+    return result.stdout
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", type=int, default=500, help="requests per configuration")
+    parser.add_argument("--url", default="/api/posts/")
+    parser.add_argument("--seed", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.seed:
+        return seed()
+    if args.measure:
+        return measure(args.url, args.n)
+
+    env = {"SECRET_KEY": os.environ.get("SECRET_KEY", "loadtest"),
+           "DJANGO_ALLOWED_HOSTS": os.environ.get("DJANGO_ALLOWED_HOSTS", "localhost")}
+    configurations = list(CONFIGURATIONS)
+    with tempfile.TemporaryDirectory() as directory:
+        if "SQL_ENGINE" not in os.environ:
+            env["SQL_DATABASE"] = os.path.join(directory, "db.sqlite3")
+            run(env, "--seed")
+        elif "postgresql" in os.environ["SQL_ENGINE"]:
+            configurations.append(POOL_CONFIGURATION)
+
+        print(f"{args.n} x GET {args.url}")
+        print(f"{'':28}{'mean':>10}{'p50':>10}{'p95':>10}")
+        for name, extra_env in configurations:
+            stats = json.loads(run({**env, **extra_env}, "--measure",
+                                   "-n", str(args.n), "--url", args.url))
+            print(f"{name:28}" + "".join(
+                f"{stats[key] * 1000:>8.2f}ms" for key in ("mean", "p50", "p95")))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+class HealthCheckMixin:
+    # CONN_HEALTH_CHECKS of Django 4.1 for 3.2: a persistent connection
+    # (CONN_MAX_AGE > 0) is checked with is_usable() before its first
+    # use in a request and replaced if the database dropped it in the
+    # meantime, instead of failing that request. The settings key has
+    # the same name, so these backends can go with the upgrade.
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def connect(self):
+        super().connect()
+        # a fresh connection needs no check
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # runs at the start and the end of every request
+        if self.connection is not None:
+            self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        if (self.connection is None or not self.health_check_enabled
+                or self.health_check_done or self.in_atomic_block):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
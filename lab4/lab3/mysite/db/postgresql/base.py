@@ -0,0 +1,80 @@
+import os
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions, extras, pool
+
+from ..health import HealthCheckMixin
+
+# In-process connection pools, one per database alias and process (the
+# gunicorn workers are forked, connections can't be shared with them).
+# With POOL_SIZE > 0 and CONN_MAX_AGE = 0 a request takes a connection
+# from the pool and gives it back at its end instead of opening a new
+# one. POOL_SIZE has to cover the threads of a worker, psycopg2 raises
+# PoolError rather than waiting when the pool is exhausted.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, size, conn_params):
+    key = (os.getpid(), alias)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = pool.ThreadedConnectionPool(0, size, **conn_params)
+        return _pools[key]
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE', 0)
+        if not size:
+            return None
+        return get_pool(self.alias, size, self.get_connection_params())
+
+    def _get_pooled_connection(self, connection_pool):
+        # connections that died in the pool are thrown away
+        while True:
+            connection = connection_pool.getconn()
+            if not connection.closed:
+                if not self.health_check_enabled:
+                    return connection
+                try:
+                    with connection.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    # autocommit is off here, the probe opened a
+                    # transaction and connect() can't set_autocommit()
+                    # inside one
+                    connection.rollback()
+                    return connection
+                except base.Database.Error:
+                    pass
+            connection_pool.putconn(connection, close=True)
+
+    def get_new_connection(self, conn_params):
+        connection_pool = self.pool
+        if connection_pool is None:
+            return super().get_new_connection(conn_params)
+        connection = self._get_pooled_connection(connection_pool)
+        # the rest of the base class' get_new_connection
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        connection_pool = self.pool
+        if connection_pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            broken = self.connection.closed
+            if not broken and (self.connection.get_transaction_status()
+                               != extensions.TRANSACTION_STATUS_IDLE):
+                self.connection.rollback()
+            connection_pool.putconn(self.connection, close=bool(broken))
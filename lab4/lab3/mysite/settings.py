@@ -70,6 +70,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'blog.context_processors.favourite_post',
             ],
         },
     },
@@ -105,9 +106,23 @@ DATABASES = {
         "PASSWORD": os.environ.get("SQL_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        # seconds a connection is kept between requests, 0 closes it
+        # after every request
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", 60)),
+        # ping a kept connection before it's used again, see mysite/db/health.py
+        "CONN_HEALTH_CHECKS": bool(int(os.environ.get("SQL_CONN_HEALTH_CHECKS", 1))),
+        # PostgreSQL only: connections of the in-process pool of
+        # mysite/db/postgresql, 0 turns it off
+        "POOL_SIZE": int(os.environ.get("SQL_POOL_SIZE", 0)),
     }
 }
 
+# the same backends with the health checks (and the pool) added
+DATABASES["default"]["ENGINE"] = {
+    "django.db.backends.postgresql": "mysite.db.postgresql",
+    "django.db.backends.sqlite3": "mysite.db.sqlite3",
+}.get(DATABASES["default"]["ENGINE"], DATABASES["default"]["ENGINE"])
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -152,6 +167,39 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 MEDIA_URL = "/mediafiles/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "mediafiles")
 
+# Posts on one page of the post list
+POSTS_PER_PAGE = int(os.environ.get("POSTS_PER_PAGE", 10))
+
+CACHES = {
+    'default': {
+        # local memory by default, CACHE_BACKEND/CACHE_LOCATION switch to
+        # e.g. django.core.cache.backends.filebased.FileBasedCache
+        'BACKEND': os.environ.get("CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get("CACHE_LOCATION", 'blog'),
+    }
+}
+
+# how long the fragments of post_list and post_detail are kept, it also
+# bounds how late a post with a future published_date shows up
+BLOG_CACHE_TIMEOUT = int(os.environ.get("BLOG_CACHE_TIMEOUT", 300))
+
+# make the thumbnails of post pictures in the request instead of the
+# background thread of blog/images.py
+THUMBNAILS_SYNC = False
+
+# events waiting for the audit log writer, see blog/audit.py
+AUDIT_LOG_QUEUE_SIZE = int(os.environ.get("AUDIT_LOG_QUEUE_SIZE", 1000))
+# write the events in the request instead, tests turn it on since the
+# writer thread can't see their transactions
+AUDIT_LOG_SYNC = False
+
+REST_FRAMEWORK = {
+    # page size of the API lists, clients may ask for up to 100 with ?page_size=
+    'PAGE_SIZE': int(os.environ.get("API_PAGE_SIZE", 20)),
+}
+# PAGE_SIZE is used by the cursor paginations set on the views
+SILENCED_SYSTEM_CHECKS = ['rest_framework.W001']
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,136 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from .db.sqlite3.base import DatabaseWrapper
+
+try:
+    import psycopg2
+except ImportError:  # in requirements.txt, but not needed with sqlite
+    psycopg2 = None
+
+
+class HealthCheckTests(SimpleTestCase):
+    def make_wrapper(self, health_checks):
+        # sqlite never closes in-memory databases
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_dict = {**connection.settings_dict,
+                         'NAME': os.path.join(directory.name, 'db.sqlite3'),
+                         'CONN_MAX_AGE': 60, 'CONN_HEALTH_CHECKS': health_checks}
+        wrapper = DatabaseWrapper(settings_dict)
+        self.addCleanup(wrapper.close)
+        self.checks = 0
+
+        def is_usable():
+            self.checks += 1
+            return False
+        wrapper.is_usable = is_usable
+        return wrapper
+
+    def test_dead_connection_is_replaced(self):
+        wrapper = self.make_wrapper(True)
+        wrapper.cursor()
+        first = wrapper.connection
+        wrapper.cursor()
+        self.assertEqual(self.checks, 0)
+
+        wrapper.close_if_unusable_or_obsolete()  # next request
+        wrapper.cursor()
+        wrapper.cursor()
+        self.assertEqual(self.checks, 1)
+        self.assertIsNot(wrapper.connection, first)
+
+    def test_disabled(self):
+        wrapper = self.make_wrapper(False)
+        wrapper.cursor()
+        first = wrapper.connection
+        wrapper.close_if_unusable_or_obsolete()
+        wrapper.cursor()
+        self.assertEqual(self.checks, 0)
+        self.assertIs(wrapper.connection, first)
+
+
+class FakeConnection:
+    # what the pool checkout uses of a psycopg2 connection, including
+    # its refusal to change autocommit inside a transaction
+    def __init__(self, closed=0, probe_fails=False):
+        self.closed = closed
+        self.probe_fails = probe_fails
+        self.in_transaction = False
+        self._autocommit = False
+
+    @property
+    def autocommit(self):
+        return self._autocommit
+
+    @autocommit.setter
+    def autocommit(self, value):
+        if self.in_transaction:
+            raise psycopg2.ProgrammingError(
+                'set_session cannot be used inside a transaction')
+        self._autocommit = value
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.in_transaction = False
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql):
+        if self.connection.probe_fails:
+            raise psycopg2.OperationalError('server closed the connection')
+        if not self.connection.autocommit:
+            self.connection.in_transaction = True
+
+
+@unittest.skipIf(psycopg2 is None, 'psycopg2 is not installed')
+class PoolCheckoutTests(SimpleTestCase):
+    def checkout(self, health_checks, *connections):
+        from .db.postgresql import base
+
+        pool_class = mock.patch.object(base.pool, 'ThreadedConnectionPool')
+        self.pool = pool_class.start().return_value
+        self.addCleanup(pool_class.stop)
+        self.addCleanup(base._pools.clear)
+        self.pool.getconn.side_effect = connections
+        wrapper = base.DatabaseWrapper({**connection.settings_dict, 'POOL_SIZE': 2,
+                                        'CONN_HEALTH_CHECKS': health_checks})
+        checked_out = wrapper._get_pooled_connection(wrapper.pool)
+        # what connect() does next
+        checked_out.autocommit = True
+        return checked_out
+
+    def test_fresh_connection(self):
+        fresh = FakeConnection()
+        self.assertIs(self.checkout(True, fresh), fresh)
+        self.pool.putconn.assert_not_called()
+
+    def test_closed_connection_is_dropped(self):
+        closed, fresh = FakeConnection(closed=2), FakeConnection()
+        self.assertIs(self.checkout(True, closed, fresh), fresh)
+        self.pool.putconn.assert_called_once_with(closed, close=True)
+
+    def test_failed_probe_is_dropped(self):
+        broken, fresh = FakeConnection(probe_fails=True), FakeConnection()
+        self.assertIs(self.checkout(True, broken, fresh), fresh)
+        self.pool.putconn.assert_called_once_with(broken, close=True)
+
+    def test_disabled(self):
+        broken = FakeConnection(probe_fails=True)
+        self.assertIs(self.checkout(False, broken), broken)